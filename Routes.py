@@ -2,6 +2,9 @@ import numpy as np
 import pandas as pd
 import random
 from math import isclose
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from tariff import defaultTariff
 
 def BothCentresOpen(filename):
     ''' Creates 2 arrays that seperate locations
@@ -24,9 +27,10 @@ def BothCentresOpen(filename):
     North distribution centre in second column and second row
     '''
 
-    # Import data and make array
-    Names = np.genfromtxt(filename, dtype = str, delimiter = ',', usecols = 0, skip_header = 1)
-    Distances = np.genfromtxt(filename, dtype = float, delimiter = ',', usecols = (1,2), skip_header = 1)
+    # Import data and make array, reading the file once
+    Data = pd.read_csv(filename)
+    Names = Data.iloc[:, 0].to_numpy(dtype = str)
+    Distances = Data.iloc[:, [1, 2]].to_numpy(dtype = float)
 
     North = []
     South = []
@@ -107,18 +111,223 @@ def getTravelTimes(stores,filepath):
     # Get travel times
     travelTimes = pd.read_csv(filepath, index_col=0)
 
-    # Make Dataframe of locations and travel times
-    for columns in travelTimes.columns: # Deleting columns not in stores set
-        if columns not in stores:
-            travelTimes = travelTimes.drop(labels = columns, axis = 1)
-            
+    # Make Dataframe of locations and travel times, keeping only the stores set
+    rows = [row for row in travelTimes.index if row in stores]
+    columns = [column for column in travelTimes.columns if column in stores]
+    travelTimes = travelTimes.loc[rows, columns]
 
-    for row in travelTimes.index: #Deleting rows not in stores set
-        if row not in stores:
-            travelTimes = travelTimes.drop(labels = row)
-            
     return travelTimes
 
+class TravelMatrix:
+    '''Travel durations and distances between locations stored as contiguous float arrays
+
+    Parameters
+    ----------
+    names: list
+        Names of the locations, in the order of the rows and columns of the arrays
+    durations: np.array
+        Square array of the travel times in seconds between the locations, durations[i,j] is the time
+        from location i to location j
+    distances: np.array (optional)
+        Square array of the travel distances in metres between the locations
+    orderCacheSize: int (optional)
+        The number of store sets whose quickest visit order is remembered by routeOrder
+
+    Notes
+    -----
+    A TravelMatrix returned by subset shares the arrays of the matrix it was taken from, only the names
+    it exposes change. Legs are looked up by array index through the name->index map in index.
+    Subsets also share the routeOrder cache, so each store set is only solved once per matrix.
+    '''
+
+    def __init__(self, names, durations, distances = None, positions = None, orderCache = None, orderCacheSize = 2**18):
+        self.durations = np.ascontiguousarray(durations, dtype = float)
+        self.distances = None if distances is None else np.ascontiguousarray(distances, dtype = float)
+        self.index = {name: i for i, name in enumerate(names)}
+
+        # positions of the exposed locations in the arrays
+        if positions is None:
+            positions = np.arange(len(names))
+        self.positions = np.asarray(positions, dtype = np.intp)
+        self.names = [names[i] for i in self.positions]
+
+        # quickest visit orders keyed by (distribution centre, frozenset of stores)
+        if orderCache is None:
+            orderCache = lru_cache(maxsize = orderCacheSize)(self.heldKarp)
+        self.orderCache = orderCache
+
+    def __getstate__(self):
+        # the order cache wraps a bound method so it is rebuilt rather than pickled
+        state = self.__dict__.copy()
+        state['orderCacheSize'] = self.orderCache.cache_info().maxsize
+        del state['orderCache']
+        return state
+
+    def __setstate__(self, state):
+        orderCacheSize = state.pop('orderCacheSize')
+        self.__dict__.update(state)
+        self.orderCache = lru_cache(maxsize = orderCacheSize)(self.heldKarp)
+
+    @classmethod
+    def fromDataFrame(cls, travelTimes):
+        '''Creates a TravelMatrix from a name-keyed dataframe of travel times such as from getTravelTimes
+        '''
+        travelTimes = travelTimes.loc[:, travelTimes.index]
+        return cls(list(travelTimes.index), travelTimes.to_numpy())
+
+    @classmethod
+    def fromFiles(cls, durationsFile, distancesFile = None):
+        '''Creates a TravelMatrix from the travel durations (and optionally distances) csv files
+
+        Parameters
+        ----------
+        durationsFile: str
+            Name of the file that contains the travel times between all locations
+        distancesFile: str (optional)
+            Name of the file that contains the travel distances between all locations
+        '''
+        durations = pd.read_csv(durationsFile, index_col = 0)
+        durations = durations.loc[:, durations.index]
+        distances = None
+        if distancesFile is not None:
+            distances = pd.read_csv(distancesFile, index_col = 0).loc[durations.index, durations.index].to_numpy()
+        return cls(list(durations.index), durations.to_numpy(), distances)
+
+    def __len__(self):
+        return len(self.names)
+
+    def subset(self, stores):
+        '''Returns a TravelMatrix that only exposes the given stores, in the order of this matrix
+
+        Parameters
+        ----------
+        stores: list or pd.Series
+            The names of the stores to keep (the index of a pd.Series is used, as in getTravelTimes)
+        '''
+        keep = set(stores.index if isinstance(stores, pd.Series) else stores)
+        positions = [i for i, name in zip(self.positions, self.names) if name in keep]
+        return TravelMatrix(list(self.index), self.durations, self.distances, positions, self.orderCache)
+
+    def indices(self, stores):
+        '''Returns the array positions of a list of stores'''
+        return np.array([self.index[store] for store in stores], dtype = np.intp)
+
+    def duration(self, store1, store2):
+        '''Returns the travel time in seconds from store1 to store2'''
+        return self.durations[self.index[store1], self.index[store2]]
+
+    def routeDuration(self, stores):
+        '''Returns the travel time in seconds of visiting the stores in order'''
+        route = self.indices(stores)
+        return self.durations[route[:-1], route[1:]].sum()
+
+    def routeOrder(self, distributionCenter, stores):
+        '''Returns the quickest order to visit a set of stores, solving each set only once
+
+        Parameters
+        ----------
+        distributionCenter: str
+            Name of the distribution center the route starts and ends at
+        stores: list
+            The stores to visit, in any order
+
+        Returns
+        -------
+        route: list
+            The ordered stores visited, starting and ending at the distribution centre
+        travelTime: float
+            The travel time of the route in seconds (not including unloading pallets)
+        '''
+        route, travelTime = self.orderCache(distributionCenter, frozenset(stores))
+        return list(route), travelTime
+
+    def heldKarp(self, distributionCenter, stores):
+        '''Finds the quickest order to visit a set of stores with the Held-Karp bitmask dynamic program
+
+        Parameters
+        ----------
+        distributionCenter: str
+            Name of the distribution center the route starts and ends at
+        stores: frozenset
+            The stores to visit
+
+        Returns
+        -------
+        route: tuple
+            The ordered stores visited, starting and ending at the distribution centre
+        travelTime: float
+            The travel time of the route in seconds (not including unloading pallets)
+
+        Notes
+        -----
+        Takes k^2 2^k steps for k stores, which is cheap for the at most 5 stores on a route.
+        '''
+        stores = sorted(stores, key = self.index.get)
+        k = len(stores)
+        locations = [self.index[distributionCenter]] + [self.index[store] for store in stores]
+        times = self.durations[np.ix_(locations, locations)].tolist()
+        if k == 0:
+            return (distributionCenter, distributionCenter), times[0][0]
+
+        # time[mask][j] is the quickest way to leave the depot, visit the stores in mask and end at store j
+        time = [[float('inf')]*k for mask in range(1 << k)]
+        previous = [[-1]*k for mask in range(1 << k)]
+        for j in range(k):
+            time[1 << j][j] = times[0][j + 1]
+
+        for mask in range(1, 1 << k):
+            for j in range(k):
+                if time[mask][j] == float('inf'):
+                    continue
+                for n in range(k):
+                    if mask & (1 << n):
+                        continue
+                    newTime = time[mask][j] + times[j + 1][n + 1]
+                    if newTime < time[mask | (1 << n)][n]:
+                        time[mask | (1 << n)][n] = newTime
+                        previous[mask | (1 << n)][n] = j
+
+        # close the route back to the depot and walk the best path backwards
+        mask = (1 << k) - 1
+        last = min(range(k), key = lambda j: time[mask][j] + times[j + 1][0])
+        travelTime = time[mask][last] + times[last + 1][0]
+        order = []
+        while last != -1:
+            order.append(stores[last])
+            mask, last = mask & ~(1 << last), previous[mask][last]
+
+        return (distributionCenter,) + tuple(reversed(order)) + (distributionCenter,), travelTime
+
+    def toDataFrame(self):
+        '''Returns the exposed travel times as a name-keyed dataframe like getTravelTimes'''
+        return pd.DataFrame(self.durations[np.ix_(self.positions, self.positions)], index = self.names, columns = self.names)
+
+def asTravelMatrix(travelTimes):
+    '''Returns travelTimes as a TravelMatrix, converting it if it is a dataframe of travel times
+    '''
+    if isinstance(travelTimes, TravelMatrix):
+        return travelTimes
+    return TravelMatrix.fromDataFrame(travelTimes)
+
+def getTravelMatrix(stores, durationsFile, distancesFile = None):
+    '''Gets travel times (and optionally distances) between stores as a TravelMatrix
+
+        Parameters
+        ---------
+        stores: pd.Series
+            A series of stores (includes distribution centers)
+        durationsFile: str
+            Name of the file that contains the travel times
+        distancesFile: str (optional)
+            Name of the file that contains the travel distances
+
+        Returns
+        -------
+        travelMatrix: TravelMatrix
+            The travel times between the stores
+    '''
+    return TravelMatrix.fromFiles(durationsFile, distancesFile).subset(stores)
+
 def RouteLength(stores, storeTravelTimes,pallets, nextStore = None):
     '''Calculates the total route length between the stores 
 
@@ -126,8 +335,8 @@ def RouteLength(stores, storeTravelTimes,pallets, nextStore = None):
         ----------
         stores: list
             A list of the stores to be visited (includes distribution centres)
-        storeTravelTimes: pd.dataframe
-            Dataframe containing the travel times between all the stores and distribution centres
+        storeTravelTimes: pd.dataframe or TravelMatrix
+            Travel times between all the stores and distribution centres
         pallets: int
             The number of pallets
         nextStore: str (optional)
@@ -138,22 +347,148 @@ def RouteLength(stores, storeTravelTimes,pallets, nextStore = None):
         travelTime: double
             The total time to visits all the stores
     '''
-    travelTime = 0
     if (nextStore != None):
-        stores.insert(-1, nextStore)
-    
-    for store1,store2 in zip(stores[0:],stores[1:]):
-        travelTime += storeTravelTimes.at[store1,store2]
+        stores = stores[:-1] + [nextStore] + stores[-1:]
 
-    travelTime  += pallets*600
+    if isinstance(storeTravelTimes, TravelMatrix):
+        travelTime = storeTravelTimes.routeDuration(stores)
+    else:
+        travelTime = 0
+        for store1,store2 in zip(stores[0:],stores[1:]):
+            travelTime += storeTravelTimes.at[store1,store2]
 
-    if (nextStore != None):
-        del stores[-2]
+    travelTime  += pallets*600
   
     return travelTime
 
-def FindStoreSets(distributionCenter, storeDemandEstimates, storeTravelTimes, routeName):
+class RoutePool:
+    '''Collects generated routes in flat buffers, keeping only the cheapest ordering of each store set
+
+    Notes
+    -----
+    Routes are made canonical by their distribution centre and the set of stores they visit. Adding
+    a route whose store set is already in the pool only replaces the stored ordering if it is cheaper,
+    so the pool holds one route per store set however many times it is drawn. The incidence matrix
+    is only built once all the routes have been added.
+    '''
+
+    def __init__(self):
+        self.locations = []
+        self.locationIndex = {}
+        self.flatStores = []
+        self.offsets = [0]
+        self.costs = []
+        self.routeIndex = {}
+
+    def __len__(self):
+        return len(self.costs)
+
+    def add(self, route, cost):
+        '''Adds a route to the pool
+
+        Parameters
+        ----------
+        route: list
+            Ordered list of the stores visited, starting and ending at the distribution centre
+        cost: float
+            Cost of the route
+
+        Returns
+        -------
+        added: bool
+            True if the route is a new store set or a cheaper ordering of one already in the pool
+        '''
+        for location in route:
+            if location not in self.locationIndex:
+                self.locationIndex[location] = len(self.locations)
+                self.locations.append(location)
+        ids = [self.locationIndex[location] for location in route]
+        key = (ids[0], frozenset(ids[1:-1]))
+
+        if key not in self.routeIndex:
+            self.routeIndex[key] = len(self.costs)
+            self.flatStores.extend(ids)
+            self.offsets.append(len(self.flatStores))
+            self.costs.append(cost)
+            return True
+
+        # same store set, so the new ordering fits exactly in the old one's slot
+        i = self.routeIndex[key]
+        if cost < self.costs[i]:
+            self.flatStores[self.offsets[i]:self.offsets[i + 1]] = ids
+            self.costs[i] = cost
+            return True
+        return False
+
+    def route(self, i):
+        '''Returns the ordered list of locations visited by route i'''
+        return [self.locations[j] for j in self.flatStores[self.offsets[i]:self.offsets[i + 1]]]
+
+    def routeStores(self):
+        '''Returns a list of the ordered list of locations visited by each route'''
+        return [self.route(i) for i in range(len(self))]
+
+    def incidence(self, stores):
+        '''Builds the store x route incidence matrix
+
+        Parameters
+        ----------
+        stores: list or pd.Index
+            The stores for the rows of the matrix
+
+        Returns
+        -------
+        incidence: np.array
+            Array where element [s,r] is 1 if route r visits store s and 0 otherwise
+        '''
+        rowIndex = {store: s for s, store in enumerate(stores)}
+        flatRows = np.array([rowIndex.get(self.locations[j], -1) for j in self.flatStores], dtype = np.intp)
+        flatRoutes = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+        # distribution centres are not rows of the matrix
+        visited = flatRows >= 0
+        incidence = np.zeros((len(rowIndex), len(self)), dtype = int)
+        incidence[flatRows[visited], flatRoutes[visited]] = 1
+        return incidence
+
+    def toFrames(self, stores, routeName, leasedCost = defaultTariff.leasedCost):
+        '''Returns the pool in the format of FindStoreSets, with a leased truck "b" twin for every route
+
+        Parameters
+        ----------
+        stores: list or pd.Index
+            The stores for the rows of routesDataFrame
+        routeName: str
+            The name assigned to the routes
+        leasedCost: float (optional)
+            The cost of each "b" route
+
+        Returns
+        -------
+        routesDataFrame: pd.Dataframe
+            Dataframe where each column is a route and each row is 1 if the route visits that store
+        routesCost: pd.Series
+            A series of the costs for each route in the routesDataFrame
+        routesStores: pd.Series
+            A series that contains an ordered list of stores that each route visits
+        '''
+        names = []
+        for i in range(len(self)):
+            names.extend([routeName + str(i), routeName + str(i) + 'b'])
+
+        incidence = np.repeat(self.incidence(stores), 2, axis = 1)
+        costs = np.column_stack((self.costs, np.full(len(self), leasedCost))).ravel()
+        routeStores = [route for route in self.routeStores() for twin in range(2)]
+
+        routesDataFrame = pd.DataFrame(incidence, index = stores, columns = names)
+        routesCost = pd.Series(costs, index = names)
+        routesStores = pd.Series(routeStores, index = names)
+        return routesDataFrame, routesCost, routesStores
+
+def FindStoreSets(distributionCenter, storeDemandEstimates, storeTravelTimes, routeName, n = 1000, tariff = defaultTariff):
     '''Finds sets of routes that can be linked to form feasible route
+
+    Each store set is only returned once, visited in its quickest order.
     
     Parameters
     ----------
@@ -161,11 +496,14 @@ def FindStoreSets(distributionCenter, storeDemandEstimates, storeTravelTimes, ro
         Name of the distribution center the routes start and end at
     storeDemandEstimates: pd.dataframe
         Dataframe containing store name as index and column of daily pallet demands
-    storeTravelTimes: pd.dataframe
-        Dataframe containing travel times between the all The Warehouse and Noel Leeming 
-        stores.
+    storeTravelTimes: pd.dataframe or TravelMatrix
+        Travel times between the all The Warehouse and Noel Leeming stores.
     routeName: str
         The name assigned to the generated routes
+    n: int (optional)
+        The number of random routes to draw
+    tariff: Tariff (optional)
+        The rates the routes and leased trucks are costed at
 
     Returns
     -------
@@ -177,31 +515,85 @@ def FindStoreSets(distributionCenter, storeDemandEstimates, storeTravelTimes, ro
     routesStores: pd.Series
         A series that contains an ordered list of stores that each route visits
     '''
-    random.seed(80)
+    storeTravelTimes = asTravelMatrix(storeTravelTimes)
+    nearestStores = getNearestStores(distributionCenter, storeTravelTimes)
+    palletDemand = storeDemandEstimates['Pallet Demand'].to_dict()
+
+    pool = RoutePool()
+    drawStoreSets(distributionCenter, palletDemand, storeTravelTimes, nearestStores, n, random.Random(80), pool, tariff)
+
+    return pool.toFrames(storeDemandEstimates.index, routeName, tariff.leasedCost)
+
+def getNearestStores(distributionCenter, storeTravelTimes, count = 3):
+    '''Finds the three closest stores (by travel time to the store) to each store
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center, which is never a next store
+    storeTravelTimes: TravelMatrix
+        Travel times between the stores and distribution centre
+    count: int (optional)
+        The number of closest stores found, None for every other store
+
+    Returns
+    -------
+    nearestStores: dict
+        The list of the three (or count) closest stores to each store, closest first
+    '''
+    nearestStores = {}
+    for store in storeTravelTimes.names:
+        candidates = [other for other in storeTravelTimes.names if other not in (store, distributionCenter)]
+        times = storeTravelTimes.durations[storeTravelTimes.indices(candidates), storeTravelTimes.index[store]]
+        nearestStores[store] = [candidates[j] for j in np.argsort(times, kind = 'stable')[:count]]
+    return nearestStores
+
+def drawStoreSets(distributionCenter, palletDemand, storeTravelTimes, nearestStores, n, rng, pool, tariff = defaultTariff):
+    '''Draws random routes for FindStoreSets and adds them to a route pool
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center the routes start and end at
+    palletDemand: dict
+        The daily pallet demand of each store
+    storeTravelTimes: TravelMatrix
+        Travel times between the stores and distribution centre
+    nearestStores: dict
+        The three closest stores to each store, from getNearestStores
+    n: int
+        The number of random routes to draw
+    rng: random.Random
+        The random number generator to draw with
+    pool: RoutePool
+        The pool the routes are added to
+    tariff: Tariff (optional)
+        The rates the routes are costed at
+    '''
+    stores = list(palletDemand)
+
     # generate n number of route sets
-    n = 1000
     for i in range(n):
 
         # select first store
-        currentStore = storeDemandEstimates.index[random.randint(0, storeDemandEstimates.size-1)]
+        currentStore = stores[rng.randint(0, len(stores)-1)]
         currentStoreSet = [distributionCenter,currentStore,distributionCenter]
 
-        totalPallets = storeDemandEstimates.at[currentStore,'Pallet Demand']
-        numStore = random.randint(2,5) # maximum number of stores in route
+        totalPallets = palletDemand[currentStore]
+        numStore = rng.randint(2,5) # maximum number of stores in route
 
         # feasible route conditions: cannot take longer than 4 hours, cannot have more than numStore stores
         keep_looping = True
         while  ((len(currentStoreSet)-2 < numStore) & (RouteLength(currentStoreSet,storeTravelTimes, totalPallets) <= 14400) & keep_looping):
 
             # select next store 
-            sortedTravelTimes = storeTravelTimes.drop([currentStore, distributionCenter]).sort_values(by = [currentStore])
-            nextStore = sortedTravelTimes.index[random.randint(0, 2)]
+            nextStore = nearestStores[currentStore][rng.randint(0, 2)]
             
             # check adding store is valid
             if ((not (nextStore in currentStoreSet)) & (RouteLength(currentStoreSet,storeTravelTimes,totalPallets, nextStore)<= 14400)):
-                if (totalPallets + storeDemandEstimates.at[nextStore, 'Pallet Demand'] <= 20):
+                if (totalPallets + palletDemand[nextStore] <= 20):
                     currentStoreSet.insert(-1,nextStore)
-                    totalPallets += storeDemandEstimates.at[nextStore, 'Pallet Demand']
+                    totalPallets += palletDemand[nextStore]
                     currentStore = nextStore
                 else:
                     keep_looping = False
@@ -209,29 +601,393 @@ def FindStoreSets(distributionCenter, storeDemandEstimates, storeTravelTimes, ro
                 keep_looping = False
             
 
-        # Find stores that route vists
-        route = pd.Series([1 if store in currentStoreSet else 0 for store in storeDemandEstimates.index],index = storeDemandEstimates.index)
-        
-        # if first route create dataframe otherwise just add to dataframe
-        if (i==0): 
-            cost = [(RouteLength(currentStoreSet,storeTravelTimes, totalPallets)/3600)*175, 1500]
-            routes = [routeName + str(i), routeName + str(i) + "b" ]
-            stores = [currentStoreSet, currentStoreSet]
-            routeDataFrame = pd.DataFrame({routeName + "0":route})
-            routeDataFrame[routeName+ str(i)+ 'b'] = route
-
-        else:
-            routeDataFrame[routeName + str(i)] = route
-            routeDataFrame[routeName + str(i) + 'b'] = route
-
-            routes.extend([routeName + str(i), routeName + str(i) + 'b'])
-            stores.extend([currentStoreSet, currentStoreSet])
-            cost.extend([(RouteLength(currentStoreSet,storeTravelTimes,totalPallets)/3600)*175, 1500])
-
-    routesCost = pd.Series(cost,index = routes)
-    routeStores = pd.Series(stores,index=routes)
-
-    return routeDataFrame, routesCost, routeStores
+        # cost the store set with its quickest visit order
+        route, travelTime = storeTravelTimes.routeOrder(distributionCenter, currentStoreSet[1:-1])
+        pool.add(route, tariff.routeCost(RouteLength(route,storeTravelTimes,totalPallets)))
+
+def drawStoreChains(distributionCenter, stores, storeTravelTimes, nearestStores, n, rng, pool, neighbours = 6):
+    '''Draws random store sets by their number of stores only, for SharedRoutePool
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center the routes start and end at
+    stores: list
+        The stores the routes are drawn between
+    storeTravelTimes: TravelMatrix
+        Travel times between the stores and distribution centre
+    nearestStores: dict
+        Every other store in order of closeness to each store, from getNearestStores with count None
+    n: int
+        The number of random routes to draw
+    rng: random.Random
+        The random number generator to draw with
+    pool: RoutePool
+        The pool the routes are added to, each with its travel time in place of a cost
+    neighbours: int (optional)
+        The number of closest unvisited stores each step chooses between
+
+    Notes
+    -----
+    Like drawStoreSets each route starts at a random store and walks to one of the closest stores
+    it hasn't visited yet until it has a random number of stores (1 to 5). With no demand there are
+    no capacity or time limits, so every part of the walk from its first store is added and which
+    routes fit is left to the demand profile they are used with.
+    '''
+    for i in range(n):
+        currentStore = stores[rng.randint(0, len(stores)-1)]
+        storeSet = [currentStore]
+        numStore = min(rng.randint(1, 5), len(stores))
+
+        while len(storeSet) < numStore:
+            candidates = [store for store in nearestStores[currentStore] if store not in storeSet][:neighbours]
+            currentStore = candidates[rng.randint(0, len(candidates)-1)]
+            storeSet.append(currentStore)
+
+        # every part of the walk is a route, so a profile finds the longest that fits as drawStoreSets would
+        for size in range(1, len(storeSet) + 1):
+            route, travelTime = storeTravelTimes.routeOrder(distributionCenter, storeSet[:size])
+            pool.add(route, travelTime)
+
+class SharedRoutePool:
+    '''Routes generated once for every distribution centre, then filtered and costed for each demand profile
+
+    Parameters
+    ----------
+    travelTimes: pd.dataframe or TravelMatrix
+        Travel times between all the stores and distribution centres
+    tariff: Tariff (optional)
+        The rates routes are costed at, unless forDemand is given others
+
+    Notes
+    -----
+    Each distribution centre has one RoutePool of store sets drawn by their number of stores alone
+    (see drawStoreChains) over every store it can serve, so it doesn't depend on any demand and is
+    generated once however many days and scenarios use it. forDemand then does every check that
+    depends on demand: the routes skip the stores a profile has no demand at, and only those that
+    fit in a truck and take at most 4 hours with their unloading time are kept, costed with that
+    time. The quickest visit orders are cached on the TravelMatrix, so each store set is only
+    ordered once whichever profiles use it. As in EnumerateStoreSets a store on its own is always a
+    route, paid overtime if it needs it.
+    '''
+
+    def __init__(self, travelTimes, tariff = defaultTariff):
+        self.travelTimes = asTravelMatrix(travelTimes)
+        self.tariff = tariff
+        self.pools = {}
+
+    def generate(self, distributionCenter, stores, n = 1000, seed = 80):
+        '''Draws routes from a distribution centre between stores and adds them to its pool
+
+        Parameters
+        ----------
+        distributionCenter: str
+            Name of the distribution center the routes start and end at
+        stores: list
+            Every store the distribution centre may serve on any day
+        n: int (optional)
+            The number of random routes to draw, see drawStoreChains
+        seed: int (optional)
+            Seed of the random draws
+
+        Returns
+        -------
+        added: int
+            The number of new store sets in the pool
+        '''
+        stores = list(stores)
+        storeTravelTimes = self.travelTimes.subset(stores + [distributionCenter])
+        pool = self.pools.setdefault(distributionCenter, RoutePool())
+        before = len(pool)
+
+        # every store on its own, so every profile can visit every store
+        for store in stores:
+            route = [distributionCenter, store, distributionCenter]
+            pool.add(route, storeTravelTimes.routeDuration(route))
+        drawStoreChains(distributionCenter, stores, storeTravelTimes, getNearestStores(distributionCenter, storeTravelTimes, None), n, random.Random(seed), pool)
+
+        return len(pool) - before
+
+    def forDemand(self, distributionCenter, storeDemandEstimates, routeName, tariff = None):
+        '''Gets the routes of a distribution centre that are feasible for a demand profile
+
+        Parameters
+        ----------
+        distributionCenter: str
+            Name of the distribution center the routes start and end at
+        storeDemandEstimates: pd.dataframe
+            Dataframe containing store name as index and column of daily pallet demands, the routes
+            skip stores not in it or with no demand
+        routeName: str
+            The name assigned to the routes
+        tariff: Tariff (optional)
+            The rates the routes are costed at, defaults to the pool's
+
+        Returns
+        -------
+        routesDataFrame, routesCost, routesStores:
+            The routes in the format of FindStoreSets
+        '''
+        tariff = tariff or self.tariff
+        demand = storeDemandEstimates['Pallet Demand']
+        demand = demand[demand > 0].to_dict()
+
+        # the stores of each route with demand, routes that skip the same stores become one
+        storeSets = {}
+        for route in self.pools[distributionCenter].routeStores():
+            stores = [store for store in route[1:-1] if store in demand]
+            if len(stores) != 0:
+                storeSets.setdefault(frozenset(stores), stores)
+
+        # a store on its own is always allowed, as in EnumerateStoreSets
+        selected = RoutePool()
+        for stores in storeSets.values():
+            pallets = sum(demand[store] for store in stores)
+            if pallets > 20 and len(stores) > 1:
+                continue
+            route, travelTime = self.travelTimes.routeOrder(distributionCenter, stores)
+            seconds = travelTime + pallets*600
+            if seconds <= 14400 or len(stores) == 1:
+                selected.add(route, tariff.routeCost(seconds))
+        return selected.toFrames(storeDemandEstimates.index, routeName, tariff.leasedCost)
+
+# state of each route generation worker process, set once by initRouteWorker
+routeWorkerState = {}
+
+def initRouteWorker(distributionCenter, palletDemand, storeTravelTimes, tariff = defaultTariff):
+    '''Sets up a FindStoreSetsParallel worker process so each chunk only needs its seed'''
+    routeWorkerState['args'] = (distributionCenter, palletDemand, storeTravelTimes, getNearestStores(distributionCenter, storeTravelTimes))
+    routeWorkerState['tariff'] = tariff
+
+def drawStoreSetsChunk(chunk):
+    '''Draws one chunk of routes in a worker process
+
+    Parameters
+    ----------
+    chunk: tuple
+        The number of routes to draw and the np.random.SeedSequence of the chunk
+
+    Returns
+    -------
+    routes: list
+        (route, cost) for each store set drawn, with the cheapest cost found in the chunk
+    '''
+    n, seedSequence = chunk
+    pool = RoutePool()
+    drawStoreSets(*routeWorkerState['args'], n, random.Random(int(seedSequence.generate_state(1)[0])), pool, routeWorkerState['tariff'])
+    return list(zip(pool.routeStores(), pool.costs))
+
+def FindStoreSetsParallel(distributionCenter, storeDemandEstimates, storeTravelTimes, routeName, n = 1000, seed = 80, workers = None, chunks = 64, tariff = defaultTariff):
+    '''Finds routes like FindStoreSets, drawing them in parallel worker processes
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center the routes start and end at
+    storeDemandEstimates: pd.dataframe
+        Dataframe containing store name as index and column of daily pallet demands
+    storeTravelTimes: pd.dataframe or TravelMatrix
+        Travel times between the all The Warehouse and Noel Leeming stores.
+    routeName: str
+        The name assigned to the generated routes
+    n: int (optional)
+        The number of random routes to draw
+    seed: int (optional)
+        The master seed the seed of every chunk is spawned from
+    workers: int (optional)
+        The number of worker processes, defaults to the number of cores
+    chunks: int (optional)
+        The number of pieces the draws are split into
+    tariff: Tariff (optional)
+        The rates the routes and leased trucks are costed at
+
+    Returns
+    -------
+    routesDataFrame, routesCost, routesStores
+        The routes in the same format as FindStoreSets
+
+    Notes
+    -----
+    Each chunk gets its own random stream spawned from np.random.SeedSequence(seed) and the chunks are
+    merged in order, so the routes depend on the seed and chunks but not on the number of workers.
+    The draws are not the same as FindStoreSets, which uses a single stream seeded with 80.
+    '''
+    storeTravelTimes = asTravelMatrix(storeTravelTimes)
+    palletDemand = storeDemandEstimates['Pallet Demand'].to_dict()
+
+    # split the draws as evenly as possible, each chunk with its own seed
+    sizes = [n//chunks + (1 if c < n % chunks else 0) for c in range(chunks)]
+    seedSequences = np.random.SeedSequence(seed).spawn(chunks)
+
+    pool = RoutePool()
+    with ProcessPoolExecutor(workers, initializer = initRouteWorker, initargs = (distributionCenter, palletDemand, storeTravelTimes, tariff)) as executor:
+        for routes in executor.map(drawStoreSetsChunk, zip(sizes, seedSequences)):
+            for route, cost in routes:
+                pool.add(route, cost)
+
+    return pool.toFrames(storeDemandEstimates.index, routeName, tariff.leasedCost)
+
+def bestRouteOrder(distributionCenter, stores, storeTravelTimes):
+    '''Finds the quickest order to visit a set of stores
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center the route starts and ends at
+    stores: list
+        The stores to visit
+    storeTravelTimes: pd.dataframe or TravelMatrix
+        Travel times between the stores and distribution centres
+
+    Returns
+    -------
+    route: list
+        The ordered stores visited, starting and ending at the distribution centre
+    travelTime: float
+        The travel time of the route in seconds (not including unloading pallets)
+
+    Notes
+    -----
+    Orders are cached on the TravelMatrix (see TravelMatrix.routeOrder), so pass the same TravelMatrix
+    to every call rather than a dataframe to solve each store set only once.
+    '''
+    return asTravelMatrix(storeTravelTimes).routeOrder(distributionCenter, stores)
+
+def PriceRoutes(distributionCenter, storeDemandEstimates, storeTravelTimes, duals, truckDual = 0, tariff = defaultTariff, maxRoutes = 50):
+    '''Finds feasible routes with negative reduced cost for column generation
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center the routes start and end at
+    storeDemandEstimates: pd.dataframe
+        Dataframe containing store name as index and column of daily pallet demands
+    storeTravelTimes: pd.dataframe or TravelMatrix
+        Travel times between the all The Warehouse and Noel Leeming stores.
+    duals: dict
+        Dual value of the visit constraint of each store
+    truckDual: float (optional)
+        Dual value of the truck constraint (zero or negative)
+    tariff: Tariff (optional)
+        The rates routes and leased trucks are costed at
+    maxRoutes: int (optional)
+        The maximum number of routes to return, the most negative are kept
+
+    Returns
+    -------
+    routes: list
+        List of (route, cost, reducedCost) tuples sorted by reduced cost, where route is the
+        ordered list of stores visited starting and ending at the distribution centre
+
+    Notes
+    -----
+    Store sets are searched depth first in a fixed store order so each set is only seen once, and
+    each set is costed with its quickest visit order. Routes must have at most 20 pallets, 5 stores
+    and take at most 4 hours (14400 s, including 10 minutes per pallet). A branch is cut when it
+    is over capacity or time, or when even the largest remaining duals cannot make its reduced
+    cost negative. This assumes adding stores never makes a route quicker (the triangle inequality).
+    '''
+    storeTravelTimes = asTravelMatrix(storeTravelTimes)
+    stores = list(storeDemandEstimates.index)
+    pallets = storeDemandEstimates['Pallet Demand'].to_numpy()
+    storeDuals = np.array([duals.get(store, 0) for store in stores])
+
+    # largest positive duals among the stores after each position, for bounding branches
+    remainingDuals = [sorted(np.maximum(storeDuals[j:], 0), reverse = True)[:4] for j in range(len(stores) + 1)]
+
+    routes = []
+    def extend(subset, start, totalPallets, dualSum):
+        for j in range(start, len(stores)):
+            if totalPallets + pallets[j] > 20:
+                continue
+            newSubset = subset + [stores[j]]
+            route, travelTime = storeTravelTimes.routeOrder(distributionCenter, newSubset)
+            time = travelTime + (totalPallets + pallets[j])*600
+            if time > 14400:
+                continue
+
+            cost = tariff.routeCost(time)
+            bestCost = min(cost - truckDual, tariff.leasedCost)
+            reducedCost = bestCost - dualSum - storeDuals[j]
+            if reducedCost < -1e-3:
+                routes.append((route, cost, reducedCost))
+
+            if len(newSubset) < 5 and reducedCost - sum(remainingDuals[j + 1][:5 - len(newSubset)]) < -1e-3:
+                extend(newSubset, j + 1, totalPallets + pallets[j], dualSum + storeDuals[j])
+
+    extend([], 0, 0, 0)
+
+    routes.sort(key = lambda route: route[2])
+    return routes[:maxRoutes]
+
+def EnumerateStoreSets(distributionCenter, storeDemandEstimates, storeTravelTimes, routeName, maxStores = 5, tariff = defaultTariff):
+    '''Enumerates every feasible route from a distribution centre
+
+    Parameters
+    ----------
+    distributionCenter: str
+        Name of the distribution center the routes start and end at
+    storeDemandEstimates: pd.dataframe
+        Dataframe containing store name as index and column of daily pallet demands
+    storeTravelTimes: pd.dataframe or TravelMatrix
+        Travel times between the all The Warehouse and Noel Leeming stores.
+    routeName: str
+        The name assigned to the generated routes
+    maxStores: int (optional)
+        The maximum number of stores on a route
+    tariff: Tariff (optional)
+        The rates the routes and leased trucks are costed at
+
+    Returns
+    -------
+    routesDataFrame: pd.Dataframe
+        Dataframe containing the feasible routes, see FindStoreSets
+    routesCost: pd.Series
+        A series of the costs for each route in the routesDataFrame
+    routesStores: pd.Series
+        A series that contains an ordered list of stores that each route visits
+
+    Notes
+    -----
+    Store sets are searched depth first in a fixed store order so each set is only seen once. A
+    branch is cut as soon as it has more than 20 pallets or its lower bound on time is over 14400 s.
+    The lower bound is the time to unload the pallets plus the longest out and back trip to one of
+    its stores, which can only grow as stores are added. Sets under the bound are kept if their
+    quickest visit order takes at most 4 hours. Single store routes are always kept so every store
+    can be served.
+    '''
+    storeTravelTimes = asTravelMatrix(storeTravelTimes)
+    stores = list(storeDemandEstimates.index)
+    pallets = storeDemandEstimates['Pallet Demand'].to_numpy()
+    depot = storeTravelTimes.index[distributionCenter]
+    storeIndex = storeTravelTimes.indices(stores)
+    outAndBack = storeTravelTimes.durations[depot, storeIndex] + storeTravelTimes.durations[storeIndex, depot]
+
+    pool = RoutePool()
+    def extend(subset, start, totalPallets, longestTrip):
+        for j in range(start, len(stores)):
+            newPallets = totalPallets + pallets[j]
+            newLongestTrip = max(longestTrip, outAndBack[j])
+            if newPallets > 20 or newPallets*600 + newLongestTrip > 14400:
+                continue
+
+            newSubset = subset + [stores[j]]
+            route, travelTime = storeTravelTimes.routeOrder(distributionCenter, newSubset)
+            routeTime = RouteLength(route, storeTravelTimes, newPallets)
+            if routeTime <= 14400 or len(newSubset) == 1:
+                pool.add(route, tariff.routeCost(routeTime))
+
+            if len(newSubset) < maxStores:
+                extend(newSubset, j + 1, newPallets, newLongestTrip)
+
+    extend([], 0, 0, 0)
+
+    # stores too far away or with too much demand to fit any bound still need a route
+    for store in stores:
+        route = [distributionCenter, store, distributionCenter]
+        pool.add(route, tariff.routeCost(RouteLength(route, storeTravelTimes, storeDemandEstimates.at[store, 'Pallet Demand'])))
+
+    return pool.toFrames(storeDemandEstimates.index, routeName, tariff.leasedCost)
 
 def getOptimalRoutes(problem, routesDF):
     '''Get the stores for each selected route
@@ -0,0 +1,340 @@
+# Benchmarks for the route generation, formulation and simulation functions
+import os
+import sys
+import json
+import shutil
+import platform
+import tracemalloc
+import importlib.metadata
+import numpy as np
+import pandas as pd
+from pulp import *
+from formulation import *
+from Routes import *
+import dataset
+from simulation import getRecoursePolicy, simulateParallel
+from time import perf_counter, process_time
+
+def syntheticRoutes(nStores, nRoutes, seed = 0):
+    '''Creates a random route pool in the formats returned by FindStoreSets
+
+    Parameters
+    ----------
+    nStores: int
+        The number of stores
+    nRoutes: int
+        The number of routes (columns)
+    seed: int (optional)
+        Seed for the random number generator
+
+    Returns
+    -------
+    routesDataFrame: pd.Dataframe
+        Dataframe where each column is a route and each row is 1 if the route visits that store
+    routesCost: pd.Series
+        A series of the costs for each route
+    routeStores: pd.Series
+        A series of the list of stores visited by each route
+    '''
+    rng = np.random.default_rng(seed)
+    stores = ['Store ' + str(s) for s in range(nStores)]
+    names = ['Route' + str(r) for r in range(nRoutes)]
+
+    routeStores = [list(rng.choice(stores, size = rng.integers(1, 6), replace = False)) for r in range(nRoutes)]
+    incidence = np.zeros((nStores, nRoutes), dtype = int)
+    for r, visited in enumerate(routeStores):
+        incidence[[int(store[6:]) for store in visited], r] = 1
+
+    routesDataFrame = pd.DataFrame(incidence, index = stores, columns = names)
+    routesCost = pd.Series(rng.uniform(200, 900, nRoutes), index = names)
+    return routesDataFrame, routesCost, pd.Series(routeStores, index = names)
+
+def denseModel(routes, costs, problem):
+    '''Builds the set partitioning model the original way, with a term for every store and route
+    '''
+    route_vars=LpVariable.dicts("Choose",costs.index,cat='Binary')
+    prob = LpProblem(problem, LpMinimize)
+    prob += lpSum([route_vars[i]*costs[i]  for i in costs.index])
+    for node in routes.index:
+        prob += lpSum([route_vars[i]*routes.loc[node][i] for i in costs.index]) == 1
+    prob += lpSum([route_vars[i] for i in costs.index if 'b' not in i]) <= 50
+    return prob
+
+def timeCall(function, *args):
+    '''Returns the wall time in seconds of calling function'''
+    start = perf_counter()
+    function(*args)
+    return perf_counter() - start
+
+def benchmarkModelBuild(columns = (10000, 100000), nStores = 36, dense = True):
+    '''Times building the set partitioning model for route pools of different sizes
+
+    Parameters
+    ----------
+    columns: tuple
+        The numbers of routes to time
+    nStores: int
+        The number of stores
+    dense: bool
+        If the original dense construction is timed as well
+
+    Returns
+    -------
+    timings: pd.DataFrame
+        Build times in seconds for each number of columns
+    '''
+    timings = []
+    for nRoutes in columns:
+        routesDataFrame, routesCost, routeStores = syntheticRoutes(nStores, nRoutes)
+        stores = list(routesDataFrame.index)
+        timing = {'columns': nRoutes, 'nonzeros': int(routesDataFrame.to_numpy().sum())}
+        if dense:
+            timing['dense'] = timeCall(denseModel, routesDataFrame, routesCost, 'dense')
+        timing['sparse dataframe'] = timeCall(buildModel, routesDataFrame, routesCost, 'sparse')
+        timing['sparse store lists'] = timeCall(buildModel, routeStores, routesCost, 'sparse', stores)
+        timings.append(timing)
+        print(timing)
+
+    return pd.DataFrame(timings)
+
+def benchmarkEnumeration(storeCounts = (10, 20, 30, 36), distributionCenter = 'Distribution South'):
+    '''Times enumerating every feasible route from the real data for growing numbers of stores
+
+    Parameters
+    ----------
+    storeCounts: tuple
+        The numbers of stores (taken in the order of the demand file) to time
+    distributionCenter: str
+        The distribution centre the routes start and end at
+
+    Returns
+    -------
+    timings: pd.DataFrame
+        Enumeration times in seconds and the number of routes found for each day type and store count
+    '''
+    North, South = BothCentresOpen('Data' + os.sep + 'WarehouseDistances.csv')
+    stores = pd.concat([North, South])
+    Mon_to_Fri, Sat = DemandData('Data' + os.sep + 'demandDataUpdated2.csv', stores)
+    travelTimes = getTravelMatrix(pd.concat([stores, pd.Series([distributionCenter], index = [distributionCenter])]), 'Data' + os.sep + 'WarehouseDurations.csv')
+
+    timings = []
+    for day, demand in (('Mon-Fri', Mon_to_Fri), ('Sat', Sat[Sat['Pallet Demand'] > 0])):
+        for nStores in storeCounts:
+            if nStores > len(demand):
+                continue
+            start = perf_counter()
+            routesDataFrame, routesCost, routeStores = EnumerateStoreSets(distributionCenter, demand.iloc[:nStores], travelTimes, 'Route')
+            timing = {'day': day, 'stores': nStores, 'routes': routesCost.size//2, 'seconds': perf_counter() - start}
+            timings.append(timing)
+            print(timing)
+
+    return pd.DataFrame(timings)
+
+def syntheticInstance(folder, nStores, nDepots = 2, nDays = 28, seed = 0):
+    '''Writes a random instance with the same files and columns as the Data folder
+
+    Parameters
+    ----------
+    folder: str
+        The folder the files are written to
+    nStores: int
+        The number of stores
+    nDepots: int (optional)
+        The number of distribution centres, the first two are Distribution South and Distribution North
+    nDays: int (optional)
+        The number of days of demand history, starting on a Monday
+    seed: int (optional)
+        Seed for the random number generator
+
+    Returns
+    -------
+    folder: str
+        The folder the files were written to
+
+    Notes
+    -----
+    Writes WarehouseLocationsUpdated.csv, WarehouseDistances.csv, WarehouseDurations.csv and the
+    demand history as demandDataUpdated.csv and demandDataUpdated2.csv (with the Mon-Fri and Sat
+    estimates). Locations are spread over the Auckland area, distances are the straight line
+    distance times a road factor and durations follow from a speed of about 11 m/s like the real
+    data. Stores are The Warehouse, Noel Leeming or combined stores, with Poisson daily demand and
+    no deliveries on Sundays.
+    '''
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok = True)
+
+    depots = ['Distribution South', 'Distribution North'][:nDepots] + ['Distribution ' + str(d + 1) for d in range(2, nDepots)]
+    storeTypes = rng.choice(['The Warehouse', 'Noel Leeming', 'Combined'], size = nStores, p = [0.45, 0.45, 0.1])
+    stores = [storeType + ' ' + str(s) if storeType != 'Combined' else 'Store ' + str(s) + ' Stores' for s, storeType in enumerate(storeTypes)]
+    names = depots + stores
+
+    locations = pd.DataFrame({
+        'Type': ['Distribution']*nDepots + list(storeTypes),
+        'Location': [name.split(' ', 1)[1] for name in depots] + [str(s) for s in range(nStores)],
+        'Store': names,
+        'Long': rng.uniform(174.6, 175.0, nDepots + nStores),
+        'Lat': rng.uniform(-37.1, -36.7, nDepots + nStores),
+    })
+    locations.to_csv(folder + os.sep + 'WarehouseLocationsUpdated.csv', index = False, encoding = 'utf-8-sig')
+
+    # straight line distance in metres (equirectangular) times a road factor
+    x = np.radians(locations['Long'].to_numpy())*np.cos(np.radians(-36.9))*6371000
+    y = np.radians(locations['Lat'].to_numpy())*6371000
+    distances = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])*rng.uniform(1.2, 1.5, (len(names), len(names)))
+    np.fill_diagonal(distances, 0)
+    durations = distances/rng.uniform(10, 13, distances.shape)
+
+    pd.DataFrame(distances.round(2), index = names, columns = names).to_csv(folder + os.sep + 'WarehouseDistances.csv')
+    pd.DataFrame(durations.round(2), index = pd.Index(names, name = 'Locations'), columns = names).to_csv(folder + os.sep + 'WarehouseDurations.csv')
+
+    # daily demand history, none on Sundays
+    dates = pd.date_range('2020-02-03', periods = nDays)
+    meanDemand = np.select([storeTypes == 'The Warehouse', storeTypes == 'Noel Leeming'], [6.5, 4.5], 11)
+    demand = rng.poisson(meanDemand[:, None], (nStores, nDays))
+    demand[:, dates.dayofweek == 6] = 0
+    columns = [str(date.day) + '/' + date.strftime('%m/%Y') for date in dates]
+    history = pd.DataFrame(demand, index = pd.Index(stores, name = 'Name'), columns = columns)
+    history.to_csv(folder + os.sep + 'demandDataUpdated.csv', encoding = 'utf-8-sig')
+
+    history['Mon-Fri'] = np.ceil(demand[:, dates.dayofweek < 5].mean(axis = 1)).astype(int)
+    history['Sat'] = np.ceil(demand[:, dates.dayofweek == 5].mean(axis = 1)).astype(int)
+    history.to_csv(folder + os.sep + 'demandDataUpdated2.csv', encoding = 'utf-8-sig')
+
+    return folder
+
+def profileCall(function, *args, memory = True, **kwargs):
+    '''Calls function, timing it and tracking its peak Python memory
+
+    Returns
+    -------
+    result:
+        What function returned
+    seconds: float
+        The wall time of the call
+    cpuSeconds: float
+        The CPU time of this process during the call (not including subprocesses such as CBC)
+    peakMB: float
+        The peak memory allocated during the call in MB (numpy arrays included), None if memory is False
+
+    Notes
+    -----
+    Memory is tracked with tracemalloc, which slows down pure Python code, so pass memory = False
+    for clean timings.
+    '''
+    if memory:
+        tracemalloc.start()
+    start, cpuStart = perf_counter(), process_time()
+    result = function(*args, **kwargs)
+    seconds, cpuSeconds = perf_counter() - start, process_time() - cpuStart
+    peakMB = None
+    if memory:
+        peakMB = tracemalloc.get_traced_memory()[1]/1e6
+        tracemalloc.stop()
+    return result, seconds, cpuSeconds, peakMB
+
+def benchmarkScaling(storeCounts = (50, 200, 1000, 5000), nDepots = 2, nSimulations = 10000, routesPerStore = 20, timeLimit = 60, memory = True, folder = 'benchmarkData', outputFile = 'benchmarkResults.json'):
+    '''Times and memory profiles each stage of the pipeline on synthetic instances of growing size
+
+    Parameters
+    ----------
+    storeCounts: tuple (optional)
+        The numbers of stores of the instances
+    nDepots: int (optional)
+        The number of distribution centres, each store is served from the closest
+    nSimulations: int (optional)
+        The number of simulations of the optimal routes
+    routesPerStore: int (optional)
+        The number of random routes FindStoreSets draws per store of a distribution centre
+    timeLimit: float (optional)
+        The time limit of the CBC solve in seconds
+    memory: bool (optional)
+        If peak memory is tracked, see profileCall
+    folder: str (optional)
+        The folder the instances are written to
+    outputFile: str (optional)
+        The JSON file the results are written to
+
+    Returns
+    -------
+    results: pd.DataFrame
+        A row for each stage of each instance with its wall and CPU time, peak memory and size
+
+    Notes
+    -----
+    The stages are writing the instance, reading the csv files the original way (getTravelTimes),
+    loading the Dataset with and without its binary cache, route generation, building the model,
+    writing the LP file, the CBC solve and the simulation. The JSON file also records the
+    Python, numpy and pulp versions and the machine, so runs can be compared for regressions.
+    '''
+    results = []
+    def record(nStores, stage, profile, **sizes):
+        result, seconds, cpuSeconds, peakMB = profile
+        results.append(dict({'stores': nStores, 'depots': nDepots, 'stage': stage, 'seconds': seconds, 'cpuSeconds': cpuSeconds, 'peakMB': peakMB}, **sizes))
+        print(results[-1])
+        return result
+
+    for nStores in storeCounts:
+        instanceFolder = folder + os.sep + 'stores' + str(nStores)
+        shutil.rmtree(instanceFolder, ignore_errors = True)
+        record(nStores, 'write instance', profileCall(syntheticInstance, instanceFolder, nStores, nDepots, memory = memory))
+
+        # load the files
+        locations = pd.read_csv(instanceFolder + os.sep + 'WarehouseLocationsUpdated.csv', encoding = 'utf-8-sig')
+        record(nStores, 'read csv', profileCall(getTravelTimes, locations['Store'], instanceFolder + os.sep + 'WarehouseDurations.csv', memory = memory))
+        dataset.loadedTables.clear()
+        data = record(nStores, 'load dataset', profileCall(dataset.Dataset, instanceFolder, memory = memory))
+        dataset.loadedTables.clear()
+        data = record(nStores, 'load dataset (cached)', profileCall(dataset.Dataset, instanceFolder, memory = memory))
+
+        # serve each store from its closest distribution centre
+        depots = [name for name in data.travelMatrix.names if name.startswith('Distribution')]
+        storeNames = [name for name in data.travelMatrix.names if name not in depots]
+        closest = np.argmin(data.travelMatrix.durations[np.ix_(data.travelMatrix.indices(depots), data.travelMatrix.indices(storeNames))], axis = 0)
+        demand = data.demandFrames(pd.Series(storeNames, index = storeNames))[0]
+        routeSources = []
+        for d, depot in enumerate(depots):
+            served = [store for store, c in zip(storeNames, closest) if c == d]
+            routeSources.append((depot, demand.loc[sorted(served)], data.travelTimes(served + [depot]), 'Route' + str(d) + '_'))
+
+        def generateRoutes():
+            frames = [FindStoreSets(*routeSource, n = routesPerStore*len(routeSource[1])) for routeSource in routeSources]
+            return pd.concat([frame[1] for frame in frames]), pd.concat([frame[2] for frame in frames])
+        routesCost, routeStores = record(nStores, 'route generation', profileCall(generateRoutes, memory = memory))
+        results[-1]['routes'] = len(routesCost)
+
+        stores = list(demand.index)
+        prob = record(nStores, 'model build', profileCall(buildModel, routeStores, routesCost, 'Scaling', stores, memory = memory),
+                      routes = len(routesCost), nonzeros = int(sum(len(route) - 2 for route in routeStores)))
+        record(nStores, 'write LP', profileCall(prob.writeLP, instanceFolder + os.sep + 'Scaling.lp', memory = memory))
+        record(nStores, 'solve', profileCall(prob.solve, PULP_CBC_CMD(msg = False, timeLimit = timeLimit), memory = memory))
+        results[-1]['status'] = LpStatus[prob.status]
+        results[-1]['solution'] = LpSolution[prob.sol_status]
+        results[-1]['objective'] = value(prob.objective)
+
+        # simulate the chosen routes
+        chosen = [v.name[7:] for v in prob.variables() if v.varValue is not None and v.varValue > 0.5]
+        optimalRoutes = routeStores[chosen]
+        storeSeries = pd.Series(stores, index = stores)
+        policy = getRecoursePolicy('dropLast', optimalRoutes, data.travelMatrix, storeSeries.index)
+        batchSize = max(100, int(2e7//(len(chosen)*policy.routeStores.shape[1] + 1)))
+        record(nStores, 'simulation', profileCall(simulateParallel, policy, nSimulations, storeSeries, True, data.historyFile, 0, 1, 1, batchSize, memory = memory),
+               simulations = nSimulations, chosenRoutes = len(chosen))
+
+    with open(outputFile, 'w') as file:
+        json.dump({
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pulp': importlib.metadata.version('pulp'),
+            'machine': platform.platform(),
+            'cpus': os.cpu_count(),
+            'results': results,
+        }, file, indent = 1)
+
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'scaling':
+        benchmarkScaling(tuple(int(nStores) for nStores in sys.argv[2:]) or (50, 200, 1000, 5000))
+    else:
+        benchmarkModelBuild()
+        benchmarkEnumeration()
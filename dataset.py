@@ -0,0 +1,161 @@
+# Loads the Data/ csv files once, keeping a binary copy of each so later runs skip parsing them
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from Routes import TravelMatrix
+
+# parsed tables of this process, keyed by file path and fingerprint
+loadedTables = {}
+
+# loaded datasets of this process, keyed by data folder
+loadedDatasets = {}
+
+def fileFingerprint(filepath):
+    '''Returns a hash of the contents of a file'''
+    with open(filepath, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()[:16]
+
+def readCached(filepath, parse, cacheFolder = '.cache'):
+    '''Reads a csv file through the binary cache
+
+    Parameters
+    ----------
+    filepath: str
+        Name of the csv file
+    parse: function
+        Function that parses the csv file into a dictionary of numpy arrays
+    cacheFolder: str (optional)
+        Folder (next to the csv file) the binary copies are kept in
+
+    Returns
+    -------
+    arrays: dict
+        The parsed arrays
+
+    Notes
+    -----
+    The binary copy is an .npz file named after the csv file and a hash of its contents, so editing
+    the csv file makes a new copy rather than reusing a stale one. Within a process each file is
+    only read once.
+    '''
+    fingerprint = fileFingerprint(filepath)
+    key = (os.path.abspath(filepath), fingerprint)
+    if key in loadedTables:
+        return loadedTables[key]
+
+    folder = os.path.join(os.path.dirname(filepath), cacheFolder)
+    cacheFile = os.path.join(folder, os.path.basename(filepath) + '.' + fingerprint + '.npz')
+    if os.path.exists(cacheFile):
+        with np.load(cacheFile, allow_pickle = False) as data:
+            arrays = {name: data[name] for name in data.files}
+    else:
+        arrays = parse(filepath)
+
+        # write to a temporary file first so parallel runs never see half a cache file
+        os.makedirs(folder, exist_ok = True)
+        temporaryFile = cacheFile + '.' + str(os.getpid()) + '.tmp.npz'
+        np.savez(temporaryFile, **arrays)
+        os.replace(temporaryFile, cacheFile)
+
+    loadedTables[key] = arrays
+    return arrays
+
+def parseMatrix(filepath):
+    '''Parses a square csv file of values between locations (distances or durations)'''
+    matrix = pd.read_csv(filepath, index_col = 0)
+    matrix = matrix.loc[:, matrix.index]
+    return {'names': matrix.index.to_numpy(dtype = str), 'values': matrix.to_numpy(dtype = float)}
+
+def parseDemand(filepath):
+    '''Parses a csv file of store demands, with a "Name" column then a column per day or estimate'''
+    demand = pd.read_csv(filepath)
+    return {'names': demand['Name'].to_numpy(dtype = str), 'columns': demand.columns[1:].to_numpy(dtype = str), 'values': demand.iloc[:, 1:].to_numpy()}
+
+def parseLocations(filepath):
+    '''Parses the csv file of store types and coordinates'''
+    locations = pd.read_csv(filepath, encoding = 'utf-8-sig')
+    return {'Type': locations['Type'].to_numpy(dtype = str), 'Store': locations['Store'].to_numpy(dtype = str),
+            'Long': locations['Long'].to_numpy(dtype = float), 'Lat': locations['Lat'].to_numpy(dtype = float)}
+
+class Dataset:
+    '''The locations, travel distances and durations, and demand data of the Data/ folder
+
+    Parameters
+    ----------
+    dataFolder: str (optional)
+        The folder that contains the data files
+    demandFile: str (optional)
+        The demand file with the "Mon-Fri" and "Sat" estimates used for planning
+    historyFile: str (optional)
+        The demand file with the daily demand history used for simulation
+
+    Notes
+    -----
+    Every file is read through readCached, so after the first run the csv files are not parsed.
+    Subsets of the travel times share the arrays of the full TravelMatrix.
+    '''
+
+    def __init__(self, dataFolder = 'Data', demandFile = 'demandDataUpdated2.csv', historyFile = 'demandDataUpdated.csv'):
+        self.dataFolder = dataFolder
+        self.locationsFile = dataFolder + os.sep + 'WarehouseLocationsUpdated.csv'
+        self.historyFile = dataFolder + os.sep + historyFile
+
+        self.locations = readCached(self.locationsFile, parseLocations)
+        self.demand = readCached(dataFolder + os.sep + demandFile, parseDemand)
+        self.history = readCached(self.historyFile, parseDemand)
+
+        durations = readCached(dataFolder + os.sep + 'WarehouseDurations.csv', parseMatrix)
+        distances = readCached(dataFolder + os.sep + 'WarehouseDistances.csv', parseMatrix)
+        names = list(durations['names'])
+        order = pd.Index(distances['names']).get_indexer(names)
+        self.travelMatrix = TravelMatrix(names, durations['values'], distances['values'][np.ix_(order, order)])
+
+    def storeSets(self):
+        '''Seperates the stores by their closer distribution centre, like BothCentresOpen
+
+        Returns
+        -------
+        North : pd.Series
+            Series of the stores closer to the North distribution centre
+        South : pd.Series
+            Series of the stores closer to the South distribution centre
+        '''
+        distances = self.travelMatrix.distances
+        toSouth = distances[:, self.travelMatrix.index['Distribution South']]
+        toNorth = distances[:, self.travelMatrix.index['Distribution North']]
+        names = np.array(self.travelMatrix.names)
+
+        North = names[(toSouth > toNorth) & (toNorth != 0)]
+        South = names[(toSouth < toNorth) & (toSouth != 0)]
+        return pd.Series(North, index = North), pd.Series(South, index = South)
+
+    def demandFrames(self, stores):
+        '''Gets the planning demand of a set of stores, like DemandData
+
+        Parameters
+        ----------
+        stores: pd.Series
+            Series of the stores
+
+        Returns
+        -------
+        Mon_to_Fri : pd.DataFrame
+            Dataframe of the Mon to Fri pallet demand of the stores
+        Sat : pd.DataFrame
+            Dataframe of the Sat pallet demand of the stores
+        '''
+        columns = list(self.demand['columns'])
+        demand = pd.DataFrame(self.demand['values'][:, [columns.index('Mon-Fri'), columns.index('Sat')]], index = self.demand['names'], columns = ['Mon-Fri', 'Sat'])
+        demand = demand.loc[demand.index.isin(stores.index)].sort_index()
+        return demand[['Mon-Fri']].rename(columns = {'Mon-Fri': 'Pallet Demand'}), demand[['Sat']].rename(columns = {'Sat': 'Pallet Demand'})
+
+    def travelTimes(self, stores):
+        '''Gets the travel times between a set of locations as a TravelMatrix sharing the full arrays'''
+        return self.travelMatrix.subset(stores)
+
+def loadDataset(dataFolder = 'Data'):
+    '''Returns the Dataset of a data folder, loading it only once per process'''
+    if dataFolder not in loadedDatasets:
+        loadedDatasets[dataFolder] = Dataset(dataFolder)
+    return loadedDatasets[dataFolder]
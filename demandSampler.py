@@ -0,0 +1,123 @@
+# Draws simulated store demands from the demand history of each store type
+import os
+import numpy as np
+import pandas as pd
+from dataset import readCached, parseDemand, parseLocations
+
+# the store types a combined store is made up of, any other combined store is a The Warehouse and a Noel Leeming
+combinedStoreParts = {'Noel Leeming Grouped Stores': ('Noel Leeming', 'Noel Leeming')}
+
+# the days of the week each kind of simulation draws its demand from, the weekend pool keeps the
+# Sundays (no deliveries, so all zero) that the hard-coded weekend columns always drew from
+simulationDays = {True: ('Mon', 'Tue', 'Wed', 'Thu', 'Fri'), False: ('Sat', 'Sun')}
+
+# samplers of this process, keyed by history file, locations file and weekday
+loadedSamplers = {}
+
+class DemandSampler:
+    '''Bootstrap sampler of store demands, built once from the demand history and store types
+
+    Parameters
+    ----------
+    historyFile: str
+        The csv file of the daily demand history of each store
+    locationsFile: str
+        The csv file of the type of each store
+    weekday: bool
+        If weekday (Mon-Fri) or Saturday demand is sampled
+
+    Notes
+    -----
+    Each store type ("The Warehouse" or "Noel Leeming" in the Type column of the locations file) has
+    one pool of demands, the history of every store of that type on the sampled days. A combined
+    store is the sum of one draw for each of its parts (see combinedStoreParts). The pools are kept
+    sorted and concatenated in one array, so a stores x n sample is one gather per part. Samples
+    use the smallest unsigned integer type that holds them.
+    '''
+
+    def __init__(self, historyFile, locationsFile, weekday):
+        history = readCached(historyFile, parseDemand)
+        locations = readCached(locationsFile, parseLocations)
+        self.storeTypes = dict(zip(locations['Store'], locations['Type']))
+
+        # the history columns of the sampled days, from the dates in the column names
+        dates = pd.to_datetime(pd.Series(history['columns']), format = '%d/%m/%Y', errors = 'coerce')
+        days = dates.dt.day_name().str[:3].isin(simulationDays[weekday]).to_numpy()
+        rowTypes = np.array([self.storeTypes.get(name) for name in history['names']])
+
+        self.types = ['The Warehouse', 'Noel Leeming']
+        pools = [np.sort(history['values'][rowTypes == storeType][:, days], axis = None) for storeType in self.types]
+        self.sizes = np.array([pool.size for pool in pools])
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes)[:-1]))
+        maxParts = max([2] + [len(parts) for parts in combinedStoreParts.values()])
+        self.dtype = np.min_scalar_type(max(pool.max() for pool in pools)*maxParts)
+        self.pool = np.concatenate(pools).astype(self.dtype)
+
+    def parts(self, store):
+        '''Returns the store types that make up a store'''
+        storeType = self.storeTypes[store]
+        if storeType == 'Combined':
+            return combinedStoreParts.get(store, ('The Warehouse', 'Noel Leeming'))
+        return (storeType,)
+
+    def partTypes(self, stores):
+        '''Returns a parts x stores array of the type of each part of each store, -1 where a store has fewer parts'''
+        parts = [[self.types.index(storeType) for storeType in self.parts(store)] for store in stores]
+        partTypes = np.full((max(len(storeParts) for storeParts in parts), len(parts)), -1, dtype = np.intp)
+        for s, storeParts in enumerate(parts):
+            partTypes[:len(storeParts), s] = storeParts
+        return partTypes
+
+    def sample(self, stores, n, rng = None, stream = None, start = 0):
+        '''Draws simulated demands
+
+        Parameters
+        ----------
+        stores: list
+            The stores to draw demands for
+        n: int
+            The number of simulations
+        rng: np.random.Generator (optional)
+            The generator to draw from, defaults to the global np.random state
+        stream: CommonRandomNumbers (optional)
+            Shared random numbers to draw from instead, each store part has its own named stream
+        start: int (optional)
+            The first simulation drawn from stream
+
+        Returns
+        -------
+        demands: np.array
+            stores x n array of simulated demands
+        '''
+        partTypes = self.partTypes(stores)
+        sizes = self.sizes[partTypes][:, :, None]
+
+        if stream is not None:
+            names = [[store, store + ' 2'][part] for part in range(partTypes.shape[0]) for store in stores]
+            u = np.reshape([stream.uniforms(name, n, start) for name in names], (partTypes.shape[0], len(stores), n))
+            positions = np.minimum((u*sizes).astype(np.intp), sizes - 1)
+        else:
+            randint = np.random.randint if rng is None else rng.integers
+            positions = randint(0, sizes, size = partTypes.shape + (n,))
+
+        draws = self.pool[self.offsets[partTypes][:, :, None] + positions]
+        return np.where(partTypes[:, :, None] >= 0, draws, 0).sum(axis = 0, dtype = self.dtype)
+
+def getDemandSampler(historyFile, weekday, locationsFile = None):
+    '''Returns the DemandSampler of a history file, building it only once per process
+
+    Parameters
+    ----------
+    historyFile: str
+        The csv file of the daily demand history of each store
+    weekday: bool
+        If weekday (Mon-Fri) or Saturday demand is sampled
+    locationsFile: str (optional)
+        The csv file of the type of each store, defaults to WarehouseLocationsUpdated.csv next to the history file
+    '''
+    if locationsFile is None:
+        locationsFile = os.path.join(os.path.dirname(historyFile), 'WarehouseLocationsUpdated.csv')
+    key = (historyFile, locationsFile, weekday)
+    if key not in loadedSamplers:
+        loadedSamplers[key] = DemandSampler(historyFile, locationsFile, weekday)
+    return loadedSamplers[key]
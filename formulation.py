@@ -1,45 +1,224 @@
+import numpy as np
 import pandas as pd
 from pulp import *
+from Routes import RoutePool, RouteLength, PriceRoutes, asTravelMatrix, getOptimalRouteNamesandStores
+from tariff import defaultTariff
+from instrumentation import stage, annotate, tracing
+from solvers import solveModel
 
-def solve_LP(routes, costs, problem):
-    '''Solves the linear program
+def getRouteStoreLists(routes, costs, stores = None):
+    '''Gets the stores visited by each route from a route-store incidence
 
     Parameters
     ----------
-    routes: pd.Dataframe
-        A dataframe containing the possible routes, each column is one route
+    routes: pd.Dataframe, sparse matrix, dict or pd.Series
+        The route-store incidence as either a dataframe with a row per store and a column per route,
+        a scipy CSC (or other sparse) matrix with a row per store and a column per route in the order
+        of costs, or a dict/series of the list of stores visited by each route
     costs: pd.Series
-        A list of the costs associated with each route in the routes dataframe
+        The costs of the routes, the index gives the route names
+    stores: list (optional)
+        The stores that must be visited. Required for a sparse matrix (the store of each row). For
+        store lists, entries not in stores (such as the distribution centres at the ends of the
+        FindStoreSets route lists) are ignored.
+
+    Returns
+    -------
+    stores: list
+        The stores that must be visited once
+    routeStores: dict
+        The stores visited by each route, only the nonzero entries of the incidence
+    '''
+    if isinstance(routes, pd.DataFrame):
+        incidence = routes[costs.index].to_numpy()
+        routeStores = {route: [] for route in costs.index}
+        for s, r in zip(*np.nonzero(incidence)):
+            routeStores[costs.index[r]].append(routes.index[s])
+        return list(routes.index), routeStores
+
+    if hasattr(routes, 'tocsc'):
+        routes = routes.tocsc()
+        routeStores = {}
+        for r, route in enumerate(costs.index):
+            column = slice(routes.indptr[r], routes.indptr[r + 1])
+            routeStores[route] = [stores[s] for s, value in zip(routes.indices[column], routes.data[column]) if value != 0]
+        return list(stores), routeStores
+
+    if stores is None:
+        stores = list(dict.fromkeys(store for route in costs.index for store in routes[route]))
+    keep = set(stores)
+    routeStores = {route: [store for store in routes[route] if store in keep] for route in costs.index}
+    return list(stores), routeStores
+
+def presolveRoutes(routes, costs, stores = None, maxTrucks = 50):
+    '''Finds the routes the set partitioning model needs, dropping duplicate and dominated columns
+
+    Parameters
+    ----------
+    routes: pd.Dataframe, sparse matrix, dict or pd.Series
+        The route-store incidence, see getRouteStoreLists
+    costs: pd.Series
+        The costs of the routes, routes with a "b" in their name are leased trucks
+    stores: list (optional)
+        The stores that must be visited, see getRouteStoreLists
+    maxTrucks: int (optional)
+        The number of truck shifts of the Trucks constraint
+
+    Returns
+    -------
+    kept: pd.Index
+        The names of the routes to keep, in the order of costs
+    report: dict
+        The number of columns before and after and the number dropped for each reason
+
+    Notes
+    -----
+    Columns covering the same store set with the same kind of truck are duplicates, and only the
+    cheapest is kept. An own truck route that costs at least as much as the leased twin of its
+    store set is dominated, as the twin covers the same stores without using a truck shift. When
+    there are no more stores than truck shifts the Trucks constraint can never bind (every route
+    visits a store), so only the cheaper twin of each store set is kept and the twins become one
+    column. None of these change the optimal cost.
+    '''
+    stores, routeStores = getRouteStoreLists(routes, costs, stores)
+
+    # cheapest column of each store set for own and leased trucks
+    cheapest = {}
+    empty = 0
+    for route in costs.index:
+        if len(routeStores[route]) == 0 and costs[route] >= 0:
+            empty += 1
+            continue
+        key = (frozenset(routeStores[route]), 'b' in route)
+        if key not in cheapest or costs[route] < costs[cheapest[key]]:
+            cheapest[key] = route
+
+    # drop the dearer twin, or only the own truck route if the Trucks constraint can bind
+    truckBoundRedundant = len(stores) <= maxTrucks
+    dominated = set()
+    for (storeSet, leased), route in cheapest.items():
+        twin = cheapest.get((storeSet, not leased))
+        if twin is None:
+            continue
+        if leased and truckBoundRedundant and costs[twin] < costs[route]:
+            dominated.add(route)
+        elif not leased and costs[route] >= costs[twin]:
+            dominated.add(route)
+
+    keep = set(cheapest.values()) - dominated
+    kept = pd.Index([route for route in costs.index if route in keep])
+    report = {
+        'columns': len(costs),
+        'kept': len(kept),
+        'empty': empty,
+        'duplicates': len(costs) - empty - len(cheapest),
+        'dominated': len(dominated),
+        'truckBoundRedundant': truckBoundRedundant,
+    }
+    return kept, report
+
+def buildModel(routes, costs, problem, stores = None, relax = False):
+    '''Builds the set partitioning model column by column
+
+    Parameters
+    ----------
+    routes: pd.Dataframe, sparse matrix, dict or pd.Series
+        The route-store incidence, see getRouteStoreLists
+    costs: pd.Series
+        A list of the costs associated with each route
     problem: str
-        Name of the file to write the problem to
+        Name of the problem
+    stores: list (optional)
+        The stores that must be visited, see getRouteStoreLists
+    relax: bool (optional)
+        If the linear relaxation is built, with non-negative continuous routes (the visit
+        constraints already keep them at most 1, so the duals are not split with upper bounds)
 
     Returns
     -------
     prob: puLP problem object
         The problem object
+
+    Notes
+    -----
+    Only the nonzero coefficients of the incidence are emitted, so building the model scales with
+    the number of route-store pairs rather than stores x routes. The visit constraint of the k-th
+    store is named "Visit_k" and the truck constraint "Trucks".
     '''
-    # create variables
-    route_vars=LpVariable.dicts("Choose",costs.index,cat='Binary')
+    stores, routeStores = getRouteStoreLists(routes, costs, stores)
+
+    # create variables, adding each column to the rows of the stores it visits
+    route_vars = {}
+    storeTerms = {store: [] for store in stores}
+    for i in costs.index:
+        if relax:
+            route_vars[i] = LpVariable("Choose_" + str(i), lowBound = 0)
+        else:
+            route_vars[i] = LpVariable("Choose_" + str(i), cat = 'Binary')
+        for store in routeStores[i]:
+            storeTerms[store].append((route_vars[i], 1))
+
+    # a store no route visits makes the problem infeasible
+    unvisited = [store for store in stores if len(storeTerms[store]) == 0]
+    if len(unvisited) != 0:
+        raise ValueError("No route visits " + ", ".join(unvisited))
 
     # create problem
     prob = LpProblem(problem, LpMinimize)
 
-    # objective function 
-    prob += lpSum([route_vars[i]*costs[i]  for i in costs.index]) #need to modify to take care of extra trucks 
+    # objective function
+    prob += LpAffineExpression([(route_vars[i], costs[i]) for i in costs.index]) #need to modify to take care of extra trucks
 
-    # contraints 
+    # contraints
     # each node only gone through once
-    for node in routes.index:
-        prob += lpSum([route_vars[i]*routes.loc[node][i] for i in costs.index]) == 1
+    for k, node in enumerate(stores):
+        prob += LpConstraint(LpAffineExpression(storeTerms[node]), LpConstraintEQ, rhs = 1), "Visit_" + str(k)
 
     # 25 trucks available, 2 shifts
-    prob += lpSum([route_vars[i] for i in costs.index if 'b' not in i]) <= 50
+    prob += LpAffineExpression([(route_vars[i], 1) for i in costs.index if 'b' not in i]) <= 50, "Trucks"
 
-    # write problem 
-    prob.writeLP(problem)
+    return prob
 
-    #Solve LP
-    prob.solve()
+def solve_LP(routes, costs, problem, stores = None, export = None, backend = 'cbc', threads = None, timeLimit = None, gapRel = None, incumbent = None, msg = True):
+    '''Solves the linear program
+
+    Parameters
+    ----------
+    routes: pd.Dataframe, sparse matrix, dict or pd.Series
+        The possible routes, either a dataframe where each column is one route or a sparse
+        route-store incidence (see getRouteStoreLists)
+    costs: pd.Series
+        A list of the costs associated with each route in the routes dataframe
+    problem: str
+        Name of the problem
+    stores: list (optional)
+        The stores that must be visited, needed when routes is a sparse matrix
+    export: str or bool (optional)
+        Writes the problem to this file (to the file named problem if True), see solvers.solveModel
+    backend, threads, timeLimit, gapRel, incumbent, msg: (optional)
+        The solver and its limits, see solvers.solveModel. Only CBC starts from the incumbent, the
+        HiGHS backend ignores it with a warning
+
+    Returns
+    -------
+    prob: puLP problem object
+        The problem object, with the statistics of the solve in prob.solveStats
+
+    Notes
+    -----
+    The default CBC backend is still file based: PuLP writes the model to a temporary MPS file,
+    runs the CBC binary on it and reads the solution back from a temporary solution file (and the
+    incumbent from a temporary start file), on every solve whether or not export is given. Only
+    backend = 'highs' (with highspy installed) keeps the model in memory, so use it where the file
+    round trip matters, such as the repeated solves of solutionPool and solve_columnGeneration.
+    '''
+    with stage('LP build', routes = len(costs)):
+        prob = buildModel(routes, costs, problem, stores)
+        if tracing():
+            annotate(stores = len(prob.constraints) - 1, nonzeros = sum(len(constraint) for constraint in prob.constraints.values()))
+
+    # write problem (only if asked to) and solve it
+    prob.solveStats = solveModel(prob, backend, threads, timeLimit, gapRel, incumbent, problem if export is True else export or None, msg)
 
     #Print objective function value
     print("Minimum cost = ", value(prob.objective))
@@ -58,4 +237,163 @@ def solve_LP(routes, costs, problem):
 
     print(LpStatus[prob.status])
 
-    return prob
\ No newline at end of file
+    return prob
+
+def solutionPool(routesDataFrame, routesCost, routeStores, problem, stores = None, k = 5, maxGap = None, **solverOptions):
+    '''Finds the k cheapest routing schedules by cutting off each one found and solving again
+
+    Parameters
+    ----------
+    routesDataFrame, routesCost, routeStores:
+        The routes, as from FindStoreSets (any route format of buildModel for routesDataFrame)
+    problem: str
+        Name of the problem
+    stores: list (optional)
+        The stores that must be visited, see getRouteStoreLists
+    k: int (optional)
+        The most schedules to find
+    maxGap: float (optional)
+        Stops once a schedule costs more than this fraction over the cheapest
+    **solverOptions:
+        The backend, threads, timeLimit, gapRel and msg of every solve, see solvers.solveModel
+
+    Returns
+    -------
+    plans: list
+        The selected routes of each schedule as from getOptimalRouteNamesandStores, cheapest first
+    objectives: list
+        The cost of each schedule
+
+    Notes
+    -----
+    After each solve the no-good cut "the routes of this schedule are not all chosen again" is
+    added. A schedule that chooses every one of those routes already visits every store once, so
+    the cut removes exactly that schedule. Stops early once there are no schedules left. Run
+    presolveRoutes first, otherwise a schedule that only swaps an own truck route for its leased
+    twin counts as a new schedule.
+    '''
+    solverOptions.setdefault('msg', False)
+    prob = buildModel(routesDataFrame, routesCost, problem, stores)
+    plans = []
+    objectives = []
+    for i in range(k):
+        stats = solveModel(prob, **solverOptions)
+        if stats['status'] != 'Optimal':
+            break
+        if maxGap is not None and len(objectives) != 0 and stats['objective'] > objectives[0]*(1 + maxGap):
+            break
+
+        chosen = [variable for variable in prob.variables() if variable.varValue is not None and variable.varValue > 0.5]
+        plans.append(getOptimalRouteNamesandStores(prob, routesDataFrame, routeStores))
+        objectives.append(stats['objective'])
+
+        # cut off this schedule
+        prob += LpAffineExpression([(variable, 1) for variable in chosen]) <= len(chosen) - 1, "NoGood_" + str(i)
+
+    return plans, objectives
+
+def mergeRoutePools(pools, routeSources, tariff = defaultTariff):
+    '''Merges route pools into the FindStoreSets format
+
+    Parameters
+    ----------
+    pools: list
+        A RoutePool for each route source
+    routeSources: list
+        (distributionCenter, storeDemandEstimates, storeTravelTimes, routeName) for each pool
+    tariff: Tariff (optional)
+        The rates the leased truck routes are costed at
+
+    Returns
+    -------
+    routesDataFrame: pd.Dataframe
+        Dataframe where each column is a route and each row is 1 if the route visits that store
+    routesCost: pd.Series
+        A series of the costs for each route
+    routeStores: pd.Series
+        A series of the ordered list of stores visited by each route
+    '''
+    frames = [pool.toFrames(demand.index, routeName, tariff.leasedCost) for pool, (distributionCenter, demand, travelTimes, routeName) in zip(pools, routeSources)]
+    routesDataFrame = pd.concat([frame[0] for frame in frames], sort = True).fillna(0)
+    routesCost = pd.concat([frame[1] for frame in frames])
+    routeStores = pd.concat([frame[2] for frame in frames])
+    return routesDataFrame, routesCost, routeStores
+
+def solve_columnGeneration(routeSources, problem, maxIterations = 100, maxRoutes = 50, tariff = defaultTariff, solverOptions = None, integer = True):
+    '''Solves the routing problem by generating routes from the duals of the linear relaxation
+
+    Parameters
+    ----------
+    routeSources: list
+        A (distributionCenter, storeDemandEstimates, storeTravelTimes, routeName) tuple for each
+        distribution centre, the same arguments as FindStoreSets
+    problem: str
+        Name of the file to write the final problem to
+    maxIterations: int (optional)
+        The maximum number of times the relaxation is solved
+    maxRoutes: int (optional)
+        The maximum number of routes added per distribution centre each iteration
+    tariff: Tariff (optional)
+        The rates the routes and leased trucks are costed at
+    solverOptions: dict (optional)
+        The backend, threads, timeLimit and gapRel of every solve, see solvers.solveModel
+    integer: bool (optional)
+        If the integer problem is solved over the generated routes, otherwise they are only
+        generated (to be presolved or planned with by the caller)
+
+    Returns
+    -------
+    prob: puLP problem object
+        The solved integer problem, or the last relaxation if integer is False
+    routesDataFrame: pd.Dataframe
+        The generated routes, see FindStoreSets
+    routesCost: pd.Series
+        A series of the costs for each route
+    routeStores: pd.Series
+        A series of the ordered list of stores visited by each route
+
+    Notes
+    -----
+    Starts from a route to each store on its own. Each iteration solves the relaxation, reads the
+    duals of the store visit constraints and the truck constraint, and adds the routes PriceRoutes
+    finds with negative reduced cost. Once there are none left the integer problem is solved over
+    all the generated routes.
+    '''
+    solverOptions = solverOptions or {}
+
+    # start with a route to each store on its own
+    pools = []
+    for distributionCenter, demand, travelTimes, routeName in routeSources:
+        pool = RoutePool()
+        for store in demand.index:
+            route = [distributionCenter, store, distributionCenter]
+            pool.add(route, tariff.routeCost(RouteLength(route, travelTimes, demand.at[store, 'Pallet Demand'])))
+        pools.append(pool)
+
+    # one TravelMatrix per source so visit orders are cached across iterations
+    routeSources = [(distributionCenter, demand, asTravelMatrix(travelTimes), routeName) for distributionCenter, demand, travelTimes, routeName in routeSources]
+    stores = [store for source in routeSources for store in source[1].index]
+
+    for iteration in range(maxIterations):
+        routesDataFrame, routesCost, routeStores = mergeRoutePools(pools, routeSources, tariff)
+
+        # solve the relaxation and get the duals
+        prob = buildModel(routeStores, routesCost, problem, stores, relax = True)
+        solveModel(prob, **solverOptions)
+        duals = {store: prob.constraints["Visit_" + str(k)].pi for k, store in enumerate(stores)}
+        truckDual = prob.constraints["Trucks"].pi
+
+        # add routes with negative reduced cost
+        newRoutes = 0
+        for pool, (distributionCenter, demand, travelTimes, routeName) in zip(pools, routeSources):
+            for route, cost, reducedCost in PriceRoutes(distributionCenter, demand, travelTimes, duals, truckDual, tariff, maxRoutes):
+                newRoutes += pool.add(route, cost)
+
+        if newRoutes == 0:
+            break
+
+    routesDataFrame, routesCost, routeStores = mergeRoutePools(pools, routeSources, tariff)
+    if integer:
+        prob = solve_LP(routeStores, routesCost, problem, stores, **solverOptions)
+
+    return prob, routesDataFrame, routesCost, routeStores
@@ -0,0 +1,156 @@
+# Road geometry of routes for the route maps, cached on disk and fetched concurrently
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class StraightLineBackend:
+    '''Offline backend that joins the stops of a route with straight lines'''
+
+    def directions(self, coords):
+        '''Returns the [Long, Lat] points of the route through coords'''
+        return [list(coord) for coord in coords]
+
+class OpenRouteServiceBackend:
+    '''Backend that gets road geometry from the openrouteservice directions API
+
+    Parameters
+    ----------
+    key: str (optional)
+        The openrouteservice API key
+    profile: str (optional)
+        The openrouteservice routing profile
+    base_url: str (optional)
+        The address of the server, for example a local stand-in server for testing
+    '''
+
+    def __init__(self, key = None, profile = 'driving-hgv', base_url = None):
+        import openrouteservice as ors
+        if base_url is None:
+            self.client = ors.Client(key = key)
+        else:
+            self.client = ors.Client(key = key, base_url = base_url)
+        self.profile = profile
+
+    def directions(self, coords):
+        '''Returns the [Long, Lat] points of the road route through coords'''
+        route = self.client.directions(coordinates = coords, profile = self.profile, format = 'geojson', validate = False)
+        return route['features'][0]['geometry']['coordinates']
+
+class RateLimiter:
+    '''Spaces out calls from any number of threads to at most requestsPerMinute'''
+
+    def __init__(self, requestsPerMinute):
+        self.interval = 60/requestsPerMinute
+        self.nextCall = 0
+        self.lock = threading.Lock()
+
+    def wait(self, cancel = None):
+        '''Blocks until the next call is allowed, returning False if the threading.Event cancel is set first'''
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.nextCall)
+            self.nextCall = start + self.interval
+        if cancel is None:
+            time.sleep(start - now)
+            return True
+        return not cancel.wait(start - now)
+
+class RouteGeometryProvider:
+    '''Gets the geometry of routes through a persistent on-disk cache
+
+    Parameters
+    ----------
+    backend: object (optional)
+        Backend with a directions(coords) method used for cache misses, defaults to straight lines
+    cacheFolder: str (optional)
+        Folder the geometries are kept in, one JSON file per route
+    workers: int (optional)
+        The number of cache misses fetched at once
+    requestsPerMinute: float (optional)
+        The most backend calls made per minute
+    fallback: object (optional)
+        Backend used if the backend fails, so maps still render with no network. Fallback
+        geometries are not cached on disk.
+
+    Notes
+    -----
+    Routes are keyed by their ordered coordinate sequence (and the backend), so re-rendering an
+    unchanged plan makes no backend calls. Once the backend has failed with a fallback set, the
+    provider stops calling it: calls waiting on the rate limiter give up and every later route
+    goes straight to the fallback, so an offline run pays for at most one failed call per
+    worker rather than one per route.
+    '''
+
+    def __init__(self, backend = None, cacheFolder = 'RouteVisuals' + os.sep + '.geometryCache', workers = 4, requestsPerMinute = 40, fallback = None):
+        self.backend = backend if backend is not None else StraightLineBackend()
+        self.cacheFolder = cacheFolder
+        self.workers = workers
+        self.rateLimiter = RateLimiter(requestsPerMinute)
+        self.fallback = fallback
+        self.backendCalls = 0
+        self.backendFailed = threading.Event()
+        self.lock = threading.Lock()
+
+    def cacheFile(self, coords):
+        '''Returns the cache file of a coordinate sequence'''
+        key = json.dumps([type(self.backend).__name__, getattr(self.backend, 'profile', None), [[round(float(value), 7) for value in coord] for coord in coords]])
+        return os.path.join(self.cacheFolder, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def fetch(self, coords):
+        '''Gets the geometry of one route from the backend and caches it'''
+        if self.fallback is not None and self.backendFailed.is_set():
+            return self.fallback.directions(coords)
+        try:
+            if not self.rateLimiter.wait(self.backendFailed if self.fallback is not None else None):
+                return self.fallback.directions(coords)
+            with self.lock:
+                self.backendCalls += 1
+            geometry = self.backend.directions(coords)
+        except Exception:
+            if self.fallback is None:
+                raise
+            self.backendFailed.set()
+            return self.fallback.directions(coords)
+
+        # write to a temporary file first so a failed run never leaves half a geometry
+        cacheFile = self.cacheFile(coords)
+        os.makedirs(self.cacheFolder, exist_ok = True)
+        temporaryFile = cacheFile + '.' + str(threading.get_ident()) + '.tmp'
+        with open(temporaryFile, 'w') as file:
+            json.dump(geometry, file)
+        os.replace(temporaryFile, cacheFile)
+        return geometry
+
+    def getGeometries(self, routeCoords):
+        '''Gets the geometry of each route
+
+        Parameters
+        ----------
+        routeCoords: list
+            A list of the [Long, Lat] coordinates of the stops of each route
+
+        Returns
+        -------
+        geometries: list
+            A list of the [Long, Lat] points of each route, in the same order
+        '''
+        geometries = [None]*len(routeCoords)
+        misses = {}
+        for i, coords in enumerate(routeCoords):
+            cacheFile = self.cacheFile(coords)
+            if os.path.exists(cacheFile):
+                with open(cacheFile) as file:
+                    geometries[i] = json.load(file)
+            else:
+                misses.setdefault(cacheFile, []).append(i)
+
+        # fetch each missing coordinate sequence once, concurrently, and share it between the routes that repeat it
+        with ThreadPoolExecutor(self.workers) as executor:
+            for routes, geometry in zip(misses.values(), executor.map(self.fetch, [routeCoords[routes[0]] for routes in misses.values()])):
+                for i in routes:
+                    geometries[i] = geometry
+
+        return geometries
@@ -0,0 +1,166 @@
+# Opt-in timing and memory instrumentation of the stages of the planning pipeline
+import os
+import json
+import platform
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from time import perf_counter, process_time
+
+# the trace stages are recorded to, None when instrumentation is off
+activeTrace = None
+
+# what stage returns when instrumentation is off, entering it does nothing
+disabledStage = nullcontext()
+
+class Trace:
+    '''A record of the wall time, CPU time, peak memory and sizes of each stage of a run
+
+    Parameters
+    ----------
+    name: str (optional)
+        The name of the run
+    memory: bool (optional)
+        If the peak memory of each stage is tracked with tracemalloc
+
+    Notes
+    -----
+    Stages nest, and each record has the path of the stages it is in ("scenario/simulation/evaluate")
+    so the sub-steps of a stage can be told apart from its own time. Peak memory is the most
+    memory allocated by Python and numpy at once during the stage, including what was allocated
+    before it started (startMB). tracemalloc slows down pure Python code by up to about 2x, so
+    timings are cleaner with memory off. Work done in other processes, like the CBC solver, is
+    only in the wall time.
+    '''
+
+    def __init__(self, name = 'run', memory = True):
+        self.name = name
+        self.memory = memory
+        self.records = []
+        self.stack = []
+        self.started = perf_counter()
+
+    @contextmanager
+    def stage(self, name, **sizes):
+        '''Records a stage run in a with block, see instrumentation.stage'''
+        record = {'stage': name, 'path': '/'.join([parent['stage'] for parent in self.stack] + [name]), 'pid': os.getpid(), 'start': perf_counter() - self.started}
+        record.update(sizes)
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            for parent in self.stack:
+                parent['peakMB'] = max(parent['peakMB'], peak/1e6)
+            tracemalloc.reset_peak()
+            record['startMB'] = record['peakMB'] = current/1e6
+        self.stack.append(record)
+
+        start, cpuStart = perf_counter(), process_time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = perf_counter() - start
+            record['cpuSeconds'] = process_time() - cpuStart
+            if self.memory:
+                record['peakMB'] = max(record['peakMB'], tracemalloc.get_traced_memory()[1]/1e6)
+            self.stack.pop()
+            if self.stack and self.memory:
+                self.stack[-1]['peakMB'] = max(self.stack[-1]['peakMB'], record['peakMB'])
+            self.records.append(record)
+
+    def annotate(self, **sizes):
+        '''Adds sizes, like the number of routes, to the innermost stage'''
+        if self.stack:
+            self.stack[-1].update(sizes)
+
+    def extend(self, records, parent):
+        '''Adds the records of a trace run in another process, nested under the stage parent'''
+        for record in records:
+            self.records.append(dict(record, path = parent + '/' + record['path']))
+
+    def totals(self):
+        '''Returns the number of times, total time and largest peak memory of each stage path'''
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['path'], {'count': 0, 'seconds': 0.0, 'cpuSeconds': 0.0, 'peakMB': None})
+            total['count'] += 1
+            total['seconds'] += record['seconds']
+            total['cpuSeconds'] += record['cpuSeconds']
+            if 'peakMB' in record:
+                total['peakMB'] = max(total['peakMB'] or 0, record['peakMB'])
+        return totals
+
+    def write(self, filename):
+        '''Writes the trace as JSON, with the records in the order the stages finished and their totals'''
+        with open(filename, 'w') as file:
+            json.dump({
+                'name': self.name,
+                'python': platform.python_version(),
+                'machine': platform.platform(),
+                'cpus': os.cpu_count(),
+                'seconds': perf_counter() - self.started,
+                'totals': self.totals(),
+                'stages': self.records,
+            }, file, indent = 1, default = float)
+
+def startTrace(name = 'run', memory = True):
+    '''Turns instrumentation on in this process
+
+    Parameters
+    ----------
+    name: str (optional)
+        The name of the run
+    memory: bool (optional)
+        If the peak memory of each stage is tracked, see Trace
+
+    Returns
+    -------
+    trace: Trace
+        The trace every stage is now recorded to
+    '''
+    global activeTrace
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    activeTrace = Trace(name, memory)
+    return activeTrace
+
+def stopTrace(filename = None):
+    '''Turns instrumentation off in this process, writing the trace to filename if given, and returns the trace'''
+    global activeTrace
+    trace, activeTrace = activeTrace, None
+    if trace is not None and trace.memory:
+        tracemalloc.stop()
+    if trace is not None and filename is not None:
+        trace.write(filename)
+    return trace
+
+def stage(name, **sizes):
+    '''Times a stage of the pipeline in a with block
+
+    Parameters
+    ----------
+    name: str
+        The name of the stage
+    **sizes:
+        Sizes of the problem the stage works on, like routes = 1000
+
+    Returns
+    -------
+    context:
+        A context manager, that does nothing if instrumentation is off
+
+    Notes
+    -----
+    With instrumentation off this is a global lookup and returning a shared context, so stages can
+    be left in the code. Sizes that are costly to work out should be added with annotate inside
+    an "if tracing():".
+    '''
+    if activeTrace is None:
+        return disabledStage
+    return activeTrace.stage(name, **sizes)
+
+def annotate(**sizes):
+    '''Adds sizes to the innermost stage, if instrumentation is on'''
+    if activeTrace is not None:
+        activeTrace.annotate(**sizes)
+
+def tracing():
+    '''Returns if instrumentation is on'''
+    return activeTrace is not None
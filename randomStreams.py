@@ -0,0 +1,59 @@
+# Reproducible random numbers shared between simulations of competing routing schedules
+import zlib
+import numpy as np
+
+class CommonRandomNumbers:
+    '''Named streams of uniform random numbers that give the same values to every routing schedule
+
+    Parameters
+    ----------
+    seed: int
+        The seed of every stream
+    antithetic: bool (optional)
+        If simulations come in pairs, the second using 1 - u wherever the first used u
+
+    Notes
+    -----
+    Each stream is named, for example after the store whose demand it drives, and seeded from the
+    seed and the name alone. So a store sees the same demand in simulation i whichever plan is being
+    simulated and whichever other stores are in it, and the difference in cost between two plans
+    only comes from the plans. The streams are PCG64 generators that are advanced to the first
+    simulation asked for, so a block of simulations gets the same numbers however the run is split
+    into batches.
+    '''
+
+    def __init__(self, seed, antithetic = False):
+        self.seed = seed
+        self.antithetic = antithetic
+
+    def generator(self, name, start = 0):
+        '''Returns the generator of a stream advanced to draw the value of simulation start'''
+        bitGenerator = np.random.PCG64(np.random.SeedSequence(self.seed, spawn_key = (zlib.crc32(name.encode()),)))
+        bitGenerator.advance(start)
+        return np.random.Generator(bitGenerator)
+
+    def uniforms(self, name, n, start = 0):
+        '''Uniform random numbers in [0, 1) of a stream for simulations start to start + n
+
+        Parameters
+        ----------
+        name: str
+            The name of the stream
+        n: int
+            The number of simulations
+        start: int (optional)
+            The first simulation
+
+        Returns
+        -------
+        u: np.array
+            A uniform random number for each simulation
+        '''
+        if not self.antithetic:
+            return self.generator(name, start).random(n)
+
+        # simulations 2k and 2k + 1 share the k-th draw
+        first = start//2
+        u = self.generator(name, first).random((start + n + 1)//2 - first)
+        u = np.stack((u, 1 - u), axis = 1).ravel()
+        return u[start - 2*first:start - 2*first + n]
@@ -0,0 +1,228 @@
+# Constant-memory summaries of simulation output that are updated one batch of simulations at a time
+from statistics import NormalDist
+import numpy as np
+
+class RunningMoments:
+    '''Running count, mean and variance of a stream of values
+
+    Notes
+    -----
+    Batches are combined with the parallel form of Welford's update, so the result does not depend
+    on how the stream was split into batches (up to rounding) and summaries from seperate runs can
+    be merged.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sumSquares = 0.0
+
+    def update(self, values):
+        '''Adds a batch of values'''
+        values = np.asarray(values, dtype = float).ravel()
+        if values.size == 0:
+            return
+        other = RunningMoments()
+        other.count = values.size
+        other.mean = values.mean()
+        other.sumSquares = ((values - other.mean)**2).sum()
+        self.merge(other)
+
+    def merge(self, other):
+        '''Adds the values summarised by another RunningMoments'''
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta*other.count/count
+        self.sumSquares += other.sumSquares + delta**2*self.count*other.count/count
+        self.count = count
+
+    @property
+    def variance(self):
+        '''Sample variance of the values'''
+        return self.sumSquares/(self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        '''Sample standard deviation of the values'''
+        return np.sqrt(self.variance)
+
+    def halfWidth(self, level = 0.95):
+        '''Half-width of the normal confidence interval on the mean'''
+        return NormalDist().inv_cdf(0.5 + level/2)*self.std/np.sqrt(self.count)
+
+    def confidenceInterval(self, level = 0.95):
+        '''Normal confidence interval on the mean'''
+        halfWidth = self.halfWidth(level)
+        return self.mean - halfWidth, self.mean + halfWidth
+
+class QuantileSketch:
+    '''Approximate quantiles of a stream of values in memory that grows with log(count)
+
+    Parameters
+    ----------
+    capacity: int (optional)
+        The number of values each level holds before it is compacted, larger is more accurate
+
+    Notes
+    -----
+    A compactor sketch: level l holds values that each stand for 2**l values of the stream. When a
+    level fills up it is sorted and every second value is moved up a level. The offset alternates
+    between compactions rather than being random, so the sketch is deterministic. The rank error is
+    about count/capacity at worst and much smaller in practice.
+    '''
+
+    def __init__(self, capacity = 4096):
+        self.capacity = capacity
+        self.levels = [np.empty(0)]
+        self.offsets = [0]
+        self.count = 0
+
+    def update(self, values):
+        '''Adds a batch of values'''
+        values = np.asarray(values, dtype = float).ravel()
+        self.count += values.size
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.compact()
+
+    def merge(self, other):
+        '''Adds the values summarised by another QuantileSketch'''
+        self.count += other.count
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+                self.offsets.append(0)
+            self.levels[level] = np.concatenate((self.levels[level], values))
+        self.compact()
+
+    def compact(self):
+        '''Halves every level that is over capacity'''
+        level = 0
+        while level < len(self.levels):
+            if self.levels[level].size > self.capacity:
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                    self.offsets.append(0)
+                values = np.sort(self.levels[level])
+                # an odd value out stays behind so no weight is lost
+                if values.size % 2 == 1:
+                    values, left = values[:-1], values[-1:]
+                else:
+                    left = values[:0]
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], values[self.offsets[level]::2]))
+                self.levels[level] = left
+                self.offsets[level] = 1 - self.offsets[level]
+            level += 1
+
+    def quantile(self, q):
+        '''Approximate q-th quantile (or array of quantiles) of the values'''
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(values.size, 2**level) for level, values in enumerate(self.levels)])
+        order = np.argsort(values, kind = 'stable')
+        rank = np.cumsum(weights[order])
+        position = np.searchsorted(rank, np.asarray(q)*rank[-1], side = 'right')
+        return values[order][np.minimum(position, values.size - 1)]
+
+class StreamingHistogram:
+    '''Counts of a stream of values in fixed-width bins that grow to cover the range seen
+
+    Parameters
+    ----------
+    binWidth: float
+        The width of each bin, 1 for integer counts such as the number of trucks
+    '''
+
+    def __init__(self, binWidth):
+        self.binWidth = binWidth
+        self.first = 0
+        self.counts = np.zeros(0, dtype = np.int64)
+
+    def update(self, values):
+        '''Adds a batch of values'''
+        bins = np.floor(np.asarray(values, dtype = float).ravel()/self.binWidth).astype(np.int64)
+        if bins.size != 0:
+            self.add(bins.min(), np.bincount(bins - bins.min()))
+
+    def merge(self, other):
+        '''Adds the counts of another StreamingHistogram with the same bin width'''
+        if other.counts.size != 0:
+            self.add(other.first, other.counts)
+
+    def add(self, first, counts):
+        '''Adds counts to the bins starting at bin index first'''
+        if self.counts.size == 0:
+            self.first, self.counts = first, counts.astype(np.int64)
+            return
+        start = min(self.first, first)
+        stop = max(self.first + self.counts.size, first + counts.size)
+        grown = np.zeros(stop - start, dtype = np.int64)
+        grown[self.first - start:self.first - start + self.counts.size] += self.counts
+        grown[first - start:first - start + counts.size] += counts
+        self.first, self.counts = start, grown
+
+    @property
+    def edges(self):
+        '''The edges of the bins'''
+        return (self.first + np.arange(self.counts.size + 1))*self.binWidth
+
+class SimulationSummary:
+    '''Constant-memory summary of the costs, trucks and adjusted routes of a stream of simulations
+
+    Parameters
+    ----------
+    costBinWidth: float (optional)
+        The width of the cost histogram bins in dollars
+    capacity: int (optional)
+        The capacity of the quantile sketches
+    '''
+
+    def __init__(self, costBinWidth = 50, capacity = 4096):
+        self.cost = RunningMoments()
+        self.costQuantiles = QuantileSketch(capacity)
+        self.costHistogram = StreamingHistogram(costBinWidth)
+        self.trucks = RunningMoments()
+        self.truckQuantiles = QuantileSketch(capacity)
+        self.truckHistogram = StreamingHistogram(1)
+        self.adjustedRouteHistogram = StreamingHistogram(1)
+
+    @property
+    def count(self):
+        '''The number of simulations summarised'''
+        return self.cost.count
+
+    def update(self, cost, numTrucks, numAdjustedRoutes):
+        '''Adds a batch of simulations, the outputs of simulation.simulateBatch'''
+        self.cost.update(cost)
+        self.costQuantiles.update(cost)
+        self.costHistogram.update(cost)
+        self.trucks.update(numTrucks)
+        self.truckQuantiles.update(numTrucks)
+        self.truckHistogram.update(numTrucks)
+        self.adjustedRouteHistogram.update(numAdjustedRoutes)
+
+    def merge(self, other):
+        '''Adds the simulations summarised by another SimulationSummary'''
+        for name in ['cost', 'costQuantiles', 'costHistogram', 'trucks', 'truckQuantiles', 'truckHistogram', 'adjustedRouteHistogram']:
+            getattr(self, name).merge(getattr(other, name))
+
+def compareSummaries(summary1, summary2, level = 0.95):
+    '''Confidence interval on the difference in mean cost of two independent simulation summaries
+
+    Parameters
+    ----------
+    summary1, summary2: SimulationSummary
+        The summaries to compare
+    level: float (optional)
+        The confidence level
+
+    Returns
+    -------
+    difference: float
+        The mean cost of summary1 minus the mean cost of summary2
+    halfWidth: float
+        The half-width of the (Welch, normal) confidence interval on the difference
+    '''
+    difference = summary1.cost.mean - summary2.cost.mean
+    standardError = np.sqrt(summary1.cost.variance/summary1.count + summary2.cost.variance/summary2.count)
+    return difference, NormalDist().inv_cdf(0.5 + level/2)*standardError
@@ -0,0 +1,378 @@
+# Runs the load -> generate -> solve -> plot -> simulate pipeline for each scenario in a config file
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Routes import *
+from formulation import *
+from simulation import *
+from visuals import *
+from dataset import loadDataset
+from runningStats import SimulationSummary, compareSummaries
+from randomStreams import CommonRandomNumbers
+from tariff import Tariff, defaultTariff
+from instrumentation import stage, annotate, startTrace, stopTrace
+from stochastic import sampleScenarios, expectedRouteCosts
+from traffic import EdgeTraffic
+
+def loadInputs(dataFolder = 'Data'):
+    '''Loads the inputs shared by every scenario
+
+    Parameters
+    ----------
+    dataFolder: str (optional)
+        The folder that contains the data files
+
+    Returns
+    -------
+    inputs: dict
+        The North and South store sets, the Mon-Fri and Sat demand of every store, the travel
+        times between all locations and the name of the locations file
+
+    Notes
+    -----
+    The files are read through dataset.loadDataset, so warm starts skip csv parsing.
+    '''
+    data = loadDataset(dataFolder)
+    North, South = data.storeSets()
+    Mon_to_Fri, Sat = data.demandFrames(pd.concat([North, South]))
+
+    return {
+        'North': North,
+        'South': South,
+        'Mon-Fri': Mon_to_Fri,
+        'Sat': Sat,
+        'travelTimes': data.travelMatrix,
+        'locations': data.locationsFile,
+    }
+
+def getRouteSources(scenario, inputs):
+    '''Gets the FindStoreSets arguments for each open distribution centre of a scenario
+
+    Parameters
+    ----------
+    scenario: dict
+        The scenario from the config file
+    inputs: dict
+        The shared inputs from loadInputs
+
+    Returns
+    -------
+    routeSources: list
+        A (distributionCenter, storeDemandEstimates, storeTravelTimes, routeName) tuple for each
+        open distribution centre
+    stores: pd.Series
+        A series of all the stores with demand in the scenario
+
+    Notes
+    -----
+    With both centres open each store is served from its closer centre, otherwise the open centre
+    serves every store. Stores with no demand on the day are left out.
+    '''
+    demand = inputs[scenario['day']]
+    demand = demand[demand['Pallet Demand'] > 0]
+
+    if len(scenario['centres']) == 1:
+        storeSets = {scenario['centres'][0]: pd.concat([inputs['North'], inputs['South']])}
+    else:
+        storeSets = {'Distribution North': inputs['North'], 'Distribution South': inputs['South']}
+
+    routeSources = []
+    for distributionCenter in scenario['centres']:
+        storeSet = storeSets[distributionCenter]
+        storeSet = storeSet[storeSet.index.isin(demand.index)]
+        routeName = 'Route' if len(scenario['centres']) == 1 else distributionCenter.split()[-1].lower() + 'Route'
+        travelTimes = inputs['travelTimes'].subset(list(storeSet.index) + [distributionCenter])
+        routeSources.append((distributionCenter, demand.loc[storeSet.index], travelTimes, routeName))
+
+    stores = pd.concat([storeSets[distributionCenter] for distributionCenter in scenario['centres']])
+    stores = stores[stores.index.isin(demand.index)]
+    return routeSources, stores
+
+def buildRoutePool(scenarios, inputs, n = 20000):
+    '''Generates the routes of every scenario once, into one SharedRoutePool
+
+    Parameters
+    ----------
+    scenarios: list
+        The scenarios from the config file
+    inputs: dict
+        The shared inputs from loadInputs
+    n: int (optional)
+        The number of random routes drawn for each distribution centre
+
+    Returns
+    -------
+    routePool: SharedRoutePool
+        The routes of every distribution centre, see runScenario
+
+    Notes
+    -----
+    Routes are drawn once for each distribution centre, between every store any scenario has it
+    serve on any day, with no demand. Each scenario then takes the routes that fit its demand with
+    SharedRoutePool.forDemand.
+    '''
+    storeSets = {}
+    for scenario in scenarios:
+        if scenario.get('routes', 'random') != 'random':
+            continue
+        for distributionCenter, demand, travelTimes, routeName in getRouteSources(scenario, inputs)[0]:
+            storeSets.setdefault(distributionCenter, {}).update(dict.fromkeys(demand.index))
+
+    routePool = SharedRoutePool(inputs['travelTimes'])
+    for distributionCenter, stores in storeSets.items():
+        routePool.generate(distributionCenter, stores, n)
+    return routePool
+
+def runScenario(scenario, inputs, seedSequence = None):
+    '''Runs the pipeline for one scenario
+
+    Parameters
+    ----------
+    scenario: dict
+        The scenario from the config file
+    inputs: dict
+        The shared inputs from loadInputs, and optionally the "stream" of common random numbers,
+        the "tariff" of every scenario and the "routePool" the routes are taken from instead of
+        generating them with FindStoreSets
+    seedSequence: np.random.SeedSequence (optional)
+        Seeds the demands and traffic the scenario is simulated with, when there is no "stream"
+        and the scenario has no "simulationSeed"
+
+    Returns
+    -------
+    cost: np.array or SimulationSummary
+        The simulated cost of the optimal routing schedule for each simulation, or the summary of
+        the simulations if the scenario has a "targetHalfWidth", "simulationSeed" or "simulationWorkers"
+    '''
+    routeSources, stores = getRouteSources(scenario, inputs)
+    tariff = Tariff(**scenario['tariff']) if 'tariff' in scenario else inputs.get('tariff', defaultTariff)
+
+    # Get feasible routes for each centre and merge them
+    routeMode = scenario.get('routes', 'random')
+    if routeMode not in ('random', 'parallel', 'columnGeneration'):
+        raise ValueError('Unknown route generation ' + str(routeMode) + ', expected random, parallel or columnGeneration')
+    with stage('routes', stores = len(stores), mode = routeMode):
+        if routeMode == 'columnGeneration':
+            # the routes priced from the duals of the relaxation, the integer problem is solved below
+            prob, routeDataFrame, routeCost, routeStores = solve_columnGeneration(routeSources, scenario['problem'], tariff = tariff, solverOptions = scenario.get('solver'), integer = False)
+        else:
+            if routeMode == 'parallel':
+                routes = [FindStoreSetsParallel(*routeSource, seed = scenario.get('routeSeed', 80), workers = scenario.get('routeWorkers'), tariff = tariff) for routeSource in routeSources]
+            elif 'routePool' in inputs:
+                routes = [inputs['routePool'].forDemand(distributionCenter, demand, routeName, tariff) for distributionCenter, demand, travelTimes, routeName in routeSources]
+            else:
+                routes = [FindStoreSets(*routeSource, tariff = tariff) for routeSource in routeSources]
+            routeDataFrame = pd.concat([route[0] for route in routes], sort = True).fillna(0)
+            routeCost = pd.concat([route[1] for route in routes])
+            routeStores = pd.concat([route[2] for route in routes])
+        annotate(routes = len(routeCost))
+
+    # cost the routes by their average over simulated demand and traffic instead of the demand estimates
+    if scenario.get('planner') == 'saa':
+        with stage('expected costs', routes = len(routeCost), simulations = scenario.get('saaScenarios', 500)):
+            demands, extraTime = sampleScenarios(stores, scenario['day'] == 'Mon-Fri', scenario.get('saaScenarios', 500), scenario.get('saaSeed', 1))
+            routeCost = expectedRouteCosts(routeStores, routeCost, stores, inputs['travelTimes'], demands, extraTime, tariff = tariff)
+
+    # drop duplicate and dominated routes
+    if scenario.get('presolve', True):
+        with stage('presolve', routes = len(routeCost)):
+            kept, report = presolveRoutes(routeStores, routeCost, list(stores.index))
+            routeDataFrame, routeCost, routeStores = routeDataFrame[kept], routeCost[kept], routeStores[kept]
+            annotate(**report)
+        print(scenario['name'], 'presolve kept', report['kept'], 'of', report['columns'], 'routes')
+
+    travelTimes = inputs['travelTimes'].subset(list(stores.index) + scenario['centres'])
+    if scenario.get('solutionPool', 1) > 1:
+        # simulate the cheapest schedules and keep the one that does best
+        with stage('solution pool', routes = len(routeCost)):
+            plans, objectives = solutionPool(routeDataFrame, routeCost, routeStores, scenario['problem'], list(routeDataFrame.index), scenario['solutionPool'], scenario.get('poolGap'), **scenario.get('solver', {}))
+            annotate(plans = len(plans))
+        with stage('rank plans', plans = len(plans), simulations = scenario.get('poolSimulations', 2000)):
+            best, ranking = rankPlans(plans, scenario.get('poolSimulations', 2000), stores, scenario['day'] == 'Mon-Fri', travelTimes, objectives, scenario.get('rankQuantile'),
+                                      scenario.get('simulationSeed', 0), scenario.get('simulationWorkers'), recourse = scenario.get('recourse', 'dropLast'), tariff = tariff)
+        print(scenario['name'], 'plans ranked by simulation')
+        print(ranking.to_string())
+        optimalRouteSeries = plans[best]
+    else:
+        # Solve LP and get optimal routes
+        prob = solve_LP(routeDataFrame, routeCost, scenario['problem'], export = scenario.get('export'), **scenario.get('solver', {}))
+        optimalRouteSeries = getOptimalRouteNamesandStores(prob, routeDataFrame, routeStores)
+
+    # plot routes
+    if scenario.get('plotRoutes', True):
+        with stage('plot routes', routes = len(optimalRouteSeries)):
+            plotStoreRoutes(optimalRouteSeries, inputs['locations'], scenario['name'])
+
+    # sample the traffic of each leg of the schedule by shift instead of one extra time per hour
+    traffic = None
+    if scenario.get('edgeTraffic'):
+        options = dict(scenario['edgeTraffic']) if isinstance(scenario['edgeTraffic'], dict) else {}
+        trafficFile, trafficSeed = options.pop('file', None), options.pop('seed', scenario.get('simulationSeed', 0))
+        options.setdefault('overflowLegs', recoursePolicies[scenario.get('recourse', 'dropLast')].overflowLegs)
+        with stage('edge traffic', simulations = scenario['nSimulations'], routes = len(optimalRouteSeries)):
+            traffic = EdgeTraffic(travelTimes, optimalRouteSeries, scenario['day'] == 'Mon-Fri', locationsFile = inputs['locations'], **options)
+            traffic.sample(scenario['nSimulations'], trafficFile, trafficSeed)
+            annotate(legs = len(traffic))
+
+    # Run Simulation
+    rng = None if seedSequence is None else np.random.default_rng(seedSequence)
+    try:
+        with stage('simulation', simulations = scenario['nSimulations'], routes = len(optimalRouteSeries)):
+            if 'targetHalfWidth' in scenario:
+                return runSimulationStreaming(optimalRouteSeries, scenario['nSimulations'], stores, scenario['day'] == 'Mon-Fri', travelTimes, scenario['colour'], scenario['name'], targetHalfWidth = scenario['targetHalfWidth'],
+                                              stream = inputs.get('stream'), recourse = scenario.get('recourse', 'dropLast'), tariff = tariff, rng = rng, traffic = traffic)
+            cost = runSimulation(optimalRouteSeries, scenario['nSimulations'], stores, scenario['day'] == 'Mon-Fri', travelTimes, scenario['colour'], scenario['name'], stream = inputs.get('stream'),
+                                 seed = scenario.get('simulationSeed'), workers = scenario.get('simulationWorkers'), recourse = scenario.get('recourse', 'dropLast'), tariff = tariff, traffic = traffic, rng = rng)
+    finally:
+        # delete the sampled traffic unless it was written to a file of the config's
+        if traffic is not None:
+            traffic.close()
+
+    return cost if isinstance(cost, SimulationSummary) else cost.to_numpy()
+
+def summariseCosts(cost):
+    '''Returns a SimulationSummary of the costs of a scenario that was not streamed'''
+    summary = SimulationSummary()
+    summary.cost.update(cost.to_numpy())
+    return summary
+
+# inputs of each scenario worker process, set once by initScenarioWorker
+scenarioWorkerInputs = {}
+
+def initScenarioWorker(inputs):
+    '''Gives a scenario worker process the shared inputs'''
+    scenarioWorkerInputs.update(inputs)
+
+def runScenarioWorker(scenario, seedSequence = None):
+    '''Runs a scenario in a worker process, see runScenario
+
+    Returns
+    -------
+    result: np.array or SimulationSummary
+        What runScenario returned
+    records: list
+        The stage records of the scenario if the inputs have a "trace", otherwise None
+    '''
+    if not scenarioWorkerInputs.get('trace'):
+        return runScenario(scenario, scenarioWorkerInputs, seedSequence), None
+
+    startTrace(scenario['name'], scenarioWorkerInputs['trace'] == 'memory')
+    try:
+        with stage('scenario'):
+            result = runScenario(scenario, scenarioWorkerInputs, seedSequence)
+    finally:
+        records = stopTrace().records
+    return result, records
+
+def runScenarios(configFile, workers = None, traceFile = None):
+    '''Runs every scenario in a config file in parallel and compares them once both sides finish
+
+    Parameters
+    ----------
+    configFile: str
+        Name of the JSON config file
+    workers: int (optional)
+        The number of worker processes, defaults to the number of scenarios
+    traceFile: str (optional)
+        Writes a JSON trace of the wall time, CPU time, peak memory and sizes of every stage of
+        every scenario to this file, see instrumentation.Trace
+
+    Returns
+    -------
+    costs: dict
+        The simulated costs of each scenario
+
+    Notes
+    -----
+    The config file has a list of "scenarios", each with a "name", "day" ("Mon-Fri" or "Sat"),
+    "centres" (the open distribution centres), "problem" (the name of the problem), "colour" and
+    "nSimulations", and optionally "routes" ("random" takes them from the shared route pool or
+    FindStoreSets, "parallel" draws them with FindStoreSetsParallel from "routeSeed" over
+    "routeWorkers" processes, "columnGeneration" prices them from the duals of the relaxation with
+    formulation.solve_columnGeneration), "export" (true writes the problem to the file named "problem",
+    or give a .lp or .mps file name), "solver" (the "backend", "threads", "timeLimit" and "gapRel"
+    of the solve, see solvers.solveModel), "presolve" (false solves with every generated route
+    instead of the ones presolveRoutes keeps), "planner" ("saa" chooses the routes with the least
+    average cost, recourse included, over "saaScenarios" simulated days drawn with "saaSeed", see
+    stochastic.solve_SAA), "solutionPool" (simulates this many of the cheapest schedules, found by
+    formulation.solutionPool within "poolGap", with "poolSimulations" each and keeps the one with the
+    least mean cost, or "rankQuantile" of the cost, see simulation.rankPlans), "plotRoutes", "targetHalfWidth" (streams the simulations in
+    constant memory, stopping once the confidence interval on the mean cost is this narrow, with
+    nSimulations as the limit) and "simulationSeed" or "simulationWorkers" (runs the simulations
+    with simulateParallel) and "recourse" (the recourse policy for routes over 20 pallets, see
+    simulation.recoursePolicies) and "tariff" (the Tariff rates, overriding a top-level "tariff" that
+    applies to every scenario) and "edgeTraffic" (true, or the options of traffic.EdgeTraffic with
+    a "file" to keep the samples in and their "seed", simulates the traffic of every leg by shift). "comparisons" is a list of pairs of scenario names
+    that are compared with twoSample_t_test as soon as both have finished. The inputs are loaded
+    once and shared with every worker.
+
+    With a "seed" every scenario is simulated with the same CommonRandomNumbers (antithetic if
+    "antithetic" is true), so the same simulation sees the same demands and traffic in every
+    scenario and comparisons use pairedComparison instead. Otherwise every scenario draws from its
+    own generator, spawned from "scenarioSeed" (fresh entropy if it is not given), so the worker
+    processes don't all repeat the random state they were forked with and the costs compared with
+    twoSample_t_test are independent.
+
+    The routes of every scenario are generated once into a SharedRoutePool (see buildRoutePool)
+    and each scenario takes the ones that fit its demand, unless "sharedRoutes" is false in the
+    config file, which generates them for each scenario with FindStoreSets.
+
+    The trace file can also be set by a "trace" in the config file, and "traceMemory" (default
+    true) sets if the peak memory of each stage is tracked. Without a trace file the stages are
+    not recorded at all.
+    '''
+    with open(configFile) as file:
+        config = json.load(file)
+    scenarios = {scenario['name']: scenario for scenario in config['scenarios']}
+    comparisons = [tuple(comparison) for comparison in config.get('comparisons', [])]
+
+    traceFile = traceFile or config.get('trace')
+    trace = startTrace(os.path.basename(configFile), config.get('traceMemory', True)) if traceFile else None
+
+    with stage('load'):
+        inputs = loadInputs(config.get('dataFolder', 'Data'))
+    if config.get('sharedRoutes', True):
+        with stage('route pool'):
+            inputs['routePool'] = buildRoutePool(config['scenarios'], inputs)
+    if trace is not None:
+        inputs['trace'] = 'memory' if trace.memory else 'time'
+    if 'seed' in config:
+        inputs['stream'] = CommonRandomNumbers(config['seed'], config.get('antithetic', False))
+    if 'tariff' in config:
+        inputs['tariff'] = Tariff(**config['tariff'])
+
+    # an independent generator for each scenario, in the order of the config file
+    seedSequences = dict(zip(scenarios, np.random.SeedSequence(config.get('scenarioSeed')).spawn(len(scenarios))))
+
+    costs = {}
+    with ProcessPoolExecutor(workers or len(scenarios), initializer = initScenarioWorker, initargs = (inputs,)) as executor:
+        futures = {executor.submit(runScenarioWorker, scenario, seedSequences[name]): name for name, scenario in scenarios.items()}
+        for future in as_completed(futures):
+            result, records = future.result()
+            costs[futures[future]] = result if isinstance(result, SimulationSummary) else pd.Series(result)
+            if records is not None:
+                trace.extend(records, futures[future])
+
+            # run the t-tests that now have both sides
+            for comparison in [comparison for comparison in comparisons if all(name in costs for name in comparison)]:
+                print(comparison[0], 'vs', comparison[1])
+                if any(isinstance(costs[name], SimulationSummary) for name in comparison):
+                    summaries = [costs[name] if isinstance(costs[name], SimulationSummary) else summariseCosts(costs[name]) for name in comparison]
+                    difference, halfWidth = compareSummaries(*summaries)
+                    print(difference, '+-', halfWidth)
+                elif 'stream' in inputs:
+                    pairedComparison(costs[comparison[0]], costs[comparison[1]], inputs['stream'].antithetic)
+                else:
+                    twoSample_t_test(costs[comparison[0]], costs[comparison[1]])
+                comparisons.remove(comparison)
+
+    if trace is not None:
+        stopTrace(traceFile)
+
+    return costs
+
+if __name__ == '__main__':
+    runScenarios(sys.argv[1] if len(sys.argv) > 1 else 'scenarios.json')
@@ -7,8 +7,15 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import statistics
 import statsmodels.stats.weightstats as sms
-
-def getSimulatedDemands(stores, filepath, n, week):
+from Routes import asTravelMatrix
+from concurrent.futures import ProcessPoolExecutor
+from runningStats import SimulationSummary, RunningMoments
+from tariff import defaultTariff
+from demandSampler import getDemandSampler
+from randomStreams import CommonRandomNumbers
+from instrumentation import stage
+
+def getSimulatedDemands(stores, filepath, n, week, stream = None, start = 0, rng = None):
 	'''Creates demand estimates from bootstrap sampling
 
 	Parameters
@@ -21,6 +28,12 @@ def getSimulatedDemands(stores, filepath, n, week):
 		The number of simulated demands to generate for each store
 	weekday: bool
 		If weekend or weekday demand simulations are wanted
+	stream: CommonRandomNumbers (optional)
+		Shared random numbers to draw from, otherwise the global np.random state is used
+	start: int (optional)
+		The first simulation drawn from stream
+	rng: np.random.Generator (optional)
+		The generator to draw from instead of the global np.random state, when there is no stream
 
 	Returns
 	--------
@@ -29,46 +42,15 @@ def getSimulatedDemands(stores, filepath, n, week):
 
 	Notes
 	----
+	Draws through demandSampler.DemandSampler, which is built once per file and takes the type of
+	each store from the Type column of WarehouseLocationsUpdated.csv next to filepath. With a stream
+	each store draws from its own named streams, so it gets the same demands in every routing
+	schedule simulated with that stream.
 	'''
-	# read in demand data
-	demandData = np.genfromtxt(filepath, skip_header=1,delimiter=',')[:,1:]
-	
-	# extract relevant demand data 
-	if (week):
-		weekday = np.array([0,1,2,3,4,7,8,9,10,11,14,15,16,17,18,21,22,23,24,25])
-		noelLeemingDemand = demandData[0:20,weekday].flatten()
-		warehouseDemand = demandData[20:,weekday].flatten()
-	else:
-		weekend = np.array([5,6,12,13,19,20,26,27])
-		noelLeemingDemand = demandData[0:20,weekend].flatten()
-		warehouseDemand = demandData[20:,weekend].flatten()
-
-	simulatedDemands = []
-	# simulate demand for each store
-	for store in stores.index:
-		if (store == 'Noel Leeming Grouped Stores'):
-			simulatedDemand = [noelLeemingDemand[i] for i in np.random.randint(0,len(noelLeemingDemand),size = n)] 
-			simulatedDemand2 = [noelLeemingDemand[i] for i in np.random.randint(0,len(noelLeemingDemand),size = n)]
-			simulatedDemands.extend(np.copy([sum(i) for i in zip(simulatedDemand,simulatedDemand2)]))
-		elif (store[0:4] == 'Noel'):
-			simulatedDemand = [noelLeemingDemand[i] for i in np.random.randint(0,len(noelLeemingDemand),size = n)] 
-			simulatedDemands.extend(np.copy(simulatedDemand))
-
-		elif (store[0:3] == 'The'):
-			simulatedDemand = [warehouseDemand[i] for i in np.random.randint(0,len(warehouseDemand),size = n)]
-			simulatedDemands.extend(np.copy(simulatedDemand))
-		else:
-			simulatedDemand = [warehouseDemand[i] for i in np.random.randint(0,len(warehouseDemand),size = n)] 
-			simulatedDemand2 = [noelLeemingDemand[i] for i in np.random.randint(0,len(noelLeemingDemand),size = n)] 
-			simulatedDemands.extend(np.copy([sum(i) for i in zip(simulatedDemand,simulatedDemand2)]))
+	sampler = getDemandSampler(filepath, week)
+	return pd.DataFrame(sampler.sample(list(stores.index), n, rng, stream, start), index = stores.index)
 
-	# store simulated demands in pandas DataFrame
-	simulatedDemands = np.reshape(simulatedDemands, (stores.size, -1))  
-	demandsDF = pd.DataFrame(simulatedDemands, index = stores.index)
-
-	return demandsDF
-
-def getSimulatedTime(n,weekday):
+def getSimulatedTime(n,weekday, stream = None, start = 0, rng = None):
 	'''
 	Returns the random extra time per hour of trip 
 
@@ -78,6 +60,12 @@ def getSimulatedTime(n,weekday):
 		number of simulations
 	weekday : boolean 
 		If the simulation is done for weekday then True, otherwise, False
+	stream: CommonRandomNumbers (optional)
+		Shared random numbers to draw from, otherwise the global np.random state is used
+	start: int (optional)
+		The first simulation drawn from stream
+	rng: np.random.Generator (optional)
+		The generator to draw from instead of the global np.random state, when there is no stream
 	
 	------------ 
 	Returns:
@@ -91,10 +79,16 @@ def getSimulatedTime(n,weekday):
 			
 	'''
 
+	if stream is not None:
+		# same integers as randint, by inversion so antithetic pairs are negatively correlated
+		return 20 + (stream.uniforms('traffic', n, start)*(40 if weekday else 20)).astype(int)
+
+	randint = np.random.randint if rng is None else rng.integers
+
 	if weekday:
-		extraTime=np.random.randint(20,60,size = n) #40 mins on avarage 
+		extraTime=randint(20,60,size = n) #40 mins on avarage 
 	else:
-		extraTime=np.random.randint(20,40,size = n) #looking at the table on the website, the range can be estimated to be abour 20-40 mins per hour
+		extraTime=randint(20,40,size = n) #looking at the table on the website, the range can be estimated to be abour 20-40 mins per hour
 
 	return extraTime
 
@@ -147,7 +141,7 @@ def simulateDemand(routes, simulatedDemands):
 		for stores in routes.values:
 			demand = 0
 			for store in stores[1:-1]:
-				demand += simulatedDemands[i][store]
+				demand += float(simulatedDemands[i][store])
 			demands.append(demand)
 				
 		if i == 0:
@@ -256,7 +250,7 @@ def calculateTime(adjustedRoutes,leftOutStores,extraTime,travelTime,adjustedRout
 		stores that are left out due to total demand over 20
 	extraTime: np.array 
 		array of extra time in minutes per hour of trip
-	travelTime: pd.DataFrame
+	travelTime: pd.DataFrame or TravelMatrix
 		travel time between stores 
 	adjustedRoutesDemands: pd.DataFrame
 		Total demands of adjusted routes with no routes more than 20 pallets
@@ -293,6 +287,8 @@ def calculateTime(adjustedRoutes,leftOutStores,extraTime,travelTime,adjustedRout
 	{'Distribution Centre, Store1': time1, 'Distribution Centre, Store2': time2, 'Distribution Centre, Store3': time3, ...}
 	with time is the time taken to travel from Distribution Centre to the route and back to Distribution Centre including time to move the pallets 
 	'''
+	travelTime = asTravelMatrix(travelTime)
+
 	#Make a copy 
 	adjustedRoutesTime=adjustedRoutes.copy() #time for adjusted routes 
 	leftOutStoresTime=leftOutStores.copy() #time for left out stores 
@@ -312,13 +308,13 @@ def calculateTime(adjustedRoutes,leftOutStores,extraTime,travelTime,adjustedRout
 
 			#Calculate travel time
 			for store1,store2 in zip(adjustedRoutes.at[route,i][0:],adjustedRoutes.at[route,i][1:]):
-				time += travelTime.at[store1,store2]
+				time += travelTime.duration(store1,store2)
 			
 			#Calculate extra time due to traffic
 			time += time/3600*extraTime[i]*60
 
 			#Pallets moving time 
-			time += adjustedRoutesDemands.at[route,i]*600
+			time += float(adjustedRoutesDemands.at[route,i])*600
 
 			#Convert time to hours and assign 
 			adjustedRoutesTime.at[route,i]=time/3600
@@ -338,7 +334,7 @@ def calculateTime(adjustedRoutes,leftOutStores,extraTime,travelTime,adjustedRout
 
 				#calculate and add travel time into time
 				for store1,store2 in zip(route[0:],route[1:]):
-					time += travelTime.at[store1,store2]
+					time += travelTime.duration(store1,store2)
 				
 				#2 trucks for demand over 20, then double the time
 				if leftOutStores[i][store] > 20:
@@ -349,7 +345,7 @@ def calculateTime(adjustedRoutes,leftOutStores,extraTime,travelTime,adjustedRout
 				time += time/3600*extraTime[i]*60
 
 				#pallets moving time, not affected by traffic 
-				time += leftOutStores[i][store]*600 
+				time += float(leftOutStores[i][store])*600 
 
 				#Convert time to hours and assign 
 				leftOutStoresTime[i][store]=time/3600
@@ -359,7 +355,7 @@ def calculateTime(adjustedRoutes,leftOutStores,extraTime,travelTime,adjustedRout
 
 	return adjustedRoutesTime,leftOutStoresTime,numTrucks
 
-def calculateCost(adjustedRoutesTime,leftOutStoresTime):
+def calculateCost(adjustedRoutesTime,leftOutStoresTime, tariff = defaultTariff):
 	'''
 	returns the total cost of model for each simulation
 
@@ -369,6 +365,8 @@ def calculateCost(adjustedRoutesTime,leftOutStoresTime):
 		time of adjusted routes with no routes more than 20 pallets
 	leftOutStoresTime: pd.Series
 		time of trips to stores that are left out due to total demand over 20
+	tariff: Tariff (optional)
+		The rates trucks are paid at
 	
 	----------
 	Returns: 
@@ -406,39 +404,560 @@ def calculateCost(adjustedRoutesTime,leftOutStoresTime):
 	#Make a copy
 	costDataFrame=leftOutStoresTime.copy()
 
-	#Loop through all simulations
-	for i in adjustedRoutesTime.columns:
-		#reset cost
-		cost = 0 
-
-		#Loop through all routes
-		for j in adjustedRoutesTime.index:
-			#if time is over 4 hours
-			if adjustedRoutesTime.at[j,i] >= 4:
-				#consider extra costs
-				cost += (adjustedRoutesTime.at[j,i]-4)*250 + 175*4
-			else: 
-				#normal cost 175 per hour
-				cost += adjustedRoutesTime.at[j,i]*175
-		
-		#Check if there are no left out stores
-		if len(leftOutStoresTime[i]) !=0:
-			#Loop through all left out stores 
-			for j in leftOutStoresTime[i].keys():
-				#assign time
-				time=leftOutStoresTime[i][j]
-
-				#check if time is over 4 hours
-				if time >= 4:
-					cost += (time-4)*250 + 175*4
-				else: 
-					#normal cost 175 dollars per hour
-					cost += time * 175
-		#Assign time
-		costDataFrame[i]=cost
+	#Cost every route of every simulation at once, then add each simulation's left out store trips
+	routesCost = tariff.cost(adjustedRoutesTime.to_numpy(dtype = float)).sum(axis = 0)
+	for k, i in enumerate(adjustedRoutesTime.columns):
+		costDataFrame[i] = routesCost[k] + np.sum(tariff.cost(np.fromiter(leftOutStoresTime[i].values(), dtype = float)))
 
 	return costDataFrame
 
+def getRouteArrays(routes, travelTime, storeIndex):
+	'''Packs the selected routes into dense arrays for the batched simulation engine
+
+	Parameters
+	----------
+	routes: pd.Series
+		A series of routes and the ordered stores visited by each route (distribution centre first and last)
+	travelTime: pd.DataFrame or TravelMatrix
+		travel time between stores
+	storeIndex: pd.Index
+		The order of the stores in the rows of the simulated demand matrix
+
+	Returns
+	-------
+	routeStores: np.array
+		routes x maxStores array of store rows visited by each route, padded with -1
+	closedTime: np.array
+		routes x (maxStores + 1) array where element [r,p] is the travel time in seconds of route r
+		when only its first p stores are visited before returning to the distribution centre
+	outAndBack: np.array
+		routes x maxStores array of the travel time in seconds from the distribution centre to
+		each store of the route and back again
+
+	Notes
+	-----
+	closedTime and outAndBack are all the adjustRoutes and calculateTime logic needs to know about the
+	travel times, so they only have to be looked up once per route instead of once per simulation.
+	'''
+	travelTime = asTravelMatrix(travelTime)
+	maxStores = max(len(stores) - 2 for stores in routes.values)
+	routeStores = np.full((routes.size, maxStores), -1, dtype = np.intp)
+	closedTime = np.zeros((routes.size, maxStores + 1))
+	outAndBack = np.zeros((routes.size, maxStores))
+
+	for r, stores in enumerate(routes.values):
+		depot = stores[0]
+		travelled = 0
+		for p, store in enumerate(stores[1:-1]):
+			routeStores[r, p] = storeIndex.get_loc(store)
+			travelled += travelTime.duration(stores[p], store)
+			closedTime[r, p + 1] = travelled + travelTime.duration(store, depot)
+			outAndBack[r, p] = travelTime.duration(depot, store) + travelTime.duration(store, depot)
+
+		# stores past the end of a route are never kept, pad with the full route time
+		closedTime[r, len(stores) - 1:] = closedTime[r, len(stores) - 2]
+
+	return routeStores, closedTime, outAndBack
+
+def getRouteEdgeArrays(routes, travelTime, edgeIndex, routeShifts):
+	'''Packs the legs of the selected routes into arrays of traffic columns for edgeRouteTimes
+
+	Parameters
+	----------
+	routes: pd.Series
+		A series of routes and the ordered stores visited by each route (distribution centre first and last)
+	travelTime: pd.DataFrame or TravelMatrix
+		travel time between stores
+	edgeIndex: dict
+		The traffic column of each (from, to, shift) leg, see traffic.EdgeTraffic
+	routeShifts: pd.Series
+		The shift of each route
+
+	Returns
+	-------
+	legEdges: np.array
+		routes x maxStores x 3 array of the traffic columns of the leg to the store at each position
+		of each route, of the leg from that store back to the distribution centre, and of the leg
+		from the distribution centre out to that store
+	legTime: np.array
+		routes x maxStores x 3 array of the travel times in seconds of those legs without traffic
+
+	Notes
+	-----
+	Past the end of a route there is nothing more to travel, but the return leg of its last store
+	is repeated so edgeRouteTimes pads closedTime with the full route time like getRouteArrays.
+	'''
+	travelTime = asTravelMatrix(travelTime)
+	maxStores = max(len(stores) - 2 for stores in routes.values)
+	legEdges = np.zeros((routes.size, maxStores, 3), dtype = np.intp)
+	legTime = np.zeros((routes.size, maxStores, 3))
+
+	for r, (name, stores) in enumerate(routes.items()):
+		depot, shift = stores[0], routeShifts[name]
+		for p, store in enumerate(stores[1:-1]):
+			for leg, (origin, destination) in enumerate(((stores[p], store), (store, depot), (depot, store))):
+				legEdges[r, p, leg] = edgeIndex[(origin, destination, shift)]
+				legTime[r, p, leg] = travelTime.duration(origin, destination)
+
+		last = len(stores) - 3
+		legEdges[r, last + 1:, 1] = legEdges[r, last, 1]
+		legTime[r, last + 1:, 1] = legTime[r, last, 1]
+
+	return legEdges, legTime
+
+def edgeRouteTimes(legEdges, legTime, factors):
+	'''Travel times of the routes in each simulation from the traffic factor of every leg
+
+	Parameters
+	----------
+	legEdges, legTime: np.array
+		Leg arrays from getRouteEdgeArrays
+	factors: np.array
+		n x legs array of the multiplier of the travel time of each leg, such as a slice of
+		traffic.EdgeTraffic.samples
+
+	Returns
+	-------
+	closedTime: np.array
+		routes x (maxStores + 1) x n array, closedTime of getRouteArrays in each simulation
+	outAndBack: np.array
+		routes x maxStores x n array, outAndBack of getRouteArrays in each simulation
+
+	Notes
+	-----
+	Only the columns of the legs of the routes are read from factors, so a memory mapped sample is
+	never loaded whole.
+	'''
+	nRoutes, maxStores = legEdges.shape[:2]
+	times = legTime[..., None]*np.moveaxis(np.take(factors, legEdges.ravel(), axis = 1), 0, -1).reshape(nRoutes, maxStores, 3, -1)
+
+	closedTime = np.zeros((nRoutes, maxStores + 1, times.shape[-1]))
+	closedTime[:, 1:] = np.cumsum(times[:, :, 0], axis = 1) + times[:, :, 1]
+	return closedTime, times[:, :, 2] + times[:, :, 1]
+
+def routeCost(time, tariff = defaultTariff):
+	'''Vectorized piecewise cost of routes
+
+	Parameters
+	----------
+	time: np.array
+		time of each route in hours, any shape
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+
+	Returns
+	-------
+	cost: np.array
+		cost of each route, by default $175 per hour for the first 4 hours and $250 per hour after that
+	'''
+	return tariff.cost(time)
+
+def overflowRoutes(routeStores, demands):
+	'''Finds the stores each route keeps when its demand is over 20 pallets
+
+	Parameters
+	----------
+	routeStores: np.array
+		Route stores from getRouteArrays
+	demands: np.array
+		stores x n array of simulated store demands
+
+	Returns
+	-------
+	positionDemand: np.array
+		routes x maxStores x n array of the demand at each position of each route
+	kept: np.array
+		routes x n array of the number of stores kept, the longest prefix of the route that fits on the truck
+	keptDemand: np.array
+		routes x n array of the demand of the kept stores
+	dropped: np.array
+		routes x maxStores x n array of if the store at each position is dropped
+	overflow: np.array
+		routes x n array of if the route went over 20 pallets
+	'''
+	maxStores = routeStores.shape[1]
+	visited = routeStores >= 0
+
+	# compact integer demands are widened so the pallet times can't overflow
+	demands = demands.astype(np.promote_types(demands.dtype, np.int64), copy = False)
+
+	# demand at each position of each route, routes x maxStores x n
+	positionDemand = demands[np.where(visited, routeStores, 0)]
+	positionDemand[~visited] = 0
+	cumulativeDemand = np.cumsum(positionDemand, axis = 1)
+	routeDemand = cumulativeDemand[:, -1, :]
+	overflow = routeDemand > 20
+
+	# stores kept are the longest prefix of the route that fits on the truck
+	numStores = visited.sum(axis = 1)[:, None]
+	kept = np.where(overflow, (cumulativeDemand <= 20).sum(axis = 1), numStores)
+	keptDemand = np.where(overflow, np.take_along_axis(np.concatenate((np.zeros_like(cumulativeDemand[:, :1, :]), cumulativeDemand), axis = 1), kept[:, None, :], axis = 1)[:, 0, :], routeDemand)
+	dropped = visited[:, :, None] & (np.arange(maxStores)[None, :, None] >= kept[:, None, :])
+
+	return positionDemand, kept, keptDemand, dropped, overflow
+
+def keptTravel(closedTime, kept):
+	'''Travel time of each route with only its kept stores, closedTime may have a simulation axis as from edgeRouteTimes'''
+	if closedTime.ndim == 3:
+		return np.take_along_axis(closedTime, kept[:, None, :], axis = 1)[:, 0, :]
+	return closedTime[np.arange(closedTime.shape[0])[:, None], kept]
+
+def routeBatchCosts(routeStores, closedTime, outAndBack, demands, extraTime, tariff = defaultTariff):
+	'''Simulates each route of a batch of simulations on its own, the drop last recourse of simulateBatch
+
+	Parameters
+	----------
+	routeStores, closedTime, outAndBack: np.array
+		Route arrays from getRouteArrays, the routes may share stores. closedTime and outAndBack
+		may instead have the travel times of each simulation, as from edgeRouteTimes
+	demands: np.array
+		stores x n array of simulated store demands
+	extraTime: np.array
+		array of extra time in minutes per hour of trip for each of the n simulations, 0 if the
+		traffic is already in closedTime and outAndBack
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+
+	Returns
+	-------
+	routeCost: np.array
+		routes x n array of the cost of each route cut back to 20 pallets
+	leftOutCost: np.array
+		routes x n array of the cost of sending the stores dropped from each route out on their own trucks
+	leftOutTrucks: np.array
+		routes x n array of the number of trucks those stores need
+	overflow: np.array
+		routes x n array of if the route went over 20 pallets
+	'''
+	positionDemand, kept, keptDemand, dropped, overflow = overflowRoutes(routeStores, demands)
+
+	traffic = 1 + extraTime/60
+	routeTime = (keptTravel(closedTime, kept)*traffic + keptDemand*600)/3600
+
+	# every dropped store is an out and back trip on its own truck
+	if outAndBack.ndim == 2:
+		outAndBack = outAndBack[:, :, None]
+	doubled = dropped & (positionDemand > 20)
+	leftOutTime = (outAndBack*(1 + doubled)*traffic + positionDemand*600)/3600
+
+	leftOutCost = np.where(dropped, tariff.cost(leftOutTime), 0).sum(axis = 1)
+	return tariff.cost(routeTime), leftOutCost, dropped.sum(axis = 1) + doubled.sum(axis = 1), overflow
+
+def simulateBatch(routeStores, closedTime, outAndBack, demands, extraTime, tariff = defaultTariff):
+	'''Simulates the cost of a routing schedule for a batch of simulations at once
+
+	Parameters
+	----------
+	routeStores, closedTime, outAndBack: np.array
+		Route arrays from getRouteArrays, or with the travel times of each simulation, see routeBatchCosts
+	demands: np.array
+		stores x n array of simulated store demands
+	extraTime: np.array
+		array of extra time in minutes per hour of trip for each of the n simulations
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+
+	Returns
+	-------
+	cost: np.array
+		total cost of the routing schedule for each simulation
+	numTrucks: np.array
+		number of trucks needed for each simulation
+	numAdjustedRoutes: np.array
+		number of routes that went over 20 pallets in each simulation
+
+	Notes
+	-----
+	Gives the same results as simulateDemand, adjustRoutes, calculateTime and calculateCost. Overflowing
+	routes drop stores from the end until they are back under 20 pallets and each dropped store gets
+	its own truck (two if it needs more than 20 pallets by itself).
+	'''
+	routeCost, leftOutCost, leftOutTrucks, overflow = routeBatchCosts(routeStores, closedTime, outAndBack, demands, extraTime, tariff)
+
+	cost = routeCost.sum(axis = 0) + leftOutCost.sum(axis = 0)
+	numTrucks = routeStores.shape[0] + leftOutTrucks.sum(axis = 0)
+	numAdjustedRoutes = overflow.sum(axis = 0)
+
+	return cost, numTrucks, numAdjustedRoutes
+
+class DropLast:
+	'''Recourse policy that sends each store left off an overflowing route out on its own truck
+
+	Parameters
+	----------
+	routes: pd.Series
+		A series of routes and the ordered stores visited by each route (distribution centre first and last)
+	travelTime: pd.DataFrame or TravelMatrix
+		travel time between stores
+	storeIndex: pd.Index
+		The order of the stores in the rows of the simulated demand matrix
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+	traffic: traffic.EdgeTraffic (optional)
+		The traffic model of the legs of the routes, so evaluate can be given its samples
+
+	Notes
+	-----
+	A recourse policy decides what happens to the stores dropped from the end of a route that is over
+	20 pallets. Each policy is built once per routing schedule and its evaluate method simulates a
+	whole batch at once, see simulateBatch. This is the rule used by adjustRoutes.
+
+	With a traffic model, evaluate takes the n x legs traffic factors of each simulation in place of
+	the extra minutes per hour, and every leg is timed with its own factor in the shift of its
+	truck. A store's own truck runs in the shift of the route it was dropped from. Policies that
+	set overflowLegs travel legs between any two stops of a distribution centre, so their traffic
+	model must have been built with overflowLegs too. The shifts are those of the traffic model,
+	by default the alternating assignment of traffic.getRouteShifts.
+	'''
+
+	# if the policy's trucks travel legs that aren't on any route, see traffic.getRouteEdges
+	overflowLegs = False
+
+	def __init__(self, routes, travelTime, storeIndex, tariff = defaultTariff, traffic = None):
+		self.tariff = tariff
+		travelTime = asTravelMatrix(travelTime)
+		self.routeStores, self.closedTime, self.outAndBack = getRouteArrays(routes, travelTime, storeIndex)
+		self.edgeArrays = None if traffic is None else getRouteEdgeArrays(routes, travelTime, traffic.index, traffic.routeShifts)
+
+		# travel times between the stores (in the order of storeIndex) and then the distribution centres
+		depots = list(dict.fromkeys(stores[0] for stores in routes.values))
+		locations = list(storeIndex) + depots
+		self.durations = travelTime.durations[np.ix_(travelTime.indices(locations), travelTime.indices(locations))]
+		self.routeDepots = np.array([len(storeIndex) + depots.index(stores[0]) for stores in routes.values], dtype = np.intp)
+		self.storeDepots = np.full(len(storeIndex), -1, dtype = np.intp)
+		for r, stores in enumerate(self.routeStores):
+			self.storeDepots[stores[stores >= 0]] = self.routeDepots[r]
+
+		# the shift each route and each store's own truck runs in, and the traffic column of every
+		# leg between the locations in each shift, the diagonal takes no time so any column will do
+		self.routeShifts = np.zeros(routes.size, dtype = np.intp)
+		self.storeShifts = np.zeros(len(storeIndex), dtype = np.intp)
+		self.legColumns = None
+		if traffic is not None:
+			if self.overflowLegs and not traffic.overflowLegs:
+				raise ValueError(type(self).__name__ + ' needs traffic sampled with overflowLegs')
+			shifts = list(dict.fromkeys(traffic.routeShifts[routes.index]))
+			self.routeShifts[:] = [shifts.index(traffic.routeShifts[name]) for name in routes.index]
+			for r, stores in enumerate(self.routeStores):
+				self.storeShifts[stores[stores >= 0]] = self.routeShifts[r]
+			self.legColumns = np.zeros((len(shifts), len(locations), len(locations)), dtype = np.intp)
+			position = {location: i for i, location in enumerate(locations)}
+			for (origin, destination, shift), column in traffic.index.items():
+				if origin in position and destination in position and shift in shifts:
+					self.legColumns[shifts.index(shift), position[origin], position[destination]] = column
+
+	def evaluate(self, demands, extraTime):
+		'''Simulates a batch of demands and traffic, returning the cost, trucks and adjusted routes of each simulation'''
+		if np.ndim(extraTime) == 2:
+			closedTime, outAndBack = edgeRouteTimes(*self.edgeArrays, extraTime)
+			return simulateBatch(self.routeStores, closedTime, outAndBack, demands, 0, self.tariff)
+		return simulateBatch(self.routeStores, self.closedTime, self.outAndBack, demands, extraTime, self.tariff)
+
+	def legTime(self, origins, destinations, shifts, extraTime):
+		'''Travel time in seconds of legs in each simulation with their traffic
+
+		Parameters
+		----------
+		origins, destinations: np.array
+			the rows of the stops in the durations, broadcast against each other and the n simulations
+		shifts: np.array
+			the shift of each leg, see routeShifts, only used with a traffic model
+		extraTime: np.array
+			extra time in minutes per hour of each simulation, or the n x legs traffic factors
+		'''
+		if np.ndim(extraTime) == 2:
+			columns = self.legColumns[shifts, origins, destinations]
+			return self.durations[origins, destinations]*extraTime[np.arange(extraTime.shape[0]), columns]
+		return self.durations[origins, destinations]*(1 + extraTime/60)
+
+	def keptRoutes(self, demands, extraTime):
+		'''Simulates the routes cut back to 20 pallets, the part every policy shares
+
+		Returns
+		-------
+		positionDemand, kept, dropped, overflow: np.array
+			See overflowRoutes
+		droppedDemand: np.array
+			stores x n array of the demand of each store dropped from its route, 0 if it was kept
+		load: np.array
+			routes x n array of the demand of the kept stores
+		travel: np.array
+			routes x n array of the travel time in seconds of the kept stores with traffic
+		'''
+		positionDemand, kept, keptDemand, dropped, overflow = overflowRoutes(self.routeStores, demands)
+		droppedDemand = np.zeros((demands.shape[0], demands.shape[1]), dtype = positionDemand.dtype)
+		visited = self.routeStores >= 0
+		droppedDemand[self.routeStores[visited]] = np.where(dropped, positionDemand, 0)[visited]
+		if np.ndim(extraTime) == 2:
+			travel = keptTravel(edgeRouteTimes(*self.edgeArrays, extraTime)[0], kept)
+		else:
+			travel = keptTravel(self.closedTime, kept)*(1 + extraTime/60)
+		return positionDemand, kept, dropped, overflow, droppedDemand, keptDemand, travel
+
+	def ownTrucks(self, demand, stores, extraTime):
+		'''Cost and trucks of sending stores out and back on their own trucks, two if over 20 pallets
+
+		Parameters
+		----------
+		demand: np.array
+			stores x n array of the demand sent, 0 where nothing is sent
+		stores: np.array
+			the row of each store in the durations
+		extraTime: np.array
+			extra time in minutes per hour of each simulation, or the n x legs traffic factors
+		'''
+		depots, shifts = self.storeDepots[stores][:, None], self.storeShifts[stores][:, None]
+		stores = stores[:, None]
+		outAndBack = self.legTime(depots, stores, shifts, extraTime) + self.legTime(stores, depots, shifts, extraTime)
+		doubled = demand > 20
+		time = (outAndBack*(1 + doubled) + demand*600)/3600
+		sent = demand > 0
+		return np.where(sent, self.tariff.cost(time), 0).sum(axis = 0), sent.sum(axis = 0) + doubled.sum(axis = 0)
+
+class Consolidate(DropLast):
+	'''Recourse policy that shares overflow trucks between the stores dropped from routes of the same distribution centre
+
+	Notes
+	-----
+	Stores that need more than 20 pallets by themselves still get their own trucks. The rest are
+	packed next-fit onto overflow trucks in a nearest-neighbour order of the distribution centre's
+	stores, found once when the policy is built, and each overflow truck visits its stores in that
+	order. The packing runs over the stores of the order, each step vectorized over the simulations.
+
+	With a traffic model an overflow truck runs in the shift of the route its first store was dropped
+	from, the schedule doesn't say when the trucks are sent, and each of its legs gets the factor of
+	that leg in that shift.
+	'''
+
+	overflowLegs = True
+
+	def __init__(self, routes, travelTime, storeIndex, tariff = defaultTariff, traffic = None):
+		super().__init__(routes, travelTime, storeIndex, tariff, traffic)
+
+		# nearest-neighbour order of the stores of each distribution centre
+		self.tours = {}
+		for depot in np.unique(self.routeDepots):
+			unvisited = list(np.nonzero(self.storeDepots == depot)[0])
+			tour = []
+			current = depot
+			while len(unvisited) != 0:
+				current = unvisited.pop(int(np.argmin(self.durations[current, unvisited])))
+				tour.append(current)
+			self.tours[depot] = tour
+
+	def evaluate(self, demands, extraTime):
+		positionDemand, kept, dropped, overflow, droppedDemand, load, travel = self.keptRoutes(demands, extraTime)
+		cost = self.tariff.cost((travel + load*600)/3600).sum(axis = 0)
+		numTrucks = np.full(demands.shape[1], self.routeStores.shape[0])
+
+		# stores over 20 pallets go on their own
+		alone = np.where(droppedDemand > 20, droppedDemand, 0)
+		aloneCost, aloneTrucks = self.ownTrucks(alone, np.arange(demands.shape[0]), extraTime)
+		cost += aloneCost
+		numTrucks += aloneTrucks
+		shared = np.where(droppedDemand > 20, 0, droppedDemand)
+
+		for depot, tour in self.tours.items():
+			truckLoad = np.zeros(demands.shape[1], dtype = shared.dtype)
+			truckTravel = np.zeros(demands.shape[1])
+			truckShift = np.zeros(demands.shape[1], dtype = np.intp)
+			last = np.full(demands.shape[1], depot)
+
+			for store in tour:
+				demand = shared[store]
+				# a store that doesn't fit sends the current truck back and starts a new one
+				full = (demand > 0) & (truckLoad + demand > 20)
+				closedTime = (truckTravel + self.legTime(last, depot, truckShift, extraTime) + truckLoad*600)/3600
+				cost += np.where(full, self.tariff.cost(closedTime), 0)
+				numTrucks += full
+				truckLoad = np.where(full, 0, truckLoad)
+				truckTravel = np.where(full, 0, truckTravel)
+				last = np.where(full, depot, last)
+
+				truckShift = np.where((demand > 0) & (truckLoad == 0), self.storeShifts[store], truckShift)
+				truckTravel = np.where(demand > 0, truckTravel + self.legTime(last, store, truckShift, extraTime), truckTravel)
+				last = np.where(demand > 0, store, last)
+				truckLoad = truckLoad + demand
+
+			# send back the last truck
+			closedTime = (truckTravel + self.legTime(last, depot, truckShift, extraTime) + truckLoad*600)/3600
+			cost += np.where(truckLoad > 0, self.tariff.cost(closedTime), 0)
+			numTrucks += truckLoad > 0
+
+		return cost, numTrucks, overflow.sum(axis = 0)
+
+class Rebalance(DropLast):
+	'''Recourse policy that moves stores dropped from a route onto other routes of the same distribution centre with room for them
+
+	Notes
+	-----
+	Each dropped store is added to the end of the route from the same distribution centre with enough
+	spare pallets that it adds the least travel time to, or gets its own truck if no route has room.
+	The dropped stores are placed in route order, each step vectorized over the simulations.
+
+	With a traffic model the detour is timed with the factors of its legs in the shift of the route
+	the store is added to.
+	'''
+
+	overflowLegs = True
+
+	def evaluate(self, demands, extraTime):
+		positionDemand, kept, dropped, overflow, droppedDemand, load, travel = self.keptRoutes(demands, extraTime)
+		nRoutes, maxStores, n = positionDemand.shape
+		simulations = np.arange(n)
+
+		# last stop of each route, its distribution centre if it kept no stores
+		lastPosition = np.maximum(kept - 1, 0)
+		last = np.where(kept > 0, self.routeStores[np.arange(nRoutes)[:, None], lastPosition], self.routeDepots[:, None])
+		depots = self.routeDepots[:, None]
+		shifts = self.routeShifts[:, None]
+
+		leftOut = np.zeros_like(droppedDemand)
+		for r in range(nRoutes):
+			candidates = self.routeDepots == self.routeDepots[r]
+			candidates[r] = False
+			for p in np.nonzero(self.routeStores[r] >= 0)[0]:
+				moved = dropped[r, p]
+				if not moved.any():
+					continue
+				store = self.routeStores[r, p]
+				demand = positionDemand[r, p]
+
+				# extra travel of adding the store to the end of each route that has room
+				detour = self.legTime(last, store, shifts, extraTime) + self.legTime(store, depots, shifts, extraTime) - self.legTime(last, depots, shifts, extraTime)
+				detour = np.where(candidates[:, None] & (load + demand <= 20), detour, np.inf)
+				best = np.argmin(detour, axis = 0)
+				placed = moved & np.isfinite(detour[best, simulations])
+
+				rows, columns = best[placed], simulations[placed]
+				travel[rows, columns] += detour[rows, columns]
+				load[rows, columns] += demand[placed]
+				last[rows, columns] = store
+				leftOut[store] = np.where(moved & ~placed, demand, 0)
+
+		cost = self.tariff.cost((travel + load*600)/3600).sum(axis = 0)
+		leftOutCost, leftOutTrucks = self.ownTrucks(leftOut, np.arange(demands.shape[0]), extraTime)
+		return cost + leftOutCost, nRoutes + leftOutTrucks, overflow.sum(axis = 0)
+
+# recourse policies by name
+recoursePolicies = {'dropLast': DropLast, 'consolidate': Consolidate, 'rebalance': Rebalance}
+
+def getRecoursePolicy(recourse, routes, travelTime, storeIndex, tariff = defaultTariff, traffic = None):
+	'''Builds a recourse policy for a routing schedule
+
+	Parameters
+	----------
+	recourse: str or class
+		The name of a policy in recoursePolicies or a policy class
+	routes, travelTime, storeIndex, tariff, traffic:
+		See DropLast
+	'''
+	if isinstance(recourse, str):
+		recourse = recoursePolicies[recourse]
+	if traffic is None:
+		return recourse(routes, travelTime, storeIndex, tariff)
+	return recourse(routes, travelTime, storeIndex, tariff, traffic)
+
 def plotSimulatedCosts(costDataFrame, colour,name):
 	'''Plots the distribution of the simulated costs
 
@@ -524,7 +1043,130 @@ def plotNumAdjustedRoutes(numAdjustedRoutes,colour,name):
 
 	return None
 
-def runSimulation(optimalRoutes,nSimulation, storeSeries, weekday, travelTimes, colour,name):
+# recourse policies and stores of each simulation worker process, set once by initSimulationWorker
+simulationWorkerState = {}
+
+def initSimulationWorker(policies, storeSeries, weekday, filepath, stream, batchSize, traffic = None):
+	'''Sets up a simulation worker process with the policies of every schedule, so each chunk only needs its schedule, position and seed'''
+	simulationWorkerState.update(policies = policies, storeSeries = storeSeries, weekday = weekday, filepath = filepath, stream = stream, batchSize = batchSize, traffic = traffic)
+
+def simulateChunk(chunk):
+	'''Simulates one chunk of simulations in a worker process
+
+	Parameters
+	----------
+	chunk: tuple
+		The position of the schedule's policy in the worker's policies, the first simulation of the
+		chunk, the number of simulations and the np.random.SeedSequence of the chunk
+
+	Returns
+	-------
+	summary: SimulationSummary
+		The running moments, quantile sketches and histograms of the outputs of the recourse policy
+		over the chunk, so only a few kilobytes go back to the parent however large the chunk is
+	'''
+	plan, start, n, seedSequence = chunk
+	state = simulationWorkerState
+	rng = np.random.default_rng(seedSequence)
+
+	summary = SimulationSummary()
+	for first in range(0, n, state['batchSize']):
+		size = min(state['batchSize'], n - first)
+		with stage('draw demands', simulations = size):
+			demands = getSimulatedDemands(state['storeSeries'], state['filepath'], size, state['weekday'], state['stream'], start + first, rng).to_numpy()
+		with stage('draw traffic', simulations = size):
+			if state['traffic'] is None:
+				extraTime = getSimulatedTime(size, state['weekday'], state['stream'], start + first, rng)
+			else:
+				extraTime = state['traffic'].samples[start + first:start + first + size]
+		with stage('evaluate', simulations = size):
+			summary.update(*state['policies'][plan].evaluate(demands, extraTime))
+
+	return summary
+
+def simulateChunks(policies, nSimulation, storeSeries, weekday, filepath, seed = 0, workers = None, chunks = 64, batchSize = 50000, stream = None, traffic = None):
+	'''Simulates routing schedules in chunks spread over one pool of worker processes, see simulateParallel
+
+	Parameters
+	----------
+	policies: list
+		The recourse policy of each routing schedule, every one simulated with the same chunks
+
+	Returns
+	-------
+	chunkSummaries: list
+		A list for each schedule of the SimulationSummary of each chunk, in chunk order
+
+	Notes
+	-----
+	Every (schedule, chunk) pair is a task of the same executor, so the schedules share the workers
+	rather than each waiting for the one before to finish its chunks.
+	'''
+	chunks = max(1, min(chunks, nSimulation))
+	sizes = [nSimulation//chunks + (i < nSimulation % chunks) for i in range(chunks)]
+	starts = np.cumsum([0] + sizes[:-1])
+	chunkArgs = list(zip(starts.tolist(), sizes, np.random.SeedSequence(seed).spawn(chunks)))
+	tasks = [(plan,) + chunk for plan in range(len(policies)) for chunk in chunkArgs]
+	initArgs = (policies, storeSeries, weekday, filepath, stream, batchSize, traffic)
+
+	with stage('simulate chunks', simulations = nSimulation, schedules = len(policies), chunks = chunks, workers = workers):
+		if workers == 1:
+			initSimulationWorker(*initArgs)
+			results = [simulateChunk(task) for task in tasks]
+		else:
+			with ProcessPoolExecutor(workers, initializer = initSimulationWorker, initargs = initArgs) as executor:
+				results = list(executor.map(simulateChunk, tasks))
+
+	return [results[plan*chunks:(plan + 1)*chunks] for plan in range(len(policies))]
+
+def simulateParallel(policy, nSimulation, storeSeries, weekday, filepath, seed = 0, workers = None, chunks = 64, batchSize = 50000, stream = None, traffic = None):
+	'''Simulates a routing schedule in chunks spread over worker processes
+
+	Parameters
+	----------
+	policy: DropLast
+		The recourse policy of the routing schedule, see getRecoursePolicy
+	nSimulation: int
+		The number of simulations to run
+	storeSeries: pd.Series
+		A series of the stores in the routing schedule
+	weekday: bool
+		If simulation is for weekend or weekday
+	filepath: str
+		The csv file of the demand history
+	seed: int (optional)
+		The master seed the generator of every chunk is spawned from
+	workers: int (optional)
+		The number of worker processes, 1 runs the chunks in this process
+	chunks: int (optional)
+		The number of pieces the simulations are split into
+	batchSize: int (optional)
+		The most simulations a worker evaluates at once
+	stream: CommonRandomNumbers (optional)
+		Shared random numbers to draw from instead of the spawned generators
+	traffic: traffic.EdgeTraffic (optional)
+		The sampled traffic of each leg, read by each chunk from the rows of its simulations in place
+		of drawing the traffic, the policy must have been built with it
+
+	Returns
+	-------
+	summary: SimulationSummary
+		The running moments, quantile sketches and histograms of the costs, trucks and adjusted
+		routes of every simulation
+
+	Notes
+	-----
+	Each chunk gets its own generator spawned from np.random.SeedSequence(seed) and is reduced to a
+	SimulationSummary in its worker, so memory does not grow with nSimulation. The summaries are
+	merged in chunk order, so the results depend on the seed and chunks but not on the number of
+	workers, and are the same on every run.
+	'''
+	summary = SimulationSummary()
+	for chunkSummary in simulateChunks([policy], nSimulation, storeSeries, weekday, filepath, seed, workers, chunks, batchSize, stream, traffic)[0]:
+		summary.merge(chunkSummary)
+	return summary
+
+def runSimulation(optimalRoutes,nSimulation, storeSeries, weekday, travelTimes, colour,name, batchSize = 50000, stream = None, seed = None, workers = None, chunks = 64, recourse = 'dropLast', tariff = defaultTariff, traffic = None, rng = None):
 	'''Runs Simulation for routing schedule
 
 	Parameters
@@ -539,43 +1181,339 @@ def runSimulation(optimalRoutes,nSimulation, storeSeries, weekday, travelTimes,
 		A series of the stores in the routing schedule
 	weekday: bool
 		If simulation is for weekend or weekday
-	travelTimes: pd.DataFrame
-		A dataframe that contains the travel time between all the stores in the routing scheule
+	travelTimes: pd.DataFrame or TravelMatrix
+		The travel time between all the stores in the routing scheule
 	colour: int
 		The colour of the generated histogram
 	name: str
 		The name of the file that the figure is saved to
+	batchSize: int (optional)
+		The number of simulations evaluated at once by simulateBatch, bounds the memory used
+	stream: CommonRandomNumbers (optional)
+		Shared random numbers, so routing schedules simulated with the same stream see the same
+		demands and traffic and can be compared with pairedComparison
+	seed: int (optional)
+		Runs the simulations with simulateParallel, with generators spawned from this seed instead
+		of the global np.random state, so the results are the same on every run
+	workers: int (optional)
+		The number of worker processes for simulateParallel, defaults to the number of cores
+	chunks: int (optional)
+		The number of pieces simulateParallel splits the simulations into
+	recourse: str or class (optional)
+		The recourse policy for routes over 20 pallets, see recoursePolicies
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+	traffic: traffic.EdgeTraffic (optional)
+		Traffic sampled for each leg of optimalRoutes for at least nSimulation simulations, used
+		instead of one extra time per hour for the whole schedule. It isn't drawn from stream
+	rng: np.random.Generator (optional)
+		The generator the demands and traffic are drawn from instead of the global np.random state,
+		when there is no stream, seed or workers
 
+	Returns
+	-------
+	cost: pd.Series or SimulationSummary
+		The cost of each simulation, or with seed or workers the summary of the simulations that
+		simulateParallel merges from its chunks
 	'''
-	
-	# Get simulated demands for each route
-	simulatedDemand = getSimulatedDemands(storeSeries,'Data' + os.sep + 'demandDataUpdated.csv', nSimulation, weekday)
-	simulatedRouteDemand = simulateDemand(optimalRoutes,simulatedDemand)
+	if traffic is not None and traffic.nSimulations < nSimulation:
+		raise ValueError('Traffic was only sampled for ' + str(traffic.nSimulations) + ' of the ' + str(nSimulation) + ' simulations')
 
-	#Adjust routes so each route does not exceed 20 pallets
-	adjustedRouteStores,adjustedRouteDemands,leftOutStores,numAdjustedRoutes = adjustRoutes(storeSeries,optimalRoutes,simulatedRouteDemand, simulatedDemand)
+	if seed is not None or workers is not None:
+		with stage('recourse policy', routes = len(optimalRoutes)):
+			policy = getRecoursePolicy(recourse, optimalRoutes, travelTimes, storeSeries.index, tariff, traffic)
+		summary = simulateParallel(policy, nSimulation, storeSeries, weekday, 'Data' + os.sep + 'demandDataUpdated.csv', seed or 0, workers, chunks, batchSize, stream, traffic)
+		with stage('plot simulation'):
+			plotSimulationSummary(summary, colour, name)
+		return summary
 
-	# Calculate Time of each route
-	extraTime=getSimulatedTime(nSimulation, weekday)
-	adjustedRoutesTime,leftOutStoresTime, numTrucks=calculateTime(adjustedRouteStores,leftOutStores,extraTime,travelTimes,adjustedRouteDemands)
 	
-	# For Anton: numTrucks will have same structure as cost with total number of trucks used for each simulation instead of total cost
-	# you can find the number of EXTRA trucks by just do extraTrucks = numTrucks - len(adjustedRouteStores.index)
-
-	# Calculate Cost of routing schedule
-	cost = calculateCost(adjustedRoutesTime,leftOutStoresTime)
+	# Get simulated demands for each store
+	with stage('draw demands', simulations = nSimulation, stores = len(storeSeries)):
+		simulatedDemand = getSimulatedDemands(storeSeries,'Data' + os.sep + 'demandDataUpdated.csv', nSimulation, weekday, stream, rng = rng)
+	with stage('draw traffic', simulations = nSimulation):
+		extraTime=getSimulatedTime(nSimulation, weekday, stream, rng = rng) if traffic is None else traffic.samples
+
+	# Build the recourse policy once so each batch is a few array operations
+	with stage('recourse policy', routes = len(optimalRoutes)):
+		policy = getRecoursePolicy(recourse, optimalRoutes, travelTimes, simulatedDemand.index, tariff, traffic)
+	demands = simulatedDemand.to_numpy()
+
+	cost = np.zeros(nSimulation)
+	numTrucks = np.zeros(nSimulation, dtype = int)
+	numAdjustedRoutes = np.zeros(nSimulation, dtype = int)
+
+	# Adjust routes so each route does not exceed 20 pallets, then time and cost them
+	for start in range(0, nSimulation, batchSize):
+		batch = slice(start, start + batchSize)
+		with stage('evaluate', simulations = min(batchSize, nSimulation - start)):
+			cost[batch], numTrucks[batch], numAdjustedRoutes[batch] = policy.evaluate(demands[:, batch], extraTime[batch])
+
+	# numTrucks is the total number of trucks used for each simulation
+	# you can find the number of EXTRA trucks by just do extraTrucks = numTrucks - optimalRoutes.size
+	return plotSimulation(cost, numTrucks, numAdjustedRoutes, colour, name)
+
+def plotSimulation(cost, numTrucks, numAdjustedRoutes, colour, name):
+	'''Plots the trucks, costs and adjusted routes of the simulations and returns the costs as a series'''
+	cost = pd.Series(cost)
+	numTrucks = pd.Series(numTrucks)
+	numAdjustedRoutes = pd.Series(numAdjustedRoutes)
 	
-	# Plot Number of trucks
-	plotTrucks(numTrucks,colour,name)
+	with stage('plot simulation'):
+		# Plot Number of trucks
+		plotTrucks(numTrucks,colour,name)
 
-	# Plot distribution of costs
-	plotSimulatedCosts(cost, colour,name)
+		# Plot distribution of costs
+		plotSimulatedCosts(cost, colour,name)
 
-	# Plot Number of routes that exceeded 20 pallets
-	plotNumAdjustedRoutes(numAdjustedRoutes, colour,name)
+		# Plot Number of routes that exceeded 20 pallets
+		plotNumAdjustedRoutes(numAdjustedRoutes, colour,name)
 
 	return cost
 
+def plotSimulationSummary(summary, colour, name):
+	'''Plots the histograms of a streamed simulation, like plotTrucks, plotSimulatedCosts and plotNumAdjustedRoutes
+
+	Parameters
+	----------
+	summary: SimulationSummary
+		The summary of the simulations
+	colour: int
+		The colour of the plots
+	name: string
+		Name of the graphs
+	'''
+	colours  = sns.color_palette(palette='muted',n_colors=4)
+	sns.set_style("darkgrid")
+	plots = [(summary.truckHistogram, 'Number of Trucks', 'Distribution of the Number of Truck Shifts Required', 'Trucks'),
+		(summary.costHistogram, 'Cost of Routing Schedule [$]', 'Distribution of Simulated Cost for Routing Schedule', 'Cost'),
+		(summary.adjustedRouteHistogram, 'Number of Routes Adjusted', 'Distribution of the Number of Routes Adjusted', 'AdjustedRoutes')]
+
+	for histogram, xlabel, title, suffix in plots:
+		plt.stairs(histogram.counts, histogram.edges, fill = True, color = colours[colour])
+		plt.xlabel(xlabel, fontsize=14)
+		plt.ylabel("Frequency",fontsize=14)
+		plt.title(title, fontsize=18)
+
+		if suffix == 'Cost':
+			lower, upper = summary.costQuantiles.quantile([0.025, 0.975])
+			plt.axvline(lower, color = 'black')
+			plt.axvline(upper, color = 'black')
+			print(lower)
+			print(upper)
+
+		plt.savefig('SimulationPlots' + os.sep + name + suffix)
+		plt.clf()
+
+	return None
+
+def runSimulationStreaming(optimalRoutes, maxSimulations, storeSeries, weekday, travelTimes, colour, name, batchSize = 50000, targetHalfWidth = None, level = 0.95, minSimulations = 1000, stream = None, recourse = 'dropLast', tariff = defaultTariff, rng = None, traffic = None):
+	'''Runs the simulation for a routing schedule in batches, keeping only a constant-memory summary
+
+	Parameters
+	--------
+	optimalRoutes: pd.Series
+		A series that contains the selected routes and an order store list
+	maxSimulations: int
+		The most simulations to run
+	storeSeries: pd.Series
+		A series of the stores in the routing schedule
+	weekday: bool
+		If simulation is for weekend or weekday
+	travelTimes: pd.DataFrame or TravelMatrix
+		The travel time between all the stores in the routing scheule
+	colour: int
+		The colour of the generated histograms, None to skip plotting
+	name: str
+		The name of the file that the figures are saved to
+	batchSize: int (optional)
+		The number of simulations drawn and evaluated at once
+	targetHalfWidth: float (optional)
+		Stop once the confidence interval on the mean cost is narrower than this many dollars either side
+	level: float (optional)
+		The confidence level of the interval
+	minSimulations: int (optional)
+		The fewest simulations run before stopping early
+	stream: CommonRandomNumbers (optional)
+		Shared random numbers, see runSimulation
+	recourse: str or class (optional)
+		The recourse policy for routes over 20 pallets, see recoursePolicies
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+	rng: np.random.Generator (optional)
+		The generator to draw from instead of the global np.random state, when there is no stream
+	traffic: traffic.EdgeTraffic (optional)
+		Traffic sampled for each leg of optimalRoutes for at least maxSimulations simulations, see
+		runSimulation. Each batch reads the rows of its simulations
+
+	Returns
+	-------
+	summary: SimulationSummary
+		The running mean and variance, quantile sketches and histograms of the costs, trucks and adjusted routes
+
+	Notes
+	-----
+	Unlike runSimulation the demands and traffic are drawn one batch at a time and the per-simulation
+	results are discarded once summarised, so memory does not grow with maxSimulations.
+	'''
+	if traffic is not None and traffic.nSimulations < maxSimulations:
+		raise ValueError('Traffic was only sampled for ' + str(traffic.nSimulations) + ' of the ' + str(maxSimulations) + ' simulations')
+
+	summary = SimulationSummary()
+	with stage('recourse policy', routes = len(optimalRoutes)):
+		policy = getRecoursePolicy(recourse, optimalRoutes, travelTimes, storeSeries.index, tariff, traffic)
+
+	for start in range(0, maxSimulations, batchSize):
+		n = min(batchSize, maxSimulations - start)
+		with stage('draw demands', simulations = n):
+			demands = getSimulatedDemands(storeSeries,'Data' + os.sep + 'demandDataUpdated.csv', n, weekday, stream, start, rng).to_numpy()
+		with stage('draw traffic', simulations = n):
+			if traffic is None:
+				extraTime = getSimulatedTime(n, weekday, stream, start, rng)
+			else:
+				extraTime = traffic.samples[start:start + n]
+		with stage('evaluate', simulations = n):
+			summary.update(*policy.evaluate(demands, extraTime))
+
+		# stop once the mean cost is known well enough
+		if targetHalfWidth is not None and summary.count >= minSimulations and summary.cost.halfWidth(level) <= targetHalfWidth:
+			break
+
+	if colour is not None:
+		with stage('plot simulation'):
+			plotSimulationSummary(summary, colour, name)
+
+	return summary
+
+def compareRecoursePolicies(optimalRoutes, nSimulation, storeSeries, weekday, travelTimes, policies = ('dropLast', 'consolidate', 'rebalance'), seed = 0, batchSize = 50000, tariff = defaultTariff):
+	'''Simulates a routing schedule under each recourse policy with the same demands and traffic
+
+	Parameters
+	--------
+	optimalRoutes: pd.Series
+		A series that contains the selected routes and an order store list
+	nSimulation: int
+		The number of simulations to run
+	storeSeries: pd.Series
+		A series of the stores in the routing schedule
+	weekday: bool
+		If simulation is for weekend or weekday
+	travelTimes: pd.DataFrame or TravelMatrix
+		The travel time between all the stores in the routing scheule
+	policies: list (optional)
+		The recourse policies to compare, names in recoursePolicies or policy classes
+	seed: int (optional)
+		The seed of the common random numbers
+	batchSize: int (optional)
+		The number of simulations evaluated at once
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+
+	Returns
+	-------
+	comparison: pd.DataFrame
+		The mean, 2.5% and 97.5% quantile cost, mean trucks and the mean saving on the first policy
+		(with the half-width of its 95% confidence interval) of each policy
+	'''
+	stream = CommonRandomNumbers(seed)
+	built = [getRecoursePolicy(policy, optimalRoutes, travelTimes, storeSeries.index, tariff) for policy in policies]
+	names = [policy if isinstance(policy, str) else policy.__name__ for policy in policies]
+	summaries = [SimulationSummary() for policy in policies]
+	savings = [RunningMoments() for policy in policies]
+
+	for start in range(0, nSimulation, batchSize):
+		n = min(batchSize, nSimulation - start)
+		demands = getSimulatedDemands(storeSeries,'Data' + os.sep + 'demandDataUpdated.csv', n, weekday, stream, start).to_numpy()
+		extraTime = getSimulatedTime(n, weekday, stream, start)
+		results = [policy.evaluate(demands, extraTime) for policy in built]
+		for result, summary, saving in zip(results, summaries, savings):
+			summary.update(*result)
+			saving.update(results[0][0] - result[0])
+
+	return pd.DataFrame({
+		'Mean Cost': [summary.cost.mean for summary in summaries],
+		'2.5% Cost': [summary.costQuantiles.quantile(0.025) for summary in summaries],
+		'97.5% Cost': [summary.costQuantiles.quantile(0.975) for summary in summaries],
+		'Mean Trucks': [summary.trucks.mean for summary in summaries],
+		'Mean Saving': [saving.mean for saving in savings],
+		'Saving Half-Width': [saving.halfWidth() if saving.count > 1 else 0 for saving in savings],
+	}, index = names)
+
+def rankPlans(plans, nSimulation, storeSeries, weekday, travelTimes, objectives = None, quantile = None, seed = 0, workers = None, chunks = 64, batchSize = 50000, recourse = 'dropLast', tariff = defaultTariff):
+	'''Simulates several routing schedules with the same demands and traffic and ranks them
+
+	Parameters
+	----------
+	plans: list
+		The selected routes of each schedule, as from solutionPool or getOptimalRouteNamesandStores
+	nSimulation: int
+		The number of simulations of each schedule
+	storeSeries: pd.Series
+		A series of the stores in the routing schedules
+	weekday: bool
+		If simulation is for weekend or weekday
+	travelTimes: pd.DataFrame or TravelMatrix
+		The travel time between all the stores in the routing schedules
+	objectives: list (optional)
+		The planned cost of each schedule, shown in the table
+	quantile: float (optional)
+		Ranks by this quantile of the cost, such as 0.95, instead of the mean cost
+	seed: int (optional)
+		The master seed of simulateParallel, the same for every schedule
+	workers, chunks, batchSize: (optional)
+		See simulateParallel
+	recourse: str or class (optional)
+		The recourse policy for routes over 20 pallets, see recoursePolicies
+	tariff: Tariff (optional)
+		The rates trucks are paid at
+
+	Returns
+	-------
+	best: int
+		The position in plans of the schedule with the least mean (or quantile) cost
+	ranking: pd.DataFrame
+		A row per schedule, best first, with its planned cost, mean and quantile costs, mean trucks
+		and the mean extra cost over the best schedule with the half-width of its 95% confidence interval
+
+	Notes
+	-----
+	Every schedule visits the same stores, so with the same seed and chunks simulateParallel draws
+	the same demands and traffic for each of them. The differences between schedules then only come
+	from the schedules. Each chunk only sends back its SimulationSummary, so the extra cost is paired
+	by chunk: its interval is from the differences in the mean cost of each chunk (batch means),
+	which needs a few chunks to be meaningful. The quantiles are from the quantile sketches. The
+	chunks of every schedule are tasks of one pool of worker processes, see simulateChunks.
+	'''
+	policies = [getRecoursePolicy(recourse, plan, travelTimes, storeSeries.index, tariff) for plan in plans]
+	summaries = simulateChunks(policies, nSimulation, storeSeries, weekday, 'Data' + os.sep + 'demandDataUpdated.csv', seed, workers, chunks, batchSize)
+
+	totals = [SimulationSummary() for plan in plans]
+	for total, chunkSummaries in zip(totals, summaries):
+		for chunkSummary in chunkSummaries:
+			total.merge(chunkSummary)
+
+	scores = [total.costQuantiles.quantile(quantile) if quantile is not None else total.cost.mean for total in totals]
+	best = int(np.argmin(scores))
+	extra = [RunningMoments() for plan in plans]
+	for chunkSummaries, moments in zip(summaries, extra):
+		moments.update([chunk.cost.mean - bestChunk.cost.mean for chunk, bestChunk in zip(chunkSummaries, summaries[best])])
+
+	ranking = pd.DataFrame({
+		'Planned Cost': objectives if objectives is not None else [np.nan]*len(plans),
+		'Routes': [len(plan) for plan in plans],
+		'Mean Cost': [total.cost.mean for total in totals],
+		'2.5% Cost': [total.costQuantiles.quantile(0.025) for total in totals],
+		'97.5% Cost': [total.costQuantiles.quantile(0.975) for total in totals],
+		'Mean Trucks': [total.trucks.mean for total in totals],
+		'Extra Cost': [total.cost.mean - totals[best].cost.mean for total in totals],
+		'Extra Cost Half-Width': [moments.halfWidth() if moments.count > 1 else 0 for moments in extra],
+	})
+	if quantile is not None:
+		ranking.insert(5, str(round(quantile*100, 1)) + '% Cost', scores)
+	ranking['Rank'] = ranking.index.map(dict(zip(np.argsort(scores, kind = 'stable'), range(1, len(plans) + 1))))
+	ranking.index.name = 'Plan'
+	return best, ranking.sort_values('Rank')
+
 def twoSample_t_test(cost1,cost2):
 	'''Runs a two sample t-test on the cost arrays
 
@@ -595,3 +1533,40 @@ def twoSample_t_test(cost1,cost2):
 
 	return None
 
+def pairedComparison(cost1, cost2, antithetic = False, level = 0.95):
+	'''Compares the costs of two routing schedules simulated with the same random numbers
+
+	Parameters
+	---------
+	cost1: pd.Series
+		A series of costs
+	cost2: pd.Series
+		A series of costs from the same simulations (the same CommonRandomNumbers stream)
+	antithetic: bool (optional)
+		If the stream was antithetic, so only the average of each pair of simulations is independent
+	level: float (optional)
+		The confidence level
+
+	Returns
+	-------
+	difference: float
+		The mean of cost1 - cost2
+	interval: tuple
+		The confidence interval on the mean difference
+
+	Notes
+	-----
+	With common random numbers the costs of the two schedules are positively correlated, so the
+	t-test on the paired differences is much tighter than twoSample_t_test for the same number of
+	simulations.
+	'''
+	differences = cost1.to_numpy() - cost2.to_numpy()
+	if antithetic:
+		differences = differences[:differences.size//2*2].reshape(-1, 2).mean(axis = 1)
+
+	paired = sms.DescrStatsW(differences)
+	print(paired.ttest_mean())
+	interval = paired.tconfint_mean(alpha = 1 - level)
+	print(interval)
+
+	return paired.mean, interval
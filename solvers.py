@@ -0,0 +1,112 @@
+# Solver backends for the route selection problem, with their limits and solve statistics
+import warnings
+from pulp import *
+from time import perf_counter
+from instrumentation import stage, annotate
+
+def cbcSolver(mip = True, msg = False, threads = None, timeLimit = None, gapRel = None, warmStart = False):
+    '''The CBC solver bundled with PuLP'''
+    return PULP_CBC_CMD(mip = mip, msg = msg, threads = threads, timeLimit = timeLimit, gapRel = gapRel, warmStart = warmStart)
+
+def highsSolver(mip = True, msg = False, threads = None, timeLimit = None, gapRel = None, warmStart = False):
+    '''HiGHS through highspy, which is given the model in memory. PuLP's HiGHS interface never reads a starting solution, so warmStart is ignored'''
+    options = {} if threads is None else {'threads': threads}
+    return HiGHS(mip = mip, msg = msg, timeLimit = timeLimit, gapRel = gapRel, **options)
+
+# the solver of each backend name, see solveModel
+solverBackends = {
+    'cbc': cbcSolver,
+    'highs': highsSolver,
+}
+
+# the backends that start from an incumbent
+warmStartBackends = {'cbc'}
+
+def setIncumbent(prob, incumbent):
+    '''Sets the starting solution of a problem to the routes of an incumbent
+
+    Parameters
+    ----------
+    prob: puLP problem object
+        The problem, with a "Choose_" variable for each route
+    incumbent: list or dict
+        The names of the routes chosen, or the value of each route
+    '''
+    if not isinstance(incumbent, dict):
+        incumbent = dict.fromkeys(incumbent, 1)
+    for variable in prob.variables():
+        variable.setInitialValue(incumbent.get(variable.name[7:], 0))
+
+def solveModel(prob, backend = 'cbc', threads = None, timeLimit = None, gapRel = None, incumbent = None, export = None, msg = False):
+    '''Solves a problem with a solver backend
+
+    Parameters
+    ----------
+    prob: puLP problem object
+        The problem
+    backend: str (optional)
+        The name of the solver in solverBackends, "highs" needs highspy installed
+    threads: int (optional)
+        The number of threads the solver may use, defaults to the solver's own default
+    timeLimit: float (optional)
+        The most seconds the solver may run, the best solution found so far is kept
+    gapRel: float (optional)
+        The relative gap between the solution and the bound at which the solver stops
+    incumbent: list or dict (optional)
+        A starting solution, see setIncumbent. Only the backends in warmStartBackends use it, the
+        others warn and solve from scratch
+    export: str (optional)
+        Writes the problem to this file before solving, as an MPS file if it ends in .mps and an
+        LP file otherwise
+    msg: bool (optional)
+        If the solver log is printed
+
+    Returns
+    -------
+    stats: dict
+        The backend, status, solution status, objective, wall and solver times, size of the
+        problem and the limits it was solved with
+
+    Notes
+    -----
+    The problem is only written to a file when export is given. HiGHS is handed the model in
+    memory, while PuLP still hands CBC the model through a temporary MPS file. The warmStart of
+    the statistics is only true if the solver was actually given the incumbent.
+    '''
+    if backend not in solverBackends:
+        raise ValueError('Unknown solver backend ' + str(backend) + ', expected one of ' + ', '.join(solverBackends))
+
+    if export is not None:
+        with stage('write LP', file = export):
+            if export.lower().endswith('.mps'):
+                prob.writeMPS(export)
+            else:
+                prob.writeLP(export)
+
+    warmStart = incumbent is not None and backend in warmStartBackends
+    if warmStart:
+        setIncumbent(prob, incumbent)
+    elif incumbent is not None:
+        warnings.warn('The ' + backend + ' backend does not use a starting solution, the incumbent is ignored')
+
+    solver = solverBackends[backend](msg = msg, threads = threads, timeLimit = timeLimit, gapRel = gapRel, warmStart = warmStart)
+    with stage('solve', backend = backend):
+        start = perf_counter()
+        prob.solve(solver)
+        seconds = perf_counter() - start
+        annotate(status = LpStatus[prob.status])
+
+    return {
+        'backend': backend,
+        'status': LpStatus[prob.status],
+        'solution': LpSolution[prob.sol_status],
+        'objective': value(prob.objective),
+        'seconds': seconds,
+        'solverSeconds': prob.solutionTime,
+        'variables': prob.numVariables(),
+        'constraints': prob.numConstraints(),
+        'threads': threads,
+        'timeLimit': timeLimit,
+        'gapRel': gapRel,
+        'warmStart': warmStart,
+    }
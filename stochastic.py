@@ -0,0 +1,156 @@
+# Plans routing schedules against simulated demand and traffic instead of one demand estimate
+import os
+import numpy as np
+import pandas as pd
+from simulation import getSimulatedDemands, getSimulatedTime, getRouteArrays, routeBatchCosts
+from formulation import presolveRoutes, solve_LP
+from Routes import asTravelMatrix
+from tariff import defaultTariff
+from instrumentation import stage
+
+def sampleScenarios(storeSeries, weekday, nScenarios, seed = 1, filepath = 'Data' + os.sep + 'demandDataUpdated.csv'):
+    '''Draws the demand and traffic scenarios a routing schedule is planned against
+
+    Parameters
+    ----------
+    storeSeries: pd.Series
+        A series of the stores to plan for
+    weekday: bool
+        If weekday or Saturday demand and traffic are drawn
+    nScenarios: int
+        The number of scenarios
+    seed: int (optional)
+        Seed of the scenarios, keep it apart from the seed the plan is simulated with so the plan
+        is not judged on the scenarios it was fitted to
+    filepath: str (optional)
+        The csv file of the demand history
+
+    Returns
+    -------
+    demands: np.array
+        stores x nScenarios array of store demands, in the order of storeSeries
+    extraTime: np.array
+        The extra minutes per hour of trip of each scenario
+    '''
+    rng = np.random.default_rng(seed)
+    demands = getSimulatedDemands(storeSeries, filepath, nScenarios, weekday, rng = rng).to_numpy()
+    extraTime = getSimulatedTime(nScenarios, weekday, rng = rng)
+    return demands, extraTime
+
+def expectedRouteCosts(routeStores, costs, storeSeries, travelTimes, demands, extraTime, batchSize = 250, tariff = defaultTariff):
+    '''Gets the average cost of every route over the scenarios, including the recourse for going over 20 pallets
+
+    Parameters
+    ----------
+    routeStores: pd.Series
+        A series of the ordered list of locations visited by each route, as from FindStoreSets
+    costs: pd.Series
+        The costs of the routes, routes with a "b" in their name are leased trucks
+    storeSeries: pd.Series
+        A series of the stores, in the order of the rows of demands
+    travelTimes: pd.DataFrame or TravelMatrix
+        Travel times between the stores and distribution centres
+    demands: np.array
+        stores x nScenarios array of store demands, see sampleScenarios
+    extraTime: np.array
+        The extra minutes per hour of trip of each scenario
+    batchSize: int (optional)
+        The number of scenarios evaluated at once, bounds the memory used
+    tariff: Tariff (optional)
+        The rates trucks are paid at
+
+    Returns
+    -------
+    expectedCosts: pd.Series
+        The average cost of each route over the scenarios
+
+    Notes
+    -----
+    Under the drop last recourse of simulateBatch the cost of a routing schedule in a scenario is
+    the sum of the costs of its routes, each of which only depends on the demand of its own stores.
+    So the expected cost of a schedule is the sum of the expected costs of its routes, and
+    planning against the scenarios is the same set partitioning problem with these costs. Every
+    route is evaluated against a batch of scenarios at once with routeBatchCosts. A leased truck
+    route costs its flat rate plus the expected cost of the stores it drops, as those still go
+    out on their own trucks.
+    '''
+    travelTimes = asTravelMatrix(travelTimes)
+    own = [route for route in costs.index if 'b' not in route]
+    routeArrays = getRouteArrays(routeStores[own], travelTimes, storeSeries.index)
+
+    nScenarios = demands.shape[1]
+    routeCost = np.zeros(len(own))
+    leftOutCost = np.zeros(len(own))
+    for start in range(0, nScenarios, batchSize):
+        batch = slice(start, start + batchSize)
+        batchRouteCost, batchLeftOutCost, leftOutTrucks, overflow = routeBatchCosts(*routeArrays, demands[:, batch], extraTime[batch], tariff)
+        routeCost += batchRouteCost.sum(axis = 1)
+        leftOutCost += batchLeftOutCost.sum(axis = 1)
+
+    routeCost = pd.Series(routeCost/nScenarios, index = own)
+    leftOutCost = pd.Series(leftOutCost/nScenarios, index = own)
+
+    expectedCosts = costs.astype(float)
+    expectedCosts[own] = routeCost + leftOutCost
+    for route in costs.index.difference(own):
+        # the twin of a leased route is its name without the "b"
+        twin = route[:-1] if route.endswith('b') else None
+        if twin in leftOutCost.index:
+            expectedCosts[route] = costs[route] + leftOutCost[twin]
+    return expectedCosts
+
+def solve_SAA(routesDataFrame, routesCost, routeStores, problem, storeSeries, weekday, travelTimes, nScenarios = 500, seed = 1, batchSize = 250, tariff = defaultTariff, presolve = True, **solverOptions):
+    '''Chooses the routes with the least expected cost over simulated scenarios (sample average approximation)
+
+    Parameters
+    ----------
+    routesDataFrame, routesCost, routeStores:
+        The candidate routes, as from FindStoreSets
+    problem: str
+        Name of the problem
+    storeSeries: pd.Series
+        A series of the stores to visit
+    weekday: bool
+        If the plan is for weekdays or Saturdays
+    travelTimes: pd.DataFrame or TravelMatrix
+        Travel times between the stores and distribution centres
+    nScenarios: int (optional)
+        The number of demand and traffic scenarios planned against
+    seed: int (optional)
+        Seed of the scenarios, see sampleScenarios
+    batchSize: int (optional)
+        The number of scenarios evaluated at once, see expectedRouteCosts
+    tariff: Tariff (optional)
+        The rates trucks are paid at
+    presolve: bool (optional)
+        If duplicate and dominated routes are dropped first, with their expected costs
+    **solverOptions:
+        The export, backend, threads, timeLimit, gapRel, incumbent and msg of solve_LP
+
+    Returns
+    -------
+    prob: puLP problem object
+        The solved problem, its objective is the average cost of the plan over the scenarios
+    expectedCosts: pd.Series
+        The expected cost of every route
+
+    Notes
+    -----
+    Unlike solve_LP with the demand estimates, routes that often go over 20 pallets are charged
+    for the extra trucks they need, so the plan trades a little planned cost for less overflow.
+    The scenarios are batched through every route rather than adding a copy of the problem per
+    scenario, so the problem is no larger than the deterministic one however many scenarios are
+    used. Under the other recourse policies the routes share overflow trucks, so the plan is only
+    exact for drop last, but it can still be simulated with any of them.
+    '''
+    with stage('scenarios', simulations = nScenarios):
+        demands, extraTime = sampleScenarios(storeSeries, weekday, nScenarios, seed)
+    with stage('expected costs', routes = len(routesCost), simulations = nScenarios):
+        expectedCosts = expectedRouteCosts(routeStores, routesCost, storeSeries, travelTimes, demands, extraTime, batchSize, tariff)
+
+    if presolve:
+        kept, report = presolveRoutes(routeStores, expectedCosts, list(storeSeries.index))
+        routesDataFrame, expectedCosts = routesDataFrame[kept], expectedCosts[kept]
+
+    prob = solve_LP(routesDataFrame, expectedCosts, problem, **solverOptions)
+    return prob, expectedCosts
@@ -0,0 +1,44 @@
+# The cost of running trucks, shared by the route costing of the LP and the simulation
+import numpy as np
+
+class Tariff:
+    '''The rates trucks are paid at
+
+    Parameters
+    ----------
+    hourlyRate: float (optional)
+        The cost per hour of a truck up to overtimeAfter hours
+    overtimeRate: float (optional)
+        The cost per hour of a truck after overtimeAfter hours
+    overtimeAfter: float (optional)
+        The hours after which a truck is paid overtime
+    leasedCost: float (optional)
+        The flat cost of a leased truck (the "b" routes)
+
+    Notes
+    -----
+    cost works on numbers or arrays of any shape, so costing every route of every simulation is one
+    array expression. A Tariff can be read from the "tariff" of a scenario config with Tariff(**config).
+    '''
+
+    def __init__(self, hourlyRate = 175, overtimeRate = 250, overtimeAfter = 4, leasedCost = 1500):
+        self.hourlyRate = hourlyRate
+        self.overtimeRate = overtimeRate
+        self.overtimeAfter = overtimeAfter
+        self.leasedCost = leasedCost
+
+    def __repr__(self):
+        return 'Tariff(hourlyRate = {}, overtimeRate = {}, overtimeAfter = {}, leasedCost = {})'.format(self.hourlyRate, self.overtimeRate, self.overtimeAfter, self.leasedCost)
+
+    def cost(self, hours):
+        '''Returns the cost of trucks running for the given hours, a number or an array of any shape'''
+        hours = np.asarray(hours)
+        cost = np.where(hours >= self.overtimeAfter, (hours - self.overtimeAfter)*self.overtimeRate + self.overtimeAfter*self.hourlyRate, hours*self.hourlyRate)
+        return cost if cost.ndim else cost.item()
+
+    def routeCost(self, seconds):
+        '''Returns the cost of routes that take the given number of seconds'''
+        return self.cost(np.asarray(seconds)/3600)
+
+# the rates used unless a tariff is given
+defaultTariff = Tariff()
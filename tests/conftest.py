@@ -0,0 +1,7 @@
+# Lets the tests import the modules at the root of the repository and read its Data folder
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
@@ -0,0 +1,39 @@
+# Checks the column generation routes against the randomly drawn route pool
+import pytest
+from pulp import value
+from Routes import FindStoreSets, RouteLength, RoutePool
+from formulation import buildModel, mergeRoutePools, solve_columnGeneration
+from scenarios import loadInputs, getRouteSources
+from solvers import solveModel
+from tariff import defaultTariff
+
+@pytest.fixture(scope = 'module')
+def routeSources():
+    inputs = loadInputs('Data')
+    return getRouteSources({'day': 'Mon-Fri', 'centres': ['Distribution South']}, inputs)
+
+def test_columnGenerationBoundIsNoWorseThanRandomPool(routeSources, tmp_path):
+    routeSources, stores = routeSources
+    distributionCenter, demand, travelTimes, routeName = routeSources[0]
+    problem = str(tmp_path / 'problem')
+    prob, routesDataFrame, routesCost, routeStores = solve_columnGeneration(routeSources, problem, solverOptions = {'msg': False}, integer = False)
+    columnGeneration = value(prob.objective)
+
+    # the drawn routes within the limits column generation prices against (drawStoreSets checks
+    # the time before adding the last store's pallets), and the single store routes it starts from
+    pool = RoutePool()
+    for store in demand.index:
+        route = [distributionCenter, store, distributionCenter]
+        pool.add(route, defaultTariff.routeCost(RouteLength(route, travelTimes, demand.at[store, 'Pallet Demand'])))
+    routesDataFrame, routesCost, routeStores = FindStoreSets(*routeSources[0])
+    for name, route in routeStores.items():
+        time = RouteLength(route, travelTimes, demand.loc[route[1:-1], 'Pallet Demand'].sum())
+        if time <= 14400:
+            pool.add(route, defaultTariff.routeCost(time))
+    routesDataFrame, routesCost, routeStores = mergeRoutePools([pool], routeSources)
+    prob = buildModel(routeStores, routesCost, problem, stores.index, relax = True)
+    solveModel(prob)
+    randomPool = value(prob.objective)
+
+    assert prob.status == 1
+    assert columnGeneration <= randomPool + 1e-6
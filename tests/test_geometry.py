@@ -0,0 +1,68 @@
+# Checks the route geometry cache and rate limit against a stand-in openrouteservice server
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from geometry import OpenRouteServiceBackend, RouteGeometryProvider
+
+@pytest.fixture
+def server():
+    '''A local directions server that answers with the stops of the route and records its calls'''
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            calls.append(body['coordinates'])
+            response = json.dumps({'features': [{'geometry': {'coordinates': body['coordinates']}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, *args):
+            pass
+
+    httpServer = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target = httpServer.serve_forever, daemon = True)
+    thread.start()
+    yield 'http://127.0.0.1:' + str(httpServer.server_port), calls
+    httpServer.shutdown()
+    httpServer.server_close()
+
+class TimedBackend(OpenRouteServiceBackend):
+    '''Records when each call leaves, as the server sees them arrive with the network's jitter'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.starts = []
+
+    def directions(self, coords):
+        self.starts.append(time.monotonic())
+        return super().directions(coords)
+
+def test_geometriesAreFetchedOnceAndSpacedOut(server, tmp_path):
+    url, calls = server
+    routes = [[[174.7 + i/100, -36.9], [174.8, -36.9 - i/100], [174.7 + i/100, -36.9]] for i in range(5)]
+    routeCoords = routes + routes[:2]
+
+    def getProvider():
+        return RouteGeometryProvider(TimedBackend(base_url = url), cacheFolder = str(tmp_path), workers = 4, requestsPerMinute = 600)
+
+    # repeated routes are only asked for once, no closer together than the rate limit
+    provider = getProvider()
+    geometries = provider.getGeometries(routeCoords)
+    assert geometries == routeCoords
+    assert provider.backendCalls == len(calls) == 5
+    assert sorted(calls) == sorted(routes)
+    # with a little room for threads waking up late from their sleep
+    starts = sorted(provider.backend.starts)
+    assert min(later - earlier for earlier, later in zip(starts[:-1], starts[1:])) >= 0.1 - 0.02
+    assert starts[-1] - starts[0] >= 0.4 - 0.02
+
+    # a second run is served from the cache on disk
+    provider = getProvider()
+    assert provider.getGeometries(routeCoords) == routeCoords
+    assert provider.backendCalls == 0 and len(calls) == 5
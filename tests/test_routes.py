@@ -0,0 +1,105 @@
+# Checks the route order cache and the route enumerator against brute force, that parallel route
+# draws don't depend on the number of workers and that the shared route pool is drawn once
+import itertools
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from dataset import loadDataset
+from Routes import EnumerateStoreSets, FindStoreSetsParallel, SharedRoutePool, bestRouteOrder
+from scenarios import buildRoutePool, getRouteSources, loadInputs
+from tariff import defaultTariff
+
+@pytest.fixture(scope = 'module')
+def data():
+    data = loadDataset('Data')
+    North, South = data.storeSets()
+    weekday, saturday = data.demandFrames(pd.concat([North, South]))
+    return data, {'Distribution North': North, 'Distribution South': South}, weekday
+
+def bruteForceOrder(travelMatrix, distributionCenter, stores):
+    '''The quickest order and travel time of a store set, trying every permutation'''
+    routes = [[distributionCenter] + list(order) + [distributionCenter] for order in itertools.permutations(stores)]
+    times = [travelMatrix.routeDuration(route) for route in routes]
+    return routes[int(np.argmin(times))], min(times)
+
+def test_bestRouteOrderMatchesPermutations(data):
+    travelMatrix = data[0].travelMatrix
+    rng = np.random.default_rng(0)
+    for i in range(300):
+        distributionCenter, stores = list(data[1].items())[i % 2]
+        storeSet = list(rng.choice(stores.index, rng.integers(1, 6), replace = False))
+        route, travelTime = bestRouteOrder(distributionCenter, storeSet, travelMatrix)
+
+        assert route[0] == route[-1] == distributionCenter
+        assert sorted(route[1:-1]) == sorted(storeSet)
+        assert travelTime == pytest.approx(travelMatrix.routeDuration(route))
+        assert travelTime == pytest.approx(bruteForceOrder(travelMatrix, distributionCenter, storeSet)[1])
+
+@pytest.mark.parametrize('distributionCenter', ['Distribution North', 'Distribution South'])
+def test_EnumerateStoreSetsFindsEveryFeasibleSet(data, distributionCenter):
+    dataset, storeSets, weekday = data
+    demand = weekday.loc[storeSets[distributionCenter].index]
+    demand = demand[demand['Pallet Demand'] > 0]
+    travelMatrix = dataset.travelMatrix.subset(list(demand.index) + [distributionCenter])
+
+    routesDataFrame, routesCost, routesStores = EnumerateStoreSets(distributionCenter, demand, travelMatrix, 'route', maxStores = 5)
+    own = [route for route in routesCost.index if 'b' not in route]
+    found = {frozenset(routesStores[route][1:-1]): routesCost[route] for route in own}
+
+    # every set of at most 5 stores that fits on a truck and can be visited in 4 hours, and every store on its own
+    expected = {}
+    pallets = demand['Pallet Demand'].to_dict()
+    for k in range(1, 6):
+        for storeSet in itertools.combinations(demand.index, k):
+            totalPallets = sum(pallets[store] for store in storeSet)
+            if totalPallets > 20:
+                continue
+            time = bruteForceOrder(travelMatrix, distributionCenter, storeSet)[1] + totalPallets*600
+            if time <= 14400 or k == 1:
+                expected[frozenset(storeSet)] = defaultTariff.routeCost(time)
+
+    assert found.keys() == expected.keys()
+    for storeSet, cost in expected.items():
+        assert found[storeSet] == pytest.approx(cost)
+
+def test_FindStoreSetsParallelIsTheSameForAnyWorkers(data):
+    dataset, storeSets, weekday = data
+    demand = weekday.loc[storeSets['Distribution North'].index]
+    demand = demand[demand['Pallet Demand'] > 0]
+    travelMatrix = dataset.travelMatrix.subset(list(demand.index) + ['Distribution North'])
+
+    pools = [FindStoreSetsParallel('Distribution North', demand, travelMatrix, 'route', n = 400, seed = 7, workers = workers, chunks = 16) for workers in (1, 4)]
+
+    pd.testing.assert_frame_equal(pools[0][0], pools[1][0])
+    pd.testing.assert_series_equal(pools[0][1], pools[1][1])
+    assert pools[0][2].to_dict() == pools[1][2].to_dict()
+
+def test_SharedRoutePoolIsDrawnOncePerDistributionCentre(monkeypatch):
+    inputs = loadInputs('Data')
+    with open('scenarios.json') as file:
+        scenarios = json.load(file)['scenarios']
+
+    calls = []
+    generate = SharedRoutePool.generate
+    def countedGenerate(self, distributionCenter, *args, **kwargs):
+        calls.append(distributionCenter)
+        return generate(self, distributionCenter, *args, **kwargs)
+    monkeypatch.setattr(SharedRoutePool, 'generate', countedGenerate)
+
+    routePool = buildRoutePool(scenarios, inputs, n = 2000)
+    assert sorted(calls) == ['Distribution North', 'Distribution South']
+
+    # every scenario, weekday and Saturday, takes its routes from the same draws
+    for scenario in scenarios:
+        for distributionCenter, demand, travelTimes, routeName in getRouteSources(scenario, inputs)[0]:
+            routesDataFrame, routesCost, routesStores = routePool.forDemand(distributionCenter, demand, routeName)
+            pallets = demand['Pallet Demand'].to_dict()
+            own = [route for route in routesCost.index if 'b' not in route]
+            assert {route[1] for route in routesStores[own] if len(route) == 3} == set(demand.index)
+            for route in routesStores[own]:
+                assert set(route[1:-1]) <= set(demand.index)
+                if len(route) > 3:
+                    assert sum(pallets[store] for store in route[1:-1]) <= 20
+                    assert travelTimes.routeDuration(route) + sum(pallets[store] for store in route[1:-1])*600 <= 14400
+    assert len(calls) == 2
@@ -0,0 +1,223 @@
+# Checks the batched simulation engine and recourse policies against per-simulation versions of them
+import numpy as np
+import pandas as pd
+import pytest
+from dataset import loadDataset
+from simulation import (getSimulatedDemands, getSimulatedTime, simulateDemand, adjustRoutes, calculateTime,
+                        calculateCost, getRouteArrays, simulateBatch, recoursePolicies, getRecoursePolicy, simulateParallel, rankPlans)
+from tariff import defaultTariff
+from traffic import EdgeTraffic
+
+def getSchedule(size):
+    '''Routes of size stores in the order of each distribution centre's stores, so they often go over 20 pallets'''
+    data = loadDataset('Data')
+    North, South = data.storeSets()
+    routes = {}
+    for depot, stores in (('Distribution North', North), ('Distribution South', South)):
+        for i in range(0, len(stores), size):
+            routes[depot[13:] + str(i)] = [depot] + list(stores.index[i:i + size]) + [depot]
+    return pd.Series(routes), pd.concat([North, South]), data.travelMatrix
+
+@pytest.mark.parametrize('weekday, size', [(True, 4), (False, 8)])
+def test_simulateBatchMatchesPerSimulationChain(weekday, size):
+    routes, stores, travelMatrix = getSchedule(size)
+    n = 200
+    rng = np.random.default_rng(7)
+    simulatedDemand = getSimulatedDemands(stores, 'Data/demandDataUpdated.csv', n, weekday, rng = rng)
+    extraTime = getSimulatedTime(n, weekday, rng = rng)
+
+    routeDemands = simulateDemand(routes, simulatedDemand)
+    adjustedRoutes, adjustedDemands, leftOutStores, numAdjustedRoutes = adjustRoutes(None, routes, routeDemands, simulatedDemand)
+    routesTime, leftOutTime, numTrucks = calculateTime(adjustedRoutes, leftOutStores, extraTime, travelMatrix, adjustedDemands)
+    cost = calculateCost(routesTime, leftOutTime)
+
+    batchCost, batchTrucks, batchAdjusted = simulateBatch(*getRouteArrays(routes, travelMatrix, simulatedDemand.index), simulatedDemand.to_numpy(), extraTime)
+
+    assert numAdjustedRoutes.sum() > 0
+    np.testing.assert_allclose(batchCost, cost.to_numpy(dtype = float), rtol = 0, atol = 1e-8)
+    np.testing.assert_array_equal(batchTrucks, numTrucks.to_numpy(dtype = int))
+    np.testing.assert_array_equal(batchAdjusted, numAdjustedRoutes.to_numpy())
+
+@pytest.mark.parametrize('recourse', list(recoursePolicies))
+def test_constantEdgeTrafficMatchesScalarTraffic(recourse):
+    routes, stores, travelMatrix = getSchedule(4)
+    n = 200
+    rng = np.random.default_rng(11)
+    demands = getSimulatedDemands(stores, 'Data/demandDataUpdated.csv', n, True, rng = rng).to_numpy()
+    extraTime = getSimulatedTime(n, True, rng = rng)
+
+    # every leg slowed down by the same factor as the scalar model
+    traffic = EdgeTraffic(travelMatrix, routes, True, overflowLegs = True)
+    factors = np.repeat((1 + extraTime/60).astype(np.float32)[:, None], len(traffic), axis = 1)
+    extraTime = (factors[:, 0].astype(float) - 1)*60
+
+    scalar = getRecoursePolicy(recourse, routes, travelMatrix, stores.index).evaluate(demands, extraTime)
+    edges = getRecoursePolicy(recourse, routes, travelMatrix, stores.index, traffic = traffic).evaluate(demands, factors)
+
+    np.testing.assert_allclose(edges[0], scalar[0], rtol = 0, atol = 1e-8)
+    np.testing.assert_array_equal(edges[1], scalar[1])
+    np.testing.assert_array_equal(edges[2], scalar[2])
+
+def test_simulateParallelMergesChunkSummaries():
+    routes, stores, travelMatrix = getSchedule(4)
+    n, chunks, batchSize = 300, 6, 25
+    policy = getRecoursePolicy('dropLast', routes, travelMatrix, stores.index)
+
+    # the chunks drawn and evaluated here in full, batch by batch the way each worker draws them
+    results = []
+    for start, seedSequence in zip(range(0, n, n//chunks), np.random.SeedSequence(5).spawn(chunks)):
+        rng = np.random.default_rng(seedSequence)
+        for first in range(start, start + n//chunks, batchSize):
+            demands = getSimulatedDemands(stores, 'Data/demandDataUpdated.csv', batchSize, True, None, first, rng).to_numpy()
+            results.append(policy.evaluate(demands, getSimulatedTime(batchSize, True, None, first, rng)))
+    cost, numTrucks, numAdjustedRoutes = (np.concatenate(result) for result in zip(*results))
+
+    summaries = [simulateParallel(policy, n, stores, True, 'Data/demandDataUpdated.csv', 5, workers, chunks, batchSize) for workers in (1, 2)]
+    for summary in summaries:
+        assert summary.count == n
+        assert summary.cost.mean == pytest.approx(cost.mean())
+        assert summary.cost.std == pytest.approx(cost.std(ddof = 1))
+        assert summary.trucks.mean == pytest.approx(numTrucks.mean())
+        assert summary.truckHistogram.counts.sum() == summary.adjustedRouteHistogram.counts.sum() == n
+        assert summary.adjustedRouteHistogram.counts[-1] == (numAdjustedRoutes == numAdjustedRoutes.max()).sum()
+    np.testing.assert_array_equal(summaries[0].costHistogram.counts, summaries[1].costHistogram.counts)
+    assert summaries[0].cost.mean == summaries[1].cost.mean
+
+def keptRoute(stores, demand):
+    '''The stores a route keeps and drops, one simulation at a time'''
+    load = 0
+    for p, store in enumerate(stores):
+        if load + demand[store] > 20:
+            return stores[:p], stores[p:]
+        load += demand[store]
+    return stores, []
+
+def truckCost(travelMatrix, stops, load, factor, shift):
+    '''Cost of a truck visiting stops in shift, distribution centre first and last, factor gives the traffic of each leg'''
+    travel = sum(travelMatrix.duration(origin, destination)*factor(origin, destination, shift) for origin, destination in zip(stops[:-1], stops[1:]))
+    return defaultTariff.cost((travel + load*600)/3600)
+
+def ownTruck(travelMatrix, depot, store, demand, factor, shift):
+    '''Cost and trucks of sending a store out and back on its own, two trucks if over 20 pallets'''
+    trips = 2 if demand > 20 else 1
+    travel = travelMatrix.duration(depot, store)*factor(depot, store, shift) + travelMatrix.duration(store, depot)*factor(store, depot, shift)
+    return defaultTariff.cost((travel*trips + demand*600)/3600), trips
+
+def consolidateOne(routes, shifts, travelMatrix, stores, demand, factor):
+    '''Consolidate for one simulation: dropped stores packed next-fit onto trucks in a nearest-neighbour tour'''
+    cost, trucks, dropped = 0, len(routes), {}
+    for route, shift in zip(routes, shifts):
+        kept, left = keptRoute(route[1:-1], demand)
+        cost += truckCost(travelMatrix, [route[0]] + kept + [route[0]], sum(demand[store] for store in kept), factor, shift)
+        for store in left:
+            dropped[store] = route[0], shift
+
+    for depot in dict.fromkeys(route[0] for route in routes):
+        # nearest-neighbour order of all the distribution centre's stores
+        unvisited = [store for store in stores if any(store in route[1:-1] for route in routes if route[0] == depot)]
+        tour, current = [], depot
+        while unvisited:
+            current = min(unvisited, key = lambda store: travelMatrix.duration(current, store))
+            unvisited.remove(current)
+            tour.append(current)
+
+        stops, load, truckShift = [depot], 0, None
+        for store in tour:
+            if store not in dropped or dropped[store][0] != depot or demand[store] == 0:
+                continue
+            storeShift = dropped[store][1]
+            if demand[store] > 20:
+                storeCost, storeTrucks = ownTruck(travelMatrix, depot, store, demand[store], factor, storeShift)
+                cost, trucks = cost + storeCost, trucks + storeTrucks
+                continue
+            if load + demand[store] > 20:
+                cost, trucks = cost + truckCost(travelMatrix, stops + [depot], load, factor, truckShift), trucks + 1
+                stops, load = [depot], 0
+            # a truck runs in the shift of the route of its first store
+            if load == 0:
+                truckShift = storeShift
+            stops.append(store)
+            load += demand[store]
+        if load > 0:
+            cost, trucks = cost + truckCost(travelMatrix, stops + [depot], load, factor, truckShift), trucks + 1
+    return cost, trucks
+
+def rebalanceOne(routes, shifts, travelMatrix, stores, demand, factor):
+    '''Rebalance for one simulation: dropped stores added to the end of the route of their centre with room that they add the least time to'''
+    kept = [keptRoute(route[1:-1], demand) for route in routes]
+    stops = [[route[0]] + storesKept for route, (storesKept, left) in zip(routes, kept)]
+    loads = [sum(demand[store] for store in storesKept) for storesKept, left in kept]
+
+    def legTime(origin, destination, shift):
+        return travelMatrix.duration(origin, destination)*factor(origin, destination, shift)
+
+    cost, trucks = 0, len(routes)
+    for r, (route, (storesKept, left)) in enumerate(zip(routes, kept)):
+        depot = route[0]
+        for store in left:
+            detours = [(legTime(stops[c][-1], store, shifts[c]) + legTime(store, depot, shifts[c]) - legTime(stops[c][-1], depot, shifts[c]), c)
+                       for c in range(len(routes)) if c != r and routes[c][0] == depot and loads[c] + demand[store] <= 20]
+            if detours:
+                # the first route of the least detour, as argmin picks
+                c = min(detours, key = lambda detour: detour[0])[1]
+                stops[c].append(store)
+                loads[c] += demand[store]
+            elif demand[store] > 0:
+                storeCost, storeTrucks = ownTruck(travelMatrix, depot, store, demand[store], factor, shifts[r])
+                cost, trucks = cost + storeCost, trucks + storeTrucks
+
+    for route, shift, stop, load in zip(routes, shifts, stops, loads):
+        cost += truckCost(travelMatrix, stop + [route[0]], load, factor, shift)
+    return cost, trucks
+
+@pytest.mark.parametrize('recourse, reference', [('consolidate', consolidateOne), ('rebalance', rebalanceOne)])
+@pytest.mark.parametrize('weekday, size', [(True, 4), (False, 8)])
+def test_recoursePolicyMatchesPerSimulationReference(recourse, reference, weekday, size):
+    routes, stores, travelMatrix = getSchedule(size)
+    n = 100
+    rng = np.random.default_rng(13)
+    simulatedDemand = getSimulatedDemands(stores, 'Data/demandDataUpdated.csv', n, weekday, rng = rng)
+    extraTime = getSimulatedTime(n, weekday, rng = rng)
+
+    cost, numTrucks, numAdjustedRoutes = getRecoursePolicy(recourse, routes, travelMatrix, simulatedDemand.index).evaluate(simulatedDemand.to_numpy(), extraTime)
+
+    expected = [reference(list(routes.values), [None]*routes.size, travelMatrix, list(simulatedDemand.index), simulatedDemand.iloc[:, i].to_dict(), lambda origin, destination, shift, i = i: 1 + extraTime[i]/60)
+                for i in range(n)]
+    assert numAdjustedRoutes.sum() > 0
+    np.testing.assert_allclose(cost, [expectedCost for expectedCost, expectedTrucks in expected], rtol = 0, atol = 1e-6)
+    np.testing.assert_array_equal(numTrucks, [expectedTrucks for expectedCost, expectedTrucks in expected])
+
+@pytest.mark.parametrize('recourse, reference', [('consolidate', consolidateOne), ('rebalance', rebalanceOne)])
+def test_recoursePolicyTimesOverflowLegsWithTheirOwnTraffic(recourse, reference):
+    routes, stores, travelMatrix = getSchedule(4)
+    n = 50
+    rng = np.random.default_rng(17)
+    simulatedDemand = getSimulatedDemands(stores, 'Data/demandDataUpdated.csv', n, True, rng = rng)
+    traffic = EdgeTraffic(travelMatrix, routes, True, overflowLegs = True)
+    factors = traffic.sample(n, seed = 5)
+
+    with pytest.raises(ValueError):
+        getRecoursePolicy(recourse, routes, travelMatrix, simulatedDemand.index, traffic = EdgeTraffic(travelMatrix, routes, True))
+    cost, numTrucks, numAdjustedRoutes = getRecoursePolicy(recourse, routes, travelMatrix, simulatedDemand.index, traffic = traffic).evaluate(simulatedDemand.to_numpy(), factors)
+
+    expected = [reference(list(routes.values), list(traffic.routeShifts), travelMatrix, list(simulatedDemand.index), simulatedDemand.iloc[:, i].to_dict(),
+                          lambda origin, destination, shift, i = i: float(factors[i, traffic.index[(origin, destination, shift)]]) if origin != destination else 1)
+                for i in range(n)]
+    traffic.close()
+    assert numAdjustedRoutes.sum() > 0
+    np.testing.assert_allclose(cost, [expectedCost for expectedCost, expectedTrucks in expected], rtol = 0, atol = 1e-6)
+    np.testing.assert_array_equal(numTrucks, [expectedTrucks for expectedCost, expectedTrucks in expected])
+
+def test_rankPlansSharesWorkersAcrossSchedules():
+    plans = [getSchedule(size)[0] for size in (4, 5, 3)]
+    routes, stores, travelMatrix = getSchedule(4)
+
+    rankings = [rankPlans(plans, 400, stores, True, travelMatrix, seed = 3, workers = workers, chunks = 8) for workers in (1, 2)]
+    assert rankings[0][0] == rankings[1][0]
+    pd.testing.assert_frame_equal(rankings[0][1], rankings[1][1])
+
+    # each schedule sees the chunks it would on its own
+    for plan, (position, row) in zip(plans, rankings[0][1].sort_index().iterrows()):
+        summary = simulateParallel(getRecoursePolicy('dropLast', plan, travelMatrix, stores.index), 400, stores, True, 'Data/demandDataUpdated.csv', 3, 1, 8)
+        assert row['Mean Cost'] == pytest.approx(summary.cost.mean)
+        assert row['Mean Trucks'] == pytest.approx(summary.trucks.mean)
@@ -0,0 +1,251 @@
+# Samples traffic on every leg of a routing schedule by shift, correlated between nearby legs
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+import pandas as pd
+from Routes import asTravelMatrix
+from dataset import readCached, parseLocations
+from simulation import getSimulatedTime
+
+# how much of the day's traffic each shift sees, weekday mornings carry the commute and
+# Saturday afternoons the shoppers
+shiftProfiles = {
+    True: {'morning': 1.2, 'afternoon': 0.8},
+    False: {'morning': 0.8, 'afternoon': 1.2},
+}
+
+def getRouteShifts(routes):
+    '''Assigns each route of a routing schedule to a shift
+
+    Parameters
+    ----------
+    routes: pd.Series
+        A series of routes and the ordered stores visited by each route
+
+    Returns
+    -------
+    routeShifts: pd.Series
+        The shift of each route, "morning" or "afternoon"
+
+    Notes
+    -----
+    The routing schedule doesn't say which shift each route runs in, so this is an assumption:
+    every truck works a morning and an afternoon shift, and the routes are handed out to them in
+    turn in the order of the schedule, so half of them run in each shift. Give EdgeTraffic the
+    routeShifts of the real rota to use it instead.
+    '''
+    return pd.Series(['morning' if r % 2 == 0 else 'afternoon' for r in range(routes.size)], index = routes.index)
+
+def getRouteEdges(routes, routeShifts, overflowLegs = False):
+    '''Lists the legs a routing schedule can travel, in each route's shift
+
+    Parameters
+    ----------
+    routes: pd.Series
+        A series of routes and the ordered stores visited by each route (distribution centre first and last)
+    routeShifts: pd.Series
+        The shift of each route, see getRouteShifts
+    overflowLegs: bool (optional)
+        If the legs between every two stops of each distribution centre are listed too, in every
+        shift of its routes, as the shared trucks of simulation.Consolidate and simulation.Rebalance
+        can travel them
+
+    Returns
+    -------
+    edges: list
+        The (from, to, shift) of every leg between consecutive stops of the routes, and of the legs
+        out to and back from each store on its own, as trucks dropped from a route travel them
+    '''
+    edges = {}
+    for name, stores in routes.items():
+        depot, shift = stores[0], routeShifts[name]
+        for origin, destination in zip(stores[:-1], stores[1:]):
+            edges[(origin, destination, shift)] = None
+        for store in stores[1:-1]:
+            edges[(depot, store, shift)] = None
+            edges[(store, depot, shift)] = None
+
+    if overflowLegs:
+        stops = {}
+        for name, stores in routes.items():
+            depotStops, shifts = stops.setdefault(stores[0], ({stores[0]: None}, {}))
+            depotStops.update(dict.fromkeys(stores[1:-1]))
+            shifts[routeShifts[name]] = None
+        for depotStops, shifts in stops.values():
+            for shift in shifts:
+                for origin in depotStops:
+                    for destination in depotStops:
+                        if origin != destination:
+                            edges[(origin, destination, shift)] = None
+    return list(edges)
+
+class EdgeTraffic:
+    '''Traffic on each leg of a routing schedule, sampled for many simulations into a memory mapped file
+
+    Parameters
+    ----------
+    travelTimes: pd.DataFrame or TravelMatrix
+        Travel times (and distances, if known) between the stores and distribution centres
+    routes: pd.Series
+        A series of routes and the ordered stores visited by each route (distribution centre first and last)
+    weekday: bool
+        If the traffic is for weekdays or Saturdays
+    routeShifts: pd.Series (optional)
+        The shift of each route, by default the routes alternate between the shifts, see getRouteShifts
+    overflowLegs: bool (optional)
+        If every leg between the stops of each distribution centre is sampled too, which the
+        Consolidate and Rebalance recourse policies need, see getRouteEdges
+    locationsFile: str (optional)
+        The csv file of the store coordinates
+    lengthScale: float (optional)
+        The distance in metres over which the congestion of two legs stops being alike
+    correlation: float (optional)
+        The share of the variance of each leg's congestion that it shares with the legs near it
+    spread: float (optional)
+        The standard deviation of the log of each leg's congestion about the day's traffic
+    gridSize: int (optional)
+        The number of points along each side of the grid the spatial field is drawn on
+
+    Notes
+    -----
+    Each simulation draws the extra minutes per hour of the day from getSimulatedTime, the same
+    way as the uniform model. Every leg then gets that times the profile of its route's shift, times
+    its sensitivity, times a lognormal congestion factor with mean 1. The sensitivity is the leg's
+    average speed over the mean speed of the legs, so motorway legs slow down more than suburban
+    ones. The log factors are a Gaussian field: a part drawn at gridSize x gridSize points over the
+    stores with an exponential covariance in lengthScale, interpolated to the midpoint of each leg,
+    plus a part of each leg's own. Sampling only costs legs x grid points per simulation however
+    many legs there are, and only the legs the schedule can travel are sampled. With overflowLegs
+    that is every leg between the stops of a distribution centre, so the samples grow with the
+    square of its number of stores.
+
+    sample writes the factors 1 + extra minutes/60 as a float32 simulations x legs array backed by
+    np.memmap, in batches, so large runs don't have to fit in memory. The columns of a leg are
+    in index, which getRouteEdgeArrays uses to hand them to the recourse policies. Without a file
+    name the samples go in a temporary folder the model owns, which close (or leaving a with
+    block, or the model being garbage collected) deletes. Files given by name are kept.
+    '''
+
+    def __init__(self, travelTimes, routes, weekday, routeShifts = None, overflowLegs = False, locationsFile = 'Data' + os.sep + 'WarehouseLocationsUpdated.csv',
+                 lengthScale = 5000, correlation = 0.6, spread = 0.35, gridSize = 8):
+        travelTimes = asTravelMatrix(travelTimes)
+        self.weekday = weekday
+        self.routeShifts = getRouteShifts(routes) if routeShifts is None else routeShifts
+        self.overflowLegs = overflowLegs
+        self.edges = getRouteEdges(routes, self.routeShifts, overflowLegs)
+        self.index = {edge: column for column, edge in enumerate(self.edges)}
+        self.correlation = correlation
+        self.spread = spread
+
+        # coordinates in metres, close enough to flat over a city
+        locations = readCached(locationsFile, parseLocations)
+        latitude = np.radians(locations['Lat'])
+        x = 6371000*np.radians(locations['Long'])*np.cos(latitude.mean())
+        y = 6371000*latitude
+        coordinates = dict(zip(locations['Store'], np.column_stack((x, y))))
+
+        origins = np.array([coordinates[origin] for origin, destination, shift in self.edges])
+        destinations = np.array([coordinates[destination] for origin, destination, shift in self.edges])
+        durations = np.array([travelTimes.duration(origin, destination) for origin, destination, shift in self.edges])
+        if travelTimes.distances is None:
+            distances = np.linalg.norm(destinations - origins, axis = 1)
+        else:
+            distances = np.array([travelTimes.distances[travelTimes.index[origin], travelTimes.index[destination]] for origin, destination, shift in self.edges])
+
+        # faster legs are busier roads, which lose more of their speed to traffic
+        speed = distances/np.maximum(durations, 1)
+        sensitivity = np.clip(speed/speed.mean(), 0.5, 2)
+        sensitivity /= sensitivity.mean()
+        profile = np.array([shiftProfiles[weekday][shift] for origin, destination, shift in self.edges])
+        self.scale = profile*sensitivity
+
+        # the spatial field is drawn on a grid over the legs and interpolated to their midpoints
+        midpoints = (origins + destinations)/2
+        low, high = midpoints.min(axis = 0) - lengthScale, midpoints.max(axis = 0) + lengthScale
+        grid = np.stack(np.meshgrid(np.linspace(low[0], high[0], gridSize), np.linspace(low[1], high[1], gridSize)), axis = -1).reshape(-1, 2)
+        covariance = np.exp(-np.linalg.norm(grid[:, None] - grid[None], axis = 2)/lengthScale)
+        self.gridFactor = np.linalg.cholesky(covariance + 1e-9*np.eye(len(grid)))
+        weights = np.exp(-np.linalg.norm(midpoints[:, None] - grid[None], axis = 2)/lengthScale)
+
+        # scaled so the interpolated field has unit variance on every leg
+        weights /= np.sqrt(np.einsum('ij,jk,ik->i', weights, covariance, weights))[:, None]
+        self.weights = weights
+
+        self.filename = None
+        self.nSimulations = 0
+        self.memmap = None
+        self.cleanup = None
+
+    def __getstate__(self):
+        # worker processes open the file again rather than being sent the samples
+        state = self.__dict__.copy()
+        state['memmap'] = None
+        state['cleanup'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        '''Lets go of the samples, deleting them if they are in the model's temporary folder'''
+        self.memmap = None
+        if self.cleanup is not None:
+            self.cleanup()
+            self.cleanup = None
+            self.filename, self.nSimulations = None, 0
+
+    def __len__(self):
+        return len(self.edges)
+
+    @property
+    def samples(self):
+        '''The n x legs float32 array of traffic factors, see sample'''
+        if self.memmap is None:
+            if self.filename is None:
+                raise ValueError('No traffic has been sampled, see EdgeTraffic.sample')
+            self.memmap = np.memmap(self.filename, dtype = np.float32, mode = 'r', shape = (self.nSimulations, len(self.edges)))
+        return self.memmap
+
+    def sample(self, n, filename = None, seed = 0, batchSize = 10000):
+        '''Samples the traffic factor of every leg for n simulations
+
+        Parameters
+        ----------
+        n: int
+            The number of simulations
+        filename: str (optional)
+            The file the samples are written to and kept in, by default a temporary file deleted by close
+        seed: int (optional)
+            Seed of the samples
+        batchSize: int (optional)
+            The number of simulations drawn at once, bounds the memory used
+
+        Returns
+        -------
+        samples: np.memmap
+            n x legs float32 array of the multiplier of the travel time of each leg in each simulation
+        '''
+        self.close()
+        if filename is None:
+            folder = tempfile.mkdtemp(prefix = 'traffic')
+            self.cleanup = weakref.finalize(self, shutil.rmtree, folder, True)
+            filename = os.path.join(folder, 'traffic.dat')
+        samples = np.memmap(filename, dtype = np.float32, mode = 'w+', shape = (n, len(self.edges)))
+        rng = np.random.default_rng(seed)
+
+        for start in range(0, n, batchSize):
+            size = min(batchSize, n - start)
+            level = getSimulatedTime(size, self.weekday, rng = rng)
+            field = (rng.standard_normal((size, self.gridFactor.shape[0])) @ self.gridFactor.T) @ self.weights.T
+            congestion = np.sqrt(self.correlation)*field + np.sqrt(1 - self.correlation)*rng.standard_normal((size, len(self.edges)))
+            extraTime = level[:, None]*self.scale*np.exp(self.spread*congestion - self.spread**2/2)
+            samples[start:start + size] = 1 + extraTime/60
+
+        samples.flush()
+        self.filename, self.nSimulations, self.memmap = filename, n, samples
+        return samples
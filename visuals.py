@@ -2,7 +2,17 @@ import numpy as np
 import pandas as pd
 import folium
 import os
-import openrouteservice as ors
+from geometry import RouteGeometryProvider, OpenRouteServiceBackend, StraightLineBackend
+
+# the provider of every map drawn in this process, so a backend that is down is only tried once
+defaultProvider = None
+
+def getDefaultProvider():
+    '''Returns the openrouteservice provider with straight lines when it can't be reached, made on first use'''
+    global defaultProvider
+    if defaultProvider is None:
+        defaultProvider = RouteGeometryProvider(OpenRouteServiceBackend(key='5b3ce3597851110001cf6248060b6d84cf244f1c9f3cd208e086323b'), fallback = StraightLineBackend())
+    return defaultProvider
 
 
 def displayStores():
@@ -32,22 +42,30 @@ def displayStores():
 
     return None
 
-def plotStoreRoutes(routes, filename, name):
+def plotStoreRoutes(routes, filename, name, provider = None):
     '''Plots routes
     Parameters
     ----------
     routes: list
         A list of lists where each element of the list is a list of stores visited by in a route
-        
+    filename: str
+        Name of the csv file of store locations
+    name: str
+        Name of the map, saved as RouteVisuals/<name>routes.html
+    provider: RouteGeometryProvider (optional)
+        Gets the geometry of each route, defaults to openrouteservice through the on-disk cache with
+        straight lines when it can't be reached, see getDefaultProvider
+
         Notes
         ------
-        Saves the generated map as filename
+        Saves the generated map as filename. Only routes not already in the cache are requested, all
+        at once, so re-rendering an unchanged plan makes no openrouteservice calls.
         '''
     m = folium.Map(location = [-36.998761,174.874272], zoom_start=10)
-    coords = []
     #reading locations into a data frame
     locations = pd.read_csv(filename, index_col='Store')
-    client = ors.Client(key='5b3ce3597851110001cf6248060b6d84cf244f1c9f3cd208e086323b')
+    if provider is None:
+        provider = getDefaultProvider()
     Counter_North = 0 #Initialise counter for North route colors
     Counter_South = 0 #Initialise counter for South route colors
     ColorIndex_North = ['#3BBD9B','#44DBB4','#319C80','#73E5D3','#A1DDE0','#B2E3E6','#537273','#64898B','#79A6A8','#92C9CC',
@@ -55,25 +73,18 @@ def plotStoreRoutes(routes, filename, name):
     ColorIndex_South = ['#E80000','#FF0000','#FF4200','#FF6300','#FF8300','#FFBB00','#FFE300','#DDF300','#BAF700','#98FB00',
     '#75FF00','#4BFF00','#5CFF60','#4FFF8F','#49FFA7','#42FFBE','#3AFFDE','#36FFEE','#31FFFD']
 
-    for Path in routes:
-        for store in Path:
-            store_coords = [locations.at[store,'Long'],locations.at[store,'Lat']]
-            coords.append(store_coords)   
-
-        route = client.directions(
-            coordinates = coords,
-            profile = 'driving-hgv', # driving-hgv.
-            format='geojson',
-            validate = False)
+    routes = list(routes)
+    coords = [[[locations.at[store,'Long'],locations.at[store,'Lat']] for store in Path] for Path in routes]
+    geometries = provider.getGeometries(coords)
 
+    for Path, geometry in zip(routes, geometries):
         # Add route to map with different colors
         if Path[0] == 'Distribution North':
-            folium.PolyLine(locations = [list(reversed(coord)) for coord in route['features'][0]['geometry']['coordinates']], color = ColorIndex_North[Counter_North]).add_to(m) 
+            folium.PolyLine(locations = [list(reversed(coord)) for coord in geometry], color = ColorIndex_North[Counter_North % len(ColorIndex_North)]).add_to(m) 
             Counter_North += 1
         elif Path[0] == 'Distribution South':
-            folium.PolyLine(locations = [list(reversed(coord)) for coord in route['features'][0]['geometry']['coordinates']], color = ColorIndex_South[Counter_South]).add_to(m) 
+            folium.PolyLine(locations = [list(reversed(coord)) for coord in geometry], color = ColorIndex_South[Counter_South % len(ColorIndex_South)]).add_to(m) 
             Counter_South += 1
-        coords = []
 
     m.save('RouteVisuals' + os.sep + name + 'routes.html')
     return None